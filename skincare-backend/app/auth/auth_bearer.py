@@ -1,6 +1,8 @@
-from fastapi import Request, HTTPException, Depends
+from typing import Optional
+from fastapi import Request, HTTPException, Depends, Query, WebSocketException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.auth.auth_handler import decode_token
+from app.auth.user_cache import user_cache
 from app.database.models import UserModel
 from app.database.mongodb import db
 
@@ -13,29 +15,45 @@ class JWTBearer(HTTPBearer):
         if credentials:
             if not credentials.scheme == "Bearer":
                 raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
-            if not self.verify_jwt(credentials.credentials):
+            token_data = decode_token(credentials.credentials)
+            if not token_data:
                 raise HTTPException(status_code=403, detail="Invalid token or expired token.")
+            # Keep the verified claims so get_current_user doesn't decode again
+            request.state.token_data = token_data
             return credentials.credentials
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
-    def verify_jwt(self, jwtoken: str) -> bool:
-        isTokenValid: bool = False
-        try:
-            payload = decode_token(jwtoken)
-            if payload:
-                isTokenValid = True
-        except:
-            isTokenValid = False
-        return isTokenValid
+async def _load_user(username: str) -> Optional[UserModel]:
+    user_model = user_cache.get(username)
+    if user_model:
+        return user_model
+    
+    user = await db.database.users.find_one({"username": username})
+    if not user:
+        return None
+    
+    user_model = UserModel(**user)
+    user_cache.set(username, user_model)
+    return user_model
 
-async def get_current_user(token: str = Depends(JWTBearer())) -> UserModel:
-    token_data = decode_token(token)
+async def get_current_user(request: Request, token: str = Depends(JWTBearer())) -> UserModel:
+    token_data = getattr(request.state, "token_data", None) or decode_token(token)
     if not token_data:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    user = await db.database.users.find_one({"username": token_data.username})
-    if not user:
+    user_model = await _load_user(token_data.username)
+    if not user_model:
         raise HTTPException(status_code=404, detail="User not found")
+    return user_model
+
+async def get_websocket_user(token: Optional[str] = Query(None)) -> UserModel:
+    """Authenticate a WebSocket by its ?token= access token (browsers can't set headers)"""
+    token_data = decode_token(token) if token else None
+    if not token_data:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token or expired token.")
     
-    return UserModel(**user)
\ No newline at end of file
+    user_model = await _load_user(token_data.username)
+    if not user_model:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="User not found")
+    return user_model
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.config import settings
+from app.database.models import UserModel
+from app.services.metrics import register_stats
+
+class UserCache:
+    """Small TTL + LRU cache of UserModel keyed by username"""
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, UserModel]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, username: str) -> Optional[UserModel]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, username: str, user: UserModel):
+        if not self.enabled:
+            return
+        self._entries[username] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# Per-process: other workers may serve a stale profile for up to the TTL
+user_cache = UserCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+register_stats("user_cache", "Authenticated user cache", user_cache.stats, counters=("hits", "misses", "evictions"))
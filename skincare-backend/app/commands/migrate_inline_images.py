@@ -0,0 +1,52 @@
+"""Move inline base64 images out of skin_analyses into the image store.
+
+Usage: python -m app.commands.migrate_inline_images [--dry-run] [--limit N]
+"""
+import argparse
+import asyncio
+from app.database.mongodb import connect_db, close_db, db
+from app.services.image_store import from_data_url, get_image_store, image_url_for
+
+async def migrate_inline_images(dry_run: bool = False, limit: int = 0) -> int:
+    store = get_image_store()
+    cursor = db.database.skin_analyses.find(
+        {"image_url": {"$regex": "^data:"}}, {"image_url": 1}
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    
+    migrated = 0
+    async for analysis in cursor:
+        image_bytes, content_type = from_data_url(analysis["image_url"])
+        if dry_run:
+            migrated += 1
+            continue
+        
+        image_id = await store.put(image_bytes, content_type)
+        # Only rewrite documents that still hold the inline image we read
+        result = await db.database.skin_analyses.update_one(
+            {"_id": analysis["_id"], "image_url": analysis["image_url"]},
+            {"$set": {"image_url": image_url_for(image_id)}}
+        )
+        migrated += result.modified_count
+        if result.modified_count and migrated % 100 == 0:
+            print(f"Migrated {migrated} images")
+    
+    return migrated
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="count documents without changing them")
+    parser.add_argument("--limit", type=int, default=0, help="stop after N documents")
+    args = parser.parse_args()
+    
+    await connect_db()
+    try:
+        migrated = await migrate_inline_images(dry_run=args.dry_run, limit=args.limit)
+        action = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{action} {migrated} inline images")
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
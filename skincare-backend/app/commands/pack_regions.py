@@ -0,0 +1,101 @@
+"""Convert stored region arrays between per-region documents and packed columns.
+
+Run with --to columnar after setting REGION_STORAGE_FORMAT=columnar to pack
+analyses saved before the switch, or --to documents to undo it. Lists the
+columnar format can't hold (unknown fields or severities) are left as they
+are. Safe to rerun and to run while the app is writing.
+
+Usage: python -m app.commands.pack_regions [--to columnar|documents] [--dry-run] [--limit N]
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+import bson
+from pymongo import UpdateOne
+from app.database.mongodb import connect_db, close_db, db
+from app.database.region_codec import (
+    REGION_FIELDS, REGION_STORAGE_FORMATS, expand_regions, is_packed, store_regions
+)
+
+BATCH_SIZE = 500
+
+def _source_query(to_format: str) -> Dict:
+    """Analyses with at least one region list still in the other format"""
+    if to_format == "columnar":
+        branches = [{field: {"$type": "array"}} for field in REGION_FIELDS]
+    else:
+        branches = [{f"{field}.v": {"$exists": True}} for field in REGION_FIELDS]
+    return {"$or": branches}
+
+def _converted(analysis: Dict, to_format: str) -> Dict:
+    """The region fields that change, in the target format"""
+    if to_format == "documents":
+        expanded = expand_regions(analysis)
+        return {field: expanded[field] for field in REGION_FIELDS if is_packed(analysis.get(field))}
+    changes = {}
+    for field in REGION_FIELDS:
+        regions = analysis.get(field)
+        if isinstance(regions, list):
+            packed = store_regions(regions, "columnar")
+            if is_packed(packed):
+                changes[field] = packed
+    return changes
+
+def _region_bytes(fields: Dict) -> int:
+    return len(bson.encode(fields)) if fields else 0
+
+async def _write(updates: List[UpdateOne], dry_run: bool) -> int:
+    if dry_run or not updates:
+        return len(updates)
+    result = await db.database.skin_analyses.bulk_write(updates, ordered=False)
+    return result.modified_count
+
+async def pack_regions(to_format: str = "columnar", dry_run: bool = False, limit: int = 0) -> Dict[str, int]:
+    projection = {field: 1 for field in REGION_FIELDS}
+    cursor = db.database.skin_analyses.find(_source_query(to_format), projection)
+    if limit:
+        cursor = cursor.limit(limit)
+    
+    totals = {"converted": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    updates: List[UpdateOne] = []
+    async for analysis in cursor:
+        changes = _converted(analysis, to_format)
+        if not changes:
+            totals["skipped"] += 1
+            continue
+        totals["bytes_before"] += _region_bytes({field: analysis[field] for field in changes})
+        totals["bytes_after"] += _region_bytes(changes)
+        # Only rewrite fields still in the form we read, in case the app rewrote them meanwhile
+        guard = {"_id": analysis["_id"]}
+        for field in changes:
+            if to_format == "documents":
+                guard[f"{field}.v"] = {"$exists": True}
+            else:
+                guard[field] = {"$type": "array"}
+        updates.append(UpdateOne(guard, {"$set": changes}))
+        if len(updates) >= BATCH_SIZE:
+            totals["converted"] += await _write(updates, dry_run)
+            updates = []
+            print(f"Converted {totals['converted']} analyses")
+    totals["converted"] += await _write(updates, dry_run)
+    return totals
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--to", choices=REGION_STORAGE_FORMATS, default="columnar", help="target format")
+    parser.add_argument("--dry-run", action="store_true", help="count documents without changing them")
+    parser.add_argument("--limit", type=int, default=0, help="stop after N documents")
+    args = parser.parse_args()
+    
+    await connect_db()
+    try:
+        totals = await pack_regions(to_format=args.to, dry_run=args.dry_run, limit=args.limit)
+        action = "Would convert" if args.dry_run else "Converted"
+        print(f"{action} {totals['converted']} analyses to {args.to} regions "
+              f"({totals['bytes_before']} -> {totals['bytes_after']} region bytes), "
+              f"{totals['skipped']} left as they are")
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Rebuild the skin_progress rollups from skin_analyses.
+
+Run while analyses aren't being saved for the users being rebuilt: a scan
+saved mid-rebuild can be counted twice or not at all.
+
+Usage: python -m app.commands.rebuild_progress [--user-id ID] [--dry-run]
+"""
+import argparse
+import asyncio
+from typing import Dict, List, Optional
+from app.database.analyses import ALL_TIME, PROGRESS_UNITS, bucket_start, issue_counts
+from app.database.mongodb import connect_db, close_db, db
+
+def rollup_documents(user_id: str, analyses: List[Dict]) -> List[Dict]:
+    """A user's rollup documents, computed from their analyses oldest first"""
+    buckets: Dict = {}
+    for analysis in analyses:
+        date, score = analysis["analysis_date"], analysis["skin_score"]
+        counts = issue_counts(analysis)
+        keys = [(unit, bucket_start(date, unit)) for unit in PROGRESS_UNITS] + [("all", ALL_TIME)]
+        for unit, start in keys:
+            bucket = buckets.setdefault((unit, start), {
+                "user_id": user_id,
+                "unit": unit,
+                "start": start,
+                "scans": 0,
+                "score_sum": 0,
+                "redness_sum": 0,
+                "dark_spots_sum": 0,
+                "first": {"date": date, "score": score},
+            })
+            bucket["scans"] += 1
+            bucket["score_sum"] += score
+            bucket["redness_sum"] += counts["redness"]
+            bucket["dark_spots_sum"] += counts["dark_spots"]
+            bucket["last"] = {"date": date, "score": score}
+    return list(buckets.values())
+
+async def _write_rollups(user_id: str, analyses: List[Dict], dry_run: bool) -> int:
+    documents = rollup_documents(user_id, analyses)
+    if not dry_run:
+        await db.database.skin_progress.insert_many(documents)
+    return len(documents)
+
+async def rebuild_progress(user_id: Optional[str] = None, dry_run: bool = False) -> Dict[str, int]:
+    query = {"user_id": user_id} if user_id else {}
+    if not dry_run:
+        # Clear first, so rollups of users with no analyses left go too
+        await db.database.skin_progress.delete_many(query)
+    
+    # user_id descending walks the (user_id, analysis_date desc, _id desc) index
+    # backwards, so each user's analyses come oldest first without an in-memory
+    # sort; the region arrays aren't needed, detected_issues has the counts
+    cursor = db.database.skin_analyses.find(
+        query,
+        {"_id": 0, "user_id": 1, "analysis_date": 1, "skin_score": 1, "detected_issues": 1}
+    ).sort([("user_id", -1), ("analysis_date", 1)])
+    
+    totals = {"users": 0, "analyses": 0, "buckets": 0}
+    current_user, analyses = None, []
+    async for analysis in cursor:
+        if analysis["user_id"] != current_user and analyses:
+            totals["buckets"] += await _write_rollups(current_user, analyses, dry_run)
+            totals["users"] += 1
+            analyses = []
+        current_user = analysis["user_id"]
+        analyses.append(analysis)
+        totals["analyses"] += 1
+    if analyses:
+        totals["buckets"] += await _write_rollups(current_user, analyses, dry_run)
+        totals["users"] += 1
+    return totals
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", help="only rebuild this user's rollups")
+    parser.add_argument("--dry-run", action="store_true", help="count buckets without writing them")
+    args = parser.parse_args()
+    
+    await connect_db()
+    try:
+        totals = await rebuild_progress(user_id=args.user_id, dry_run=args.dry_run)
+        action = "Would write" if args.dry_run else "Wrote"
+        print(f"{action} {totals['buckets']} progress buckets for {totals['users']} users "
+              f"from {totals['analyses']} analyses")
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
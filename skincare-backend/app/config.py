@@ -13,9 +13,96 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    
+    # Authenticated user cache (per worker, 0 disables)
+    USER_CACHE_TTL_SECONDS: float = 30
+    USER_CACHE_MAX_SIZE: int = 1024
+    
     # CORS
     CLIENT_ORIGIN: str = "http://localhost:5173"
     
+    # Skin analysis worker pool
+    ANALYSIS_POOL_MODE: str = "process"  # "process" or "thread"
+    ANALYSIS_POOL_SIZE: Optional[int] = None  # defaults to the CPU budget
+    ANALYSIS_QUEUE_DEPTH: int = 8  # scans allowed to wait for a free worker
+    ANALYSIS_RETRY_AFTER_SECONDS: int = 2
+    ANALYSIS_MAX_BATCH_SIZE: int = 20
+    ANALYSIS_MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    IMAGE_MAX_EDGE: int = 1000  # working resolution cap in pixels, 0 keeps full size
+    ANALYSIS_POOL_WARM: bool = False  # start the pool workers at startup instead of on first scan
+    
+    # CPU budget (app.serve sets these per worker)
+    SERVE_WORKERS: int = 2
+    SERVE_PIN_CPUS: bool = False  # pin each server worker to its own slice of CPUs
+    WORKER_CPU_BUDGET: Optional[int] = None  # CPUs for this process, defaults to its affinity mask
+    OPENCV_THREADS: Optional[int] = None  # per analysis worker, defaults to budget / pool size
+    
+    # Tile-parallel skin analysis of large face ROIs. Needs more than one tile
+    # thread per analysis worker: with the default pool (one worker per CPU,
+    # one OpenCV thread each) it stays off. Turn it on with ANALYSIS_POOL_SIZE
+    # below the CPU budget (workers get budget / size threads) or with
+    # ANALYSIS_TILE_WORKERS > 1.
+    ANALYSIS_TILE_SIZE: int = 256  # tile edge in pixels (kept even)
+    ANALYSIS_TILE_WORKERS: Optional[int] = None  # threads per analysis worker, defaults to its OpenCV threads; 1 disables
+    ANALYSIS_TILE_MIN_FRACTION: float = 0.2  # tile face ROIs covering this share of IMAGE_MAX_EDGE squared
+    ANALYSIS_TILE_MIN_PIXELS: Optional[int] = None  # absolute ROI size instead (1,000,000 when IMAGE_MAX_EDGE is 0)
+    
+    # Face detection
+    FACE_DETECTOR_BACKEND: str = "auto"  # "haar", "yunet", or "auto" (YuNet when the model file exists, see models/README.md)
+    FACE_DETECTOR_MODEL_PATH: str = "models/face_detection_yunet_2023mar.onnx"
+    FACE_DETECTOR_SCORE_THRESHOLD: float = 0.8
+    FACE_MIN_SIZE_FRACTION: float = 0.1  # of the shorter image edge, 0 disables
+    FACE_MAX_SIZE_FRACTION: float = 0  # of the shorter image edge, 0 disables
+    
+    # Live scan WebSocket
+    LIVE_MAX_EDGE: int = 640  # working resolution for streamed frames
+    LIVE_KEYFRAME_INTERVAL: int = 15  # tracked frames between full face detections
+    LIVE_TRACK_MIN_SCORE: float = 0.6  # weaker template matches force a keyframe
+    
+    # Repeat-scan result cache (in-process LRU, optional shared Mongo tier)
+    ANALYSIS_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 0 disables the cache
+    ANALYSIS_CACHE_SHARED: bool = False
+    ANALYSIS_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    
+    # Storage of region arrays in skin_analyses (app.commands.pack_regions converts stored ones)
+    REGION_STORAGE_FORMAT: str = "documents"  # "documents" (a dict per region) or "columnar" (packed binary columns)
+    
+    # Write-behind buffer for saved analyses (durable=true on a request saves synchronously)
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_BEHIND_BATCH_SIZE: int = 100  # flush as soon as this many are queued
+    WRITE_BEHIND_FLUSH_MS: int = 250  # otherwise flush this often
+    WRITE_BEHIND_MAX_PENDING: int = 5000  # past this, saves wait for a flush
+    WRITE_BEHIND_JOURNAL_DIR: str = "data/write_behind"  # batches Mongo couldn't take, replayed later
+    
+    # Asynchronous scan jobs (POST /skin-analysis/jobs, queued in skin_jobs)
+    SCAN_JOB_WORKERS: int = 2  # job tasks per server process, 0 leaves jobs to other processes
+    SCAN_JOB_LEASE_SECONDS: int = 60  # a job whose worker stops renewing this is run again
+    SCAN_JOB_MAX_ATTEMPTS: int = 3
+    SCAN_JOB_POLL_MS: int = 500  # idle workers and event streams check for jobs this often
+    SCAN_JOB_TTL_SECONDS: int = 24 * 60 * 60  # finished jobs are removed after this
+    
+    # History export (GET /skin-analysis/export streams NDJSON or CSV)
+    EXPORT_BATCH_SIZE: int = 500  # documents per cursor batch and per streamed chunk
+    EXPORT_MAX_BATCH_SIZE: int = 5000  # upper bound for the batch_size query parameter
+    EXPORT_GZIP_LEVEL: int = 6  # used when the client sends Accept-Encoding: gzip
+    
+    # Annotated image rendering (opt-in per request with render=thumbnail|full)
+    ANNOTATION_QUALITY: int = 85
+    ANNOTATION_THUMBNAIL_MAX_DIM: int = 256
+    
+    # Profiling (sampled cProfile of analysis pool calls, slow ones dumped to PROFILE_DIR)
+    PROFILE_SAMPLE_RATE: float = 0  # share of pool calls profiled, 0 disables
+    PROFILE_SLOW_MS: float = 1000
+    PROFILE_DIR: str = "data/profiles"
+    
+    # Annotated and source image storage
+    IMAGE_STORE_BACKEND: str = "gridfs"  # "gridfs" or "filesystem"
+    IMAGE_STORE_PATH: str = "data/images"
+    SOURCE_IMAGE_QUALITY: int = 90  # JPEG quality of source photos stored at working resolution
+    
     # Pydantic v2 settings config
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra='ignore')
 
@@ -0,0 +1,116 @@
+"""Writes to skin_analyses and the skin_progress rollups kept alongside them.
+
+Every saved analysis also bumps its user's progress rollups: one document per
+day, ISO week (starting Monday, UTC) and month bucket plus an all-time total,
+each holding the scan count, score and issue-count sums and the first and
+last score. /progress reads those buckets instead of scanning analyses.
+The rollups are updated right after the insert, not in a transaction, so a
+crash in between leaves them short; python -m app.commands.rebuild_progress
+recomputes them from skin_analyses.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.database.mongodb import db
+from app.database.region_codec import region_count
+from app.services.metrics import stage
+
+PROGRESS_UNITS = ("day", "week", "month")
+
+# Bucket start of the all-time totals document
+ALL_TIME = datetime(1970, 1, 1)
+
+def bucket_start(date: datetime, unit: str) -> datetime:
+    """Start of the day, week (Monday) or month bucket holding date"""
+    day = datetime(date.year, date.month, date.day)
+    if unit == "day":
+        return day
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown progress unit: {unit}")
+
+def issue_counts(analysis: Dict) -> Dict[str, int]:
+    """Redness and dark spot counts of an analysis document"""
+    detected = analysis.get("detected_issues")
+    if isinstance(detected, dict):
+        return {
+            "redness": detected.get("redness_count", 0),
+            "dark_spots": detected.get("dark_spots_count", 0),
+        }
+    return {
+        "redness": region_count(analysis.get("redness_areas")),
+        "dark_spots": region_count(analysis.get("dark_spot_areas")),
+    }
+
+def progress_updates(analysis: Dict) -> List[UpdateOne]:
+    """Upserts adding one analysis to its user's rollup buckets"""
+    date = analysis["analysis_date"]
+    score = analysis["skin_score"]
+    counts = issue_counts(analysis)
+    # Embedded documents compare field by field, so $min/$max on {date, score}
+    # keep the earliest and latest scan even if writes arrive out of order
+    point = {"date": date, "score": score}
+    update = {
+        "$inc": {
+            "scans": 1,
+            "score_sum": score,
+            "redness_sum": counts["redness"],
+            "dark_spots_sum": counts["dark_spots"],
+        },
+        "$min": {"first": point},
+        "$max": {"last": point},
+    }
+    buckets = [(unit, bucket_start(date, unit)) for unit in PROGRESS_UNITS] + [("all", ALL_TIME)]
+    return [
+        UpdateOne({"user_id": analysis["user_id"], "unit": unit, "start": start}, update, upsert=True)
+        for unit, start in buckets
+    ]
+
+async def update_progress(analyses: List[Dict]):
+    """Add analyses to the progress rollups in one round trip"""
+    updates = [update for analysis in analyses for update in progress_updates(analysis)]
+    if updates:
+        with stage("db_progress_rollup"):
+            await db.database.skin_progress.bulk_write(updates, ordered=False)
+
+async def insert_analysis(analysis: Dict) -> bool:
+    """Save one analysis and roll it into its user's progress; False if its _id is already saved"""
+    try:
+        with stage("db_insert"):
+            await db.database.skin_analyses.insert_one(analysis)
+    except DuplicateKeyError:
+        # Saved before (e.g. by an earlier run of the same scan job) and already rolled up
+        return False
+    await update_progress([analysis])
+    return True
+
+async def insert_analyses(analyses: List[Dict]):
+    """Save several analyses in one round trip and roll them into progress"""
+    if not analyses:
+        return
+    try:
+        with stage("db_insert"):
+            await db.database.skin_analyses.insert_many(analyses, ordered=False)
+    except BulkWriteError as e:
+        # Roll up the documents that did go in before passing the error on
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        await update_progress([analysis for index, analysis in enumerate(analyses) if index not in failed])
+        raise
+    await update_progress(analyses)
+
+async def progress_buckets(user_id: str, unit: str, since: datetime) -> List[Dict]:
+    """A user's rollup buckets of one unit from the bucket holding since, oldest first"""
+    with stage("db_progress"):
+        return await db.database.skin_progress.find(
+            {"user_id": user_id, "unit": unit, "start": {"$gte": bucket_start(since, unit)}},
+            {"_id": 0}
+        ).sort("start", 1).to_list(None)
+
+async def progress_totals(user_id: str) -> Dict:
+    """A user's all-time rollup (empty if they have no analyses)"""
+    return await db.database.skin_progress.find_one(
+        {"user_id": user_id, "unit": "all", "start": ALL_TIME}, {"_id": 0}
+    ) or {}
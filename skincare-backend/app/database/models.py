@@ -1,6 +1,6 @@
 # skincare-backend/app/database/models.py
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Any, Annotated
+from typing import Optional, List, Any, Annotated, Dict
 from datetime import datetime
 from bson import ObjectId
 from pydantic import GetJsonSchemaHandler, BaseModel
@@ -90,9 +90,12 @@ class TokenData(BaseModel):
 class SkinAnalysisModel(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     user_id: str
-    image_url: str
+    image_url: Optional[str] = None
+    source_image_url: Optional[str] = None
+    face_location: Optional[dict] = None
+    image_size: Optional[dict] = None  # upload width and height, which region coordinates refer to
     skin_score: float
-    detected_issues: List[str]
+    detected_issues: Dict[str, int]  # redness_count, dark_spots_count
     redness_areas: Optional[List[dict]] = []
     dark_spot_areas: Optional[List[dict]] = []
     recommendations: List[str]
@@ -101,4 +104,8 @@ class SkinAnalysisModel(BaseModel):
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
\ No newline at end of file
+        json_encoders = {ObjectId: str}
+
+class AnalysisHistoryPage(BaseModel):
+    items: List[SkinAnalysisModel]
+    next_cursor: Optional[str] = None
@@ -1,5 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from typing import Optional
 from app.config import settings
 
@@ -13,6 +15,48 @@ async def connect_db():
     db.client = AsyncIOMotorClient(settings.DATABASE_URL)
     db.database = db.client[settings.MONGO_INITDB_DATABASE]
     print("Connected to MongoDB")
+    await ensure_indexes()
+
+# Indexes backing the hot queries; see app/database/query_plans.py
+INDEXES = {
+    "users": [
+        {"keys": [("username", ASCENDING)], "name": "username_unique", "unique": True},
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+    ],
+    "skin_analyses": [
+        # _id breaks analysis_date ties for keyset pagination of /history
+        {"keys": [("user_id", ASCENDING), ("analysis_date", DESCENDING), ("_id", DESCENDING)],
+         "name": "user_id_analysis_date_id"},
+    ],
+    "skin_progress": [
+        {"keys": [("user_id", ASCENDING), ("unit", ASCENDING), ("start", ASCENDING)],
+         "name": "user_id_unit_start_unique", "unique": True},
+    ],
+    "skin_jobs": [
+        {"keys": [("status", ASCENDING), ("available_at", ASCENDING)], "name": "status_available_at"},
+        {"keys": [("status", ASCENDING), ("lease_expires", ASCENDING)], "name": "status_lease_expires"},
+        {"keys": [("status", ASCENDING), ("created_at", ASCENDING)], "name": "status_created_at"},
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)],
+         "name": "user_id_status_created_at"},
+        {"keys": [("finished_at", ASCENDING)], "name": "finished_at_ttl",
+         "expireAfterSeconds": settings.SCAN_JOB_TTL_SECONDS},
+    ],
+    "analysis_cache": [
+        {"keys": [("created_at", ASCENDING)], "name": "created_at_ttl",
+         "expireAfterSeconds": settings.ANALYSIS_CACHE_TTL_SECONDS},
+    ],
+}
+
+async def ensure_indexes():
+    """Create the indexes the routers rely on (safe to run on every startup)"""
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            options = {k: v for k, v in index.items() if k != "keys"}
+            try:
+                await db.database[collection].create_index(index["keys"], **options)
+            except OperationFailure as e:
+                # e.g. duplicate usernames already stored; keep serving and report it
+                print(f"Could not create index {index['name']} on {collection}: {e}")
 
 async def close_db():
     if db.client:
@@ -0,0 +1,29 @@
+import base64
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+from bson import ObjectId
+
+def encode_cursor(analysis_date: datetime, analysis_id: ObjectId) -> str:
+    """Opaque keyset cursor for the (analysis_date, _id) sort position"""
+    if analysis_date.tzinfo is None:
+        analysis_date = analysis_date.replace(tzinfo=timezone.utc)
+    millis = int(analysis_date.timestamp() * 1000)
+    raw = f"{millis}:{analysis_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, analysis_id = raw.split(":")
+        analysis_date = datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc).replace(tzinfo=None)
+        return analysis_date, ObjectId(analysis_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+def after_cursor(analysis_date: datetime, analysis_id: ObjectId) -> Dict:
+    """Filter for documents that sort after the cursor in (analysis_date, _id) descending order"""
+    return {"$or": [
+        {"analysis_date": {"$lt": analysis_date}},
+        {"analysis_date": analysis_date, "_id": {"$lt": analysis_id}}
+    ]}
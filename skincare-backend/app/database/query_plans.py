@@ -0,0 +1,131 @@
+"""Query-plan checks for the router queries.
+
+Runs explain() for every hot query and fails if any winning plan contains a
+COLLSCAN. Against mongomock, which has no query planner, it falls back to
+checking that each query constrains the leading field of some index.
+
+Usage: python -m app.database.query_plans
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+
+_PROBE_USER = "000000000000000000000000"
+
+# (name, collection, filter, sort) for each query the routers run per request.
+# Keep in sync with the routers when adding or changing a query.
+HOT_QUERIES: List[Tuple[str, str, Dict, Optional[List[Tuple[str, int]]]]] = [
+    ("current user lookup", "users", {"username": "probe"}, None),
+    ("register duplicate check", "users",
+     {"$or": [{"username": "probe"}, {"email": "probe@example.com"}]}, None),
+    ("analysis history", "skin_analyses", {"user_id": _PROBE_USER}, [("analysis_date", -1), ("_id", -1)]),
+    ("analysis history after cursor", "skin_analyses",
+     {"user_id": _PROBE_USER, "$or": [
+         {"analysis_date": {"$lt": datetime(2000, 1, 1)}},
+         {"analysis_date": datetime(2000, 1, 1), "_id": {"$lt": ObjectId(_PROBE_USER)}}
+     ]}, [("analysis_date", -1), ("_id", -1)]),
+    ("history export", "skin_analyses", {"user_id": _PROBE_USER}, [("analysis_date", 1), ("_id", 1)]),
+    ("progress window", "skin_analyses",
+     {"user_id": _PROBE_USER, "analysis_date": {"$gte": datetime(2000, 1, 1)}}, [("analysis_date", 1)]),
+    ("progress rollup buckets", "skin_progress",
+     {"user_id": _PROBE_USER, "unit": "day", "start": {"$gte": datetime(2000, 1, 1)}}, [("start", 1)]),
+    ("progress rollup totals", "skin_progress",
+     {"user_id": _PROBE_USER, "unit": "all", "start": datetime(1970, 1, 1)}, None),
+    ("image ownership", "skin_analyses",
+     {"user_id": _PROBE_USER, "$or": [
+         {"image_url": "/skin-analysis/image/probe"},
+         {"source_image_url": "/skin-analysis/image/probe"}
+     ]}, None),
+    ("annotated image render", "skin_analyses", {"_id": ObjectId(_PROBE_USER), "user_id": _PROBE_USER}, None),
+    ("scan job claim", "skin_jobs",
+     {"status": "queued", "available_at": {"$lte": datetime(2000, 1, 1)}}, [("available_at", 1)]),
+    ("scan job lease reclaim", "skin_jobs",
+     {"status": "running", "lease_expires": {"$lt": datetime(2000, 1, 1)}}, [("lease_expires", 1)]),
+    ("scan job poll", "skin_jobs", {"_id": ObjectId(_PROBE_USER), "user_id": _PROBE_USER}, None),
+    ("scan job stats", "skin_jobs", {"user_id": _PROBE_USER}, None),
+    ("oldest queued scan job", "skin_jobs", {"user_id": _PROBE_USER, "status": "queued"}, [("created_at", 1)]),
+    ("scan job queue depth", "skin_jobs", {"status": "queued"}, None),
+    ("oldest queued scan job, all users", "skin_jobs", {"status": "queued"}, [("created_at", 1)]),
+]
+
+def _winning_plans(explain: Dict) -> Iterator[Dict]:
+    """Yield every winningPlan in an explain document (find or aggregate)"""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _winning_plans(item)
+
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(item) for item in plan)
+    return False
+
+def _query_fields(query_filter: Dict) -> List[List[str]]:
+    """Field sets each branch of a filter can use, one list per $or branch"""
+    fields = [field for field in query_filter if not field.startswith("$")]
+    if "$or" in query_filter:
+        return [
+            fields + branch_fields
+            for branch in query_filter["$or"]
+            for branch_fields in _query_fields(branch)
+        ]
+    return [fields]
+
+def _covered_by_index(query_filter: Dict, index_information: Dict) -> bool:
+    """Planner stand-in: each $or branch must constrain some index's leading field"""
+    leading_fields = {index["key"][0][0] for index in index_information.values()}
+    return all(leading_fields & set(fields) for fields in _query_fields(query_filter))
+
+async def collscan_queries(database: AsyncIOMotorDatabase) -> List[str]:
+    """Return the names of hot queries whose winning plan is a collection scan"""
+    failures = []
+    for name, collection, query_filter, sort in HOT_QUERIES:
+        cursor = database[collection].find(query_filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explain = await cursor.explain()
+        except (NotImplementedError, OperationFailure, AttributeError):
+            explain = None
+
+        if explain is None:
+            index_information = await database[collection].index_information()
+            if not _covered_by_index(query_filter, index_information):
+                failures.append(name)
+        elif any(_has_collscan(plan) for plan in _winning_plans(explain)):
+            failures.append(name)
+    return failures
+
+async def assert_indexed_queries(database: AsyncIOMotorDatabase):
+    """Fail (AssertionError) if any hot query would run as a COLLSCAN"""
+    failures = await collscan_queries(database)
+    if failures:
+        raise AssertionError(f"Queries without a usable index (COLLSCAN): {', '.join(failures)}")
+
+async def main() -> int:
+    from app.database.mongodb import connect_db, close_db, db
+    await connect_db()
+    try:
+        failures = await collscan_queries(db.database)
+    finally:
+        await close_db()
+    for name in failures:
+        print(f"COLLSCAN: {name}")
+    print("All hot queries use an index" if not failures else f"{len(failures)} queries scan the collection")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,105 @@
+"""Columnar storage for the redness_areas / dark_spot_areas arrays.
+
+With REGION_STORAGE_FORMAT = "columnar" each region list is stored as one
+small document of typed binary columns instead of a dict per region:
+
+  {"v": 1, "n": count,
+   "box": x, y, width, height per region (int16, or int32 when a value doesn't fit),
+   "box_bytes": 2 or 4,
+   "area": float32, "severity": uint8 index into SEVERITY_NAMES,
+   "circularity": float32 (only when every region has one)}
+
+All columns are little-endian. Areas and circularity are kept as float32,
+so they read back rounded to about 7 significant digits. Readers call
+expand_regions only when a response needs the region detail; counts come
+from detected_issues or region_count without decoding.
+"""
+from typing import Dict, List, Optional, Union
+import numpy as np
+from bson import Binary
+from app.config import settings
+
+REGION_CODEC_VERSION = 1
+REGION_FIELDS = ("redness_areas", "dark_spot_areas")
+REGION_STORAGE_FORMATS = ("documents", "columnar")
+
+# Same order as face_detection.SEVERITY_NAMES (kept here so reading stays free of OpenCV)
+SEVERITY_NAMES = ("mild", "moderate", "severe")
+
+_BOX_KEYS = ("x", "y", "width", "height")
+_INT16 = np.iinfo(np.int16)
+
+def is_packed(regions) -> bool:
+    return isinstance(regions, dict) and "v" in regions
+
+def pack_regions(regions: List[Dict]) -> Dict:
+    """Encode a region list as columns; ValueError if a region doesn't fit the format"""
+    if any(set(region) - {*_BOX_KEYS, "area", "severity", "circularity"} for region in regions):
+        raise ValueError("Regions carry fields the columnar format doesn't store")
+    boxes = np.array([[region[key] for key in _BOX_KEYS] for region in regions], np.int64).reshape(-1, 4)
+    fits_int16 = boxes.size == 0 or (boxes.min() >= _INT16.min and boxes.max() <= _INT16.max)
+    box_type = np.dtype("<i2" if fits_int16 else "<i4")
+    try:
+        severities = [SEVERITY_NAMES.index(region["severity"]) for region in regions]
+    except ValueError:
+        raise ValueError("Unknown region severity")
+
+    packed = {
+        "v": REGION_CODEC_VERSION,
+        "n": len(regions),
+        "box": Binary(boxes.astype(box_type).tobytes()),
+        "box_bytes": box_type.itemsize,
+        "area": Binary(np.array([region["area"] for region in regions], "<f4").tobytes()),
+        "severity": Binary(np.array(severities, np.uint8).tobytes()),
+    }
+    with_circularity = sum("circularity" in region for region in regions)
+    if with_circularity == len(regions) and regions:
+        packed["circularity"] = Binary(np.array([region["circularity"] for region in regions], "<f4").tobytes())
+    elif with_circularity:
+        raise ValueError("Circularity is set on only some regions")
+    return packed
+
+def unpack_regions(packed: Dict) -> List[Dict]:
+    """Decode columns back into the region dicts the analyzer produced"""
+    if packed.get("v") != REGION_CODEC_VERSION:
+        raise ValueError(f"Unsupported region codec version: {packed.get('v')}")
+    count = packed["n"]
+    box_type = "<i2" if packed["box_bytes"] == 2 else "<i4"
+    boxes = np.frombuffer(packed["box"], box_type).reshape(count, 4).tolist()
+    areas = np.frombuffer(packed["area"], "<f4").tolist()
+    severities = np.frombuffer(packed["severity"], np.uint8).tolist()
+    circularity = np.frombuffer(packed["circularity"], "<f4").tolist() if "circularity" in packed else None
+
+    regions = []
+    for index, (x, y, width, height) in enumerate(boxes):
+        region = {"x": x, "y": y, "width": width, "height": height, "area": areas[index]}
+        if circularity is not None:
+            region["circularity"] = circularity[index]
+        region["severity"] = SEVERITY_NAMES[severities[index]]
+        regions.append(region)
+    return regions
+
+def store_regions(regions: List[Dict], storage_format: Optional[str] = None) -> Union[List[Dict], Dict]:
+    """Regions in the configured storage format (lists that can't be packed stay as they are)"""
+    if (storage_format or settings.REGION_STORAGE_FORMAT) != "columnar":
+        return regions
+    try:
+        return pack_regions(regions)
+    except ValueError:
+        return regions
+
+def region_count(regions) -> int:
+    """Number of regions in either storage format"""
+    if is_packed(regions):
+        return regions["n"]
+    return len(regions or [])
+
+def expand_regions(analysis: Dict) -> Dict:
+    """The analysis with packed region columns decoded (a copy; the input is left alone)"""
+    if not any(is_packed(analysis.get(field)) for field in REGION_FIELDS):
+        return analysis
+    expanded = dict(analysis)
+    for field in REGION_FIELDS:
+        if is_packed(expanded.get(field)):
+            expanded[field] = unpack_regions(expanded[field])
+    return expanded
@@ -0,0 +1,305 @@
+"""Write-behind buffer for saved analyses.
+
+Analyze requests hand their document to the buffer and return; a background
+task saves what has queued up with one insert_many (via insert_analyses, so
+the progress rollups follow) once WRITE_BEHIND_BATCH_SIZE are waiting or
+WRITE_BEHIND_FLUSH_MS has passed. The buffer is drained on shutdown.
+
+Batches Mongo rejects are appended to a per-process JSONL journal in
+WRITE_BEHIND_JOURNAL_DIR and replayed once Mongo answers again, on startup
+by whichever worker finds them. Replays may re-send documents that did get
+in; their duplicate _id errors are ignored, but their progress rollups can
+come out short (python -m app.commands.rebuild_progress fixes that).
+
+/history, /progress and /export flush the buffer first when it holds
+analyses of the requesting user, so a client sees its own scans as soon as
+the analyze response arrives. That holds for reads served by the process
+that took the scan; with several server workers, a read landing on another
+one can miss scans for up to WRITE_BEHIND_FLUSH_MS. The image and annotated
+endpoints look in the buffer too, so the URLs an analyze response returns
+work right away.
+"""
+import asyncio
+import glob
+import os
+import time
+from typing import Callable, Dict, List, Optional
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+from app.config import settings
+from app.database.analyses import insert_analyses, insert_analysis
+from app.services.metrics import register_stats
+
+# Mongo's duplicate key error
+DUPLICATE_KEY = 11000
+
+# How often a worker with a non-empty journal retries it
+JOURNAL_RETRY_SECONDS = 5
+
+def _journal_owner(path: str) -> int:
+    """Pid of the process that wrote (or is replaying) a journal file"""
+    return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _append_journal(path: str, analyses: List[Dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = "".join(
+        json_util.dumps(analysis, json_options=json_util.CANONICAL_JSON_OPTIONS) + "\n"
+        for analysis in analyses
+    )
+    with open(path, "a") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_journal(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json_util.loads(line) for line in f if line.strip()]
+
+def _unsaved(analyses: List[Dict], error: BulkWriteError) -> List[Dict]:
+    """Documents of a failed insert_many that still need saving (duplicates are already in)"""
+    failed = {
+        write_error["index"] for write_error in error.details.get("writeErrors", [])
+        if write_error.get("code") != DUPLICATE_KEY
+    }
+    if error.details.get("writeConcernErrors"):
+        # Can't tell which writes are durable; re-send them all, duplicates get skipped
+        return analyses
+    return [analysis for index, analysis in enumerate(analyses) if index in failed]
+
+class AnalysisWriteBuffer:
+    """Queues analysis documents and saves them in batches from a background task"""
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int, journal_dir: str):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.journal_dir = journal_dir
+        self.journal_path = os.path.join(journal_dir, f"analyses-{os.getpid()}.jsonl")
+        self.flushed = 0
+        self.journaled = 0
+        self.replayed = 0
+        self._pending: List[Dict] = []
+        self._in_flight: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._journal_waiting = True  # journals may be left over from an earlier run
+        self._next_replay = 0.0
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def add(self, analysis: Dict):
+        """Queue one analysis; only waits for Mongo if the buffer is over max_pending"""
+        self.start()
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+        self._pending.append(analysis)
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def add_many(self, analyses: List[Dict]):
+        for analysis in analyses:
+            await self.add(analysis)
+
+    def find(self, predicate: Callable[[Dict], bool]) -> Optional[Dict]:
+        """A queued or in-flight analysis matching predicate"""
+        for analysis in self._in_flight + self._pending:
+            if predicate(analysis):
+                return analysis
+        return None
+
+    async def flush_user(self, user_id: str):
+        """Save everything queued if any of it (queued or in flight) belongs to user_id"""
+        if self.find(lambda analysis: analysis["user_id"] == user_id) is not None:
+            # Waits for an in-flight batch through the lock, then saves the rest
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+                if self._journal_waiting and time.monotonic() >= self._next_replay:
+                    await self.replay_journals()
+            except Exception as e:
+                # Keep the flusher alive; the documents stay queued for the next round
+                print(f"Write-behind flush failed: {e}")
+
+    async def flush(self):
+        """Save everything queued so far, journaling batches Mongo won't take"""
+        async with self._lock:
+            while self._pending:
+                self._in_flight = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    try:
+                        unsaved = await self._save(self._in_flight)
+                    except PyMongoError as e:
+                        # Mongo is unreachable: journal everything queued instead of
+                        # waiting out a server selection timeout per batch
+                        print(f"Could not save analyses, journaling them: {e}")
+                        self._in_flight += self._pending
+                        self._pending = []
+                        unsaved = self._in_flight
+                    if unsaved:
+                        await self._journal(unsaved)
+                except Exception:
+                    # Journal unavailable too: put the batch back in front
+                    self._pending[:0] = self._in_flight
+                    raise
+                finally:
+                    self._in_flight = []
+
+    async def _save(self, analyses: List[Dict]) -> List[Dict]:
+        """insert_analyses, returning the documents that didn't get in"""
+        try:
+            await insert_analyses(analyses)
+        except BulkWriteError as e:
+            unsaved = _unsaved(analyses, e)
+            if unsaved:
+                print(f"Mongo rejected {len(unsaved)} analyses, journaling them: {e}")
+            self.flushed += len(analyses) - len(unsaved)
+            return unsaved
+        self.flushed += len(analyses)
+        return []
+
+    async def _journal(self, analyses: List[Dict]):
+        await asyncio.to_thread(_append_journal, self.journal_path, analyses)
+        self.journaled += len(analyses)
+        self._journal_waiting = True
+        self._next_replay = time.monotonic() + JOURNAL_RETRY_SECONDS
+
+    def _claim_journals(self) -> List[str]:
+        """Take over this process's journal and those of processes that are gone"""
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl"))):
+            try:
+                owner = _journal_owner(path)
+            except (IndexError, ValueError):
+                continue
+            if owner != os.getpid() and _is_running(owner):
+                continue
+            replay_path = os.path.join(self.journal_dir, f"replay-{os.getpid()}-{time.time_ns()}.jsonl")
+            try:
+                # Atomic, so two workers can't both claim a dead worker's journal
+                os.rename(path, replay_path)
+            except FileNotFoundError:
+                continue
+            claimed.append(replay_path)
+        return claimed
+
+    async def replay_journals(self):
+        """Save journaled analyses now that Mongo is reachable again"""
+        async with self._lock:
+            self._journal_waiting = False
+            replayed = 0
+            try:
+                for path in await asyncio.to_thread(self._claim_journals):
+                    analyses = await asyncio.to_thread(_read_journal, path)
+                    unsaved = []
+                    for start in range(0, len(analyses), self.batch_size):
+                        batch = analyses[start:start + self.batch_size]
+                        failed = await self._save(batch)
+                        replayed += len(batch) - len(failed)
+                        unsaved.extend(failed)
+                    if unsaved:
+                        await self._journal(unsaved)
+                    await asyncio.to_thread(os.remove, path)
+            except Exception as e:
+                # Claimed files keep this process's pid, so the next attempt picks them up
+                print(f"Journal replay stopped, retrying in {JOURNAL_RETRY_SECONDS}s: {e}")
+                self._journal_waiting = True
+                self._next_replay = time.monotonic() + JOURNAL_RETRY_SECONDS
+            finally:
+                self.replayed += replayed
+            if replayed:
+                print(f"Replayed {replayed} journaled analyses")
+
+    async def close(self):
+        """Stop the flusher and save (or journal) whatever is still queued"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending) + len(self._in_flight),
+            "flushed": self.flushed,
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+        }
+
+_write_buffer: Optional[AnalysisWriteBuffer] = None
+
+def get_write_buffer() -> AnalysisWriteBuffer:
+    """Return the process-wide write-behind buffer, creating it on first use"""
+    global _write_buffer
+    if _write_buffer is None:
+        _write_buffer = AnalysisWriteBuffer(
+            batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+            flush_interval=settings.WRITE_BEHIND_FLUSH_MS / 1000,
+            max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+            journal_dir=settings.WRITE_BEHIND_JOURNAL_DIR,
+        )
+    return _write_buffer
+
+async def start_write_buffer():
+    """Start the flusher and replay journals left by earlier runs"""
+    if settings.WRITE_BEHIND_ENABLED:
+        buffer = get_write_buffer()
+        buffer.start()
+        await buffer.replay_journals()
+
+async def shutdown_write_buffer():
+    global _write_buffer
+    if _write_buffer is not None:
+        await _write_buffer.close()
+        _write_buffer = None
+
+def _write_buffer_stats() -> Dict:
+    return _write_buffer.stats() if _write_buffer is not None else {}
+
+register_stats(
+    "write_behind", "Write-behind buffer for saved analyses", _write_buffer_stats,
+    counters=("flushed", "journaled", "replayed")
+)
+
+async def flush_user_analyses(user_id: str):
+    """Read-your-writes: save a user's queued analyses before reading theirs from Mongo"""
+    if _write_buffer is None:
+        return
+    try:
+        await _write_buffer.flush_user(user_id)
+    except Exception as e:
+        # The read goes ahead without them; the flusher keeps retrying
+        print(f"Write-behind flush before read failed: {e}")
+
+async def save_analysis(analysis: Dict, durable: bool = False):
+    """Save an analysis now (durable) or through the write-behind buffer"""
+    if durable or not settings.WRITE_BEHIND_ENABLED:
+        await insert_analysis(analysis)
+    else:
+        await get_write_buffer().add(analysis)
+
+async def save_analyses(analyses: List[Dict], durable: bool = False):
+    """Save several analyses now (durable) or through the write-behind buffer"""
+    if durable or not settings.WRITE_BEHIND_ENABLED:
+        await insert_analyses(analyses)
+    else:
+        await get_write_buffer().add_many(analyses)
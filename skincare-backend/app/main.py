@@ -1,8 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.config import settings
 from app.routers import auth_routes, user_routes, skin_analysis_routes
 from app.database.mongodb import connect_db, close_db
+from app.database.write_behind import shutdown_write_buffer, start_write_buffer
+from app.services.scan_jobs import start_scan_job_workers, stop_scan_job_workers
+from app.services.face_detectors import check_face_detector
+from app.services.metrics import MetricsMiddleware, render_metrics
+from app.services.worker_pool import AnalysisPoolSaturated, get_analysis_pool, shutdown_analysis_pool
 
 app = FastAPI(title="GlowGuard Insight API")
 
@@ -22,20 +28,49 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-request stage timings (Server-Timing header) and latency histograms
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth_routes.router)
 app.include_router(user_routes.router)
 app.include_router(skin_analysis_routes.router)
 
+# Backpressure from the skin analysis worker pool
+@app.exception_handler(AnalysisPoolSaturated)
+async def analysis_pool_saturated_handler(request: Request, exc: AnalysisPoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # Database connection events
 @app.on_event("startup")
 async def startup_db_client():
+    # Pool workers load the detector lazily; catch a missing model before serving
+    check_face_detector()
+    if settings.ANALYSIS_POOL_WARM:
+        # Fork the pool workers before the Mongo client starts its threads
+        await get_analysis_pool().warm()
     await connect_db()
+    await start_write_buffer()
+    start_scan_job_workers(skin_analysis_routes.run_scan_job)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Hand running scan jobs back to the queue, then drain queued analyses
+    # while the Mongo client is still open
+    await stop_scan_job_workers()
+    await shutdown_write_buffer()
     await close_db()
+    shutdown_analysis_pool()
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to GlowGuard Insight API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(await render_metrics(), media_type="text/plain; version=0.0.4")
@@ -2,7 +2,8 @@
 from fastapi import APIRouter, HTTPException, Response, Depends
 from app.database.models import UserCreate, UserLogin, Token, UserModel
 from app.database.mongodb import db
-from app.auth.password import hash_password, verify_password
+from app.auth.password import hash_password, verify_and_update_password
+from app.auth.user_cache import user_cache
 from app.auth.auth_handler import create_access_token, create_refresh_token, verify_token
 from datetime import datetime, timedelta
 from app.auth.auth_bearer import get_current_user
@@ -24,7 +25,7 @@ async def register(user_data: UserCreate, response: Response):
     
     # Create new user
     user_dict = user_data.dict()
-    user_dict["hashed_password"] = hash_password(user_dict.pop("password"))
+    user_dict["hashed_password"] = await hash_password(user_dict.pop("password"))
     user_dict["created_at"] = datetime.utcnow()
     user_dict["updated_at"] = datetime.utcnow()
     
@@ -65,9 +66,20 @@ async def login(response: Response, user_credentials: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
     # Verify password
-    if not verify_password(user_credentials.password, user["hashed_password"]):
+    verified, new_hash = await verify_and_update_password(
+        user_credentials.password, user["hashed_password"]
+    )
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
+    # Transparently upgrade hashes made with outdated bcrypt parameters
+    if new_hash:
+        await db.database.users.update_one(
+            {"_id": user["_id"], "hashed_password": user["hashed_password"]},
+            {"$set": {"hashed_password": new_hash}}
+        )
+        user_cache.invalidate(user["username"])
+    
     # Create tokens
     access_token = create_access_token(data={"sub": user["username"]})
     refresh_token = create_refresh_token(data={"sub": user["username"]})
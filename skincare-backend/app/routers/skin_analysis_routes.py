@@ -1,81 +1,749 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from app.database.models import UserModel, SkinAnalysisModel
-from app.auth.auth_bearer import get_current_user
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, WebSocket
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, List, Literal, Optional, Tuple, Union
+from app.config import settings
+from app.database.models import UserModel, SkinAnalysisModel, AnalysisHistoryPage
+from app.database.pagination import after_cursor, decode_cursor, encode_cursor
+from app.auth.auth_bearer import get_current_user, get_websocket_user
+from app.services.annotation import RenderOptions
+from app.services.history_export import EXPORT_FORMATS, accepts_gzip, export_chunks, gzip_chunks
+from app.services.metrics import stage
+from app.services.scan_jobs import FINISHED, ScanJobFailed, get_scan_job_queue, scan_job_workers
 from app.services.skin_analysis import SkinAnalysisService
+from app.services.worker_pool import AnalysisPoolSaturated
+from app.utils.responses import MongoJSONResponse
+from app.services.image_store import (
+    IMAGE_URL_PREFIX, get_image_store, image_url_for, is_valid_key, sniff_content_type, to_data_url
+)
+from app.database.analyses import progress_buckets, progress_totals
 from app.database.mongodb import db
+from app.database.region_codec import expand_regions, store_regions
+from app.database.write_behind import flush_user_analyses, get_write_buffer, save_analyses, save_analysis
+from bson import ObjectId
 from datetime import datetime, timedelta
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-router = APIRouter(prefix="/skin-analysis", tags=["Skin Analysis"])
+# Analysis and history routes return MongoJSONResponse themselves, which skips
+# FastAPI's per-row validation and jsonable_encoder pass over the results
+router = APIRouter(prefix="/skin-analysis", tags=["Skin Analysis"], default_response_class=MongoJSONResponse)
 skin_service = SkinAnalysisService()
 
 class ImageAnalysisRequest(BaseModel):
     image_data: str  # Base64 encoded image
 
+class BatchAnalysisRequest(BaseModel):
+    images: List[str] = Field(..., min_length=1, max_length=settings.ANALYSIS_MAX_BATCH_SIZE)  # Base64 encoded images
+
+def render_options(
+    render: Literal["none", "thumbnail", "full"] = "none",
+    image_format: Literal["jpeg", "webp"] = Query("jpeg", alias="format"),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    max_dim: Optional[int] = Query(None, ge=16, le=8192)
+) -> RenderOptions:
+    """Annotated image options for the analyze endpoints (annotation is opt-in)"""
+    return RenderOptions(render, image_format, quality, max_dim)
+
+async def _store_images(result: Dict, image_bytes: bytes, render: RenderOptions) -> Dict:
+    """Store the source photo (for later rendering) and the annotated image if one was rendered"""
+    # Uploads over the working resolution come back with a downscaled copy to store instead
+    source_image = result.pop("source_image", None) or image_bytes
+    store = get_image_store()
+    with stage("store_image"):
+        source_id = await store.put(source_image, sniff_content_type(source_image[:12]))
+    result["source_image_url"] = image_url_for(source_id)
+    
+    annotated_image = result.get("annotated_image")
+    if annotated_image is None:
+        result["image_url"] = None
+        result["annotated_image"] = None
+        return result
+    with stage("store_image"):
+        image_id = await store.put(annotated_image, render.content_type)
+    result["image_url"] = image_url_for(image_id)
+    result["annotated_image"] = to_data_url(annotated_image, render.content_type)
+    return result
+
+def _analysis_document(user_id: str, result: Dict, analysis_id: Optional[ObjectId] = None) -> Dict:
+    """Build the skin_analyses document for a successful analysis"""
+    # The id is chosen here so the response can point at /annotated/{analysis_id}
+    analysis_id = analysis_id or ObjectId()
+    result["analysis_id"] = str(analysis_id)
+    return {
+        "_id": analysis_id,
+        "user_id": user_id,
+        "image_url": result["image_url"],
+        "source_image_url": result["source_image_url"],
+        "face_location": result["face_location"],
+        "image_size": result.get("image_size"),
+        "skin_score": result["skin_score"],
+        "detected_issues": result["detected_issues"],
+        "redness_areas": store_regions(result["redness_areas"]),
+        "dark_spot_areas": store_regions(result["dark_spot_areas"]),
+        "recommendations": result["recommendations"],
+        "analysis_date": datetime.utcnow()
+    }
+
 @router.post("/analyze")
 async def analyze_skin(
     request: ImageAnalysisRequest,
+    render: RenderOptions = Depends(render_options),
+    durable: bool = False,
     current_user: UserModel = Depends(get_current_user)
 ):
+    try:
+        image_bytes = skin_service._decode_base64(request.image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # Perform skin analysis
-    result = await skin_service.analyze_skin(request.image_data)
+    result = await skin_service.analyze_image(image_bytes, render)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     
-    # Save analysis to database
-    analysis_data = {
-        "user_id": str(current_user.id),
-        "image_url": result["annotated_image"],
-        "skin_score": result["skin_score"],
-        "detected_issues": result["detected_issues"],
-        "redness_areas": result["redness_areas"],
-        "dark_spot_areas": result["dark_spot_areas"],
-        "recommendations": result["recommendations"],
-        "analysis_date": datetime.utcnow()
+    await _store_images(result, image_bytes, render)
+    
+    # Save analysis to database (queued unless the client asks for durable)
+    await save_analysis(_analysis_document(str(current_user.id), result), durable)
+    
+    return MongoJSONResponse(result)
+
+def _check_content_length(request: Request):
+    """Reject uploads whose Content-Length is malformed (400) or over the limit (413)"""
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        return
+    try:
+        length = int(content_length)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if length < 0:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if length > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+
+# The multipart body is documented by the `file` parameter; the raw image/* variant is added here
+RAW_IMAGE_BODY = {
+    "requestBody": {
+        "content": {
+            "image/*": {"schema": {"type": "string", "format": "binary"}},
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
+        }
     }
+}
+
+@router.post("/analyze/upload", openapi_extra=RAW_IMAGE_BODY)
+async def analyze_skin_upload(
+    request: Request,
+    file: Optional[UploadFile] = File(None, description="Image to analyze (multipart/form-data)"),
+    render: RenderOptions = Depends(render_options),
+    durable: bool = False,
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Analyze an image sent as multipart `file` or as a raw image/* body (no base64)"""
+    _check_content_length(request)
     
-    await db.database.skin_analyses.insert_one(analysis_data)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        if file is None:
+            raise HTTPException(status_code=400, detail="Missing 'file' upload")
+        image_bytes = await file.read()
+    elif content_type.startswith("image/") or content_type.startswith("application/octet-stream"):
+        image_bytes = await request.body()
+    else:
+        raise HTTPException(status_code=415, detail="Send multipart/form-data or an image/* body")
+    
+    if len(image_bytes) > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    
+    # Perform skin analysis on the raw bytes
+    result = await skin_service.analyze_image(image_bytes, render)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    await _store_images(result, image_bytes, render)
+    
+    # Save analysis to database (queued unless the client asks for durable)
+    await save_analysis(_analysis_document(str(current_user.id), result), durable)
+    
+    return MongoJSONResponse(result)
+
+@router.post("/analyze-batch")
+async def analyze_skin_batch(
+    request: BatchAnalysisRequest,
+    render: RenderOptions = Depends(render_options),
+    durable: bool = False,
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Analyze a burst of images; failures are reported per item"""
+    # Decode each image once; its bytes are analyzed and then stored
+    results: List[Optional[Dict]] = [None] * len(request.images)
+    images: Dict[int, bytes] = {}
+    for index, image_data in enumerate(request.images):
+        try:
+            images[index] = skin_service._decode_base64(image_data)
+        except Exception as e:
+            results[index] = {"success": False, "error": str(e)}
+    analyzed = await skin_service.analyze_batch(list(images.values()), render)
+    for index, result in zip(images, analyzed):
+        results[index] = result
+    
+    await asyncio.gather(*(
+        _store_images(result, images[index], render)
+        for index, result in enumerate(results) if result["success"]
+    ))
+    
+    # Save every successful analysis in one round trip
+    documents = [
+        _analysis_document(str(current_user.id), result)
+        for result in results if result["success"]
+    ]
+    await save_analyses(documents, durable)
+    
+    return MongoJSONResponse({
+        "results": [{"index": index, **result} for index, result in enumerate(results)],
+        "succeeded": len(documents),
+        "failed": len(results) - len(documents)
+    })
+
+class _LatestFrame:
+    """Newest frame from a live-scan client; frames not yet picked up are dropped"""
+    def __init__(self):
+        self.frame: Optional[bytes] = None
+        self.fresh = False
+        self.capture: Optional[RenderOptions] = None
+        self.dropped = 0
+        self._ready = asyncio.Event()
+    
+    def put(self, frame: bytes):
+        if self.fresh:
+            self.dropped += 1
+        self.frame = frame
+        self.fresh = True
+        self._ready.set()
+    
+    def request_capture(self, render: RenderOptions):
+        self.capture = render
+        self._ready.set()
+    
+    async def take(self) -> Tuple[Optional[bytes], bool, Optional[RenderOptions], int]:
+        """Wait for work: (frame, is new frame, capture render options if requested, frames dropped)"""
+        await self._ready.wait()
+        self._ready.clear()
+        taken = (self.frame, self.fresh, self.capture, self.dropped)
+        self.fresh = False
+        self.capture = None
+        self.dropped = 0
+        return taken
+
+async def _capture_live_frame(current_user: UserModel, frame: bytes, render: RenderOptions) -> Dict:
+    """Run the full analysis on a live frame and save it like /analyze does"""
+    result = await skin_service.analyze_image(frame, render)
+    if result["success"]:
+        await _store_images(result, frame, render)
+        await save_analysis(_analysis_document(str(current_user.id), result))
+    return result
+
+async def _process_live_frames(websocket: WebSocket, latest: _LatestFrame, current_user: UserModel):
+    track = None
+    frame_number = 0
+    while True:
+        frame, fresh, capture, dropped = await latest.take()
+        try:
+            if capture is not None:
+                if frame is None:
+                    await websocket.send_json({"type": "capture", "success": False, "error": "No frame received yet"})
+                else:
+                    result = await _capture_live_frame(current_user, frame, capture)
+                    await websocket.send_json({"type": "capture", **result})
+            elif fresh:
+                frame_number += 1
+                result, track = await skin_service.analyze_live_frame(frame, track)
+                await websocket.send_json({
+                    "type": "frame", "frame": frame_number, "dropped": dropped, **result
+                })
+        except AnalysisPoolSaturated as e:
+            # Skip this frame; the client keeps streaming and a later one gets through
+            await websocket.send_json({
+                "type": "capture" if capture is not None else "frame",
+                "success": False,
+                "error": str(e),
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            # Any other failure (a broken pool, an undecodable frame) is reported
+            # for this frame only, so the client is never left waiting on a dead task
+            print(f"Live scan frame failed: {e!r}")
+            await websocket.send_json({
+                "type": "capture" if capture is not None else "frame",
+                "success": False,
+                "error": "Analysis failed"
+            })
+
+@router.websocket("/live")
+async def live_scan(
+    websocket: WebSocket,
+    current_user: UserModel = Depends(get_websocket_user)
+):
+    """Live scan: binary JPEG frames in, per-frame scores out; {"type": "capture", "render": ...} saves the latest frame"""
+    await websocket.accept()
+    latest = _LatestFrame()
+    processor = asyncio.create_task(_process_live_frames(websocket, latest, current_user))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                frame = message["bytes"]
+            else:
+                try:
+                    payload = json.loads(message.get("text") or "")
+                except ValueError:
+                    await websocket.send_json({"type": "error", "error": "Messages must be JSON or binary frames"})
+                    continue
+                if payload.get("type") == "capture":
+                    try:
+                        latest.request_capture(RenderOptions(
+                            payload.get("render", "none"), payload.get("format", "jpeg")
+                        ))
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "error": str(e)})
+                    continue
+                if payload.get("type") != "frame" or "image_data" not in payload:
+                    await websocket.send_json({"type": "error", "error": "Unknown message"})
+                    continue
+                try:
+                    frame = skin_service._decode_base64(payload["image_data"])
+                except Exception as e:
+                    await websocket.send_json({"type": "error", "error": str(e)})
+                    continue
+            
+            if len(frame) > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+                await websocket.send_json({"type": "error", "error": "Image is too large"})
+                continue
+            latest.put(frame)
+    finally:
+        processor.cancel()
+        await asyncio.gather(processor, return_exceptions=True)
+
+async def run_scan_job(job: Dict) -> Dict:
+    """Run a queued scan and save it like /analyze does; the job keeps the result minus the inline image"""
+    image_bytes = await get_image_store().read(job["image_key"])
+    if image_bytes is None:
+        raise ScanJobFailed("The job's image is no longer stored")
+    render = RenderOptions(**job["render"])
+    result = await skin_service.analyze_image(image_bytes, render)
+    if not result["success"]:
+        raise ScanJobFailed(result["error"])
     
+    await _store_images(result, image_bytes, render)
+    # A job can run again (its lease ran out, or the worker died before finishing
+    # it); saving under the job's id makes the rerun's insert a duplicate, which
+    # is skipped along with its progress rollup
+    await save_analysis(_analysis_document(job["user_id"], result, analysis_id=job["_id"]), job["durable"])
+    # The annotated image is served from image_url
+    result.pop("annotated_image", None)
     return result
 
-@router.get("/history", response_model=List[SkinAnalysisModel])
+def _job_response(job: Dict) -> Dict:
+    """Public view of a scan job"""
+    response = {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"].isoformat(),
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None
+    }
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return response
+
+async def _user_job(job_id: str, current_user: UserModel) -> Dict:
+    job = None
+    if ObjectId.is_valid(job_id):
+        job = await get_scan_job_queue().get(ObjectId(job_id), str(current_user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs", status_code=202)
+async def create_scan_job(
+    request: ImageAnalysisRequest,
+    render: RenderOptions = Depends(render_options),
+    durable: bool = False,
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Queue a scan and return its job id at once; poll /jobs/{id} or stream /jobs/{id}/events"""
+    try:
+        image_bytes = skin_service._decode_base64(request.image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Empty image")
+    if len(image_bytes) > settings.ANALYSIS_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    
+    # The photo goes to the image store (it becomes the analysis's source image), not into the job
+    with stage("store_image"):
+        image_key = await get_image_store().put(image_bytes, sniff_content_type(image_bytes[:12]))
+    job = await get_scan_job_queue().enqueue(
+        str(current_user.id),
+        image_key,
+        {"mode": render.mode, "image_format": render.image_format, "quality": render.quality, "max_dim": render.max_dim},
+        durable
+    )
+    return MongoJSONResponse(
+        _job_response(job),
+        status_code=202,
+        headers={"Location": f"{router.prefix}/jobs/{job['_id']}"}
+    )
+
+@router.get("/jobs/stats")
+async def get_scan_job_stats(current_user: UserModel = Depends(get_current_user)):
+    """The caller's jobs per status, age of their oldest queued job, and job workers in this process
+    (queue-wide depth and age are the scan_jobs_* series on /metrics)"""
+    return {**await get_scan_job_queue().stats(str(current_user.id)), "workers": scan_job_workers()}
+
+@router.get("/jobs/{job_id}")
+async def get_scan_job(job_id: str, current_user: UserModel = Depends(get_current_user)):
+    return MongoJSONResponse(_job_response(await _user_job(job_id, current_user)))
+
+# Comment line sent on an otherwise idle event stream so proxies keep it open
+SSE_KEEPALIVE_SECONDS = 15
+
+@router.get("/jobs/{job_id}/events")
+async def stream_scan_job(job_id: str, current_user: UserModel = Depends(get_current_user)):
+    """Server-sent events: "status" on each change, then "done" or "failed" with the result and the stream ends"""
+    job = await _user_job(job_id, current_user)
+    queue = get_scan_job_queue()
+    
+    async def events():
+        current = job
+        last_status = None
+        last_sent = time.monotonic()
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                event = last_status if last_status in FINISHED else "status"
+                yield f"event: {event}\ndata: {json.dumps(_job_response(current))}\n\n"
+                last_sent = time.monotonic()
+                if last_status in FINISHED:
+                    return
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            # Jobs run by this process wake us at once; others are seen on the next poll
+            await queue.wait_for_change(settings.SCAN_JOB_POLL_MS / 1000)
+            current = await queue.get(job["_id"], job["user_id"])
+            if current is None:
+                return
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/history", response_model=Union[List[SkinAnalysisModel], AnalysisHistoryPage])
 async def get_analysis_history(
     current_user: UserModel = Depends(get_current_user),
-    limit: int = 10,
-    skip: int = 0
+    limit: int = Query(10, ge=1, le=100),
+    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_image: bool = False,
+    include_regions: bool = True
 ):
-    analyses = await db.database.skin_analyses.find(
-        {"user_id": str(current_user.id)}
-    ).sort("analysis_date", -1).skip(skip).limit(limit).to_list(limit)
+    """List analyses newest first, paged by keyset cursor or legacy skip"""
+    # Clients that pass cursor (empty for the first page) get {items, next_cursor};
+    # legacy clients keep the plain list, with the next cursor in X-Next-Cursor
+    query = {"user_id": str(current_user.id)}
+    if cursor:
+        try:
+            query.update(after_cursor(*decode_cursor(cursor)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Scans this user just took may still be queued for saving
+    await flush_user_analyses(str(current_user.id))
+    
+    # Leave the image payload out unless the client asks for it, and the
+    # region detail (decoded below if stored packed) if the client doesn't want it
+    projection = {}
+    if not include_image:
+        projection["image_url"] = 0
+    if not include_regions:
+        projection.update({"redness_areas": 0, "dark_spot_areas": 0})
+    find = db.database.skin_analyses.find(query, projection or None).sort(
+        [("analysis_date", -1), ("_id", -1)]
+    )
+    if cursor is None and skip:
+        find = find.skip(skip)
     
-    return [SkinAnalysisModel(**analysis) for analysis in analyses]
+    # Fetch one extra document to know whether another page exists
+    with stage("db_history"):
+        analyses = await find.limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(analyses) > limit:
+        analyses = analyses[:limit]
+        next_cursor = encode_cursor(analyses[-1]["analysis_date"], analyses[-1]["_id"])
+    
+    # Documents go out as Motor returns them, packed regions decoded;
+    # response_model only documents the shape
+    if include_regions:
+        analyses = [expand_regions(analysis) for analysis in analyses]
+    if cursor is None:
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return MongoJSONResponse(analyses, headers=headers)
+    return MongoJSONResponse({"items": analyses, "next_cursor": next_cursor})
+
+@router.get("/export")
+async def export_analysis_history(
+    request: Request,
+    current_user: UserModel = Depends(get_current_user),
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    batch_size: int = Query(settings.EXPORT_BATCH_SIZE, ge=1, le=settings.EXPORT_MAX_BATCH_SIZE),
+    include_image: bool = False,
+    include_regions: bool = True
+):
+    """Stream the user's full analysis history, oldest first, as NDJSON or CSV"""
+    await flush_user_analyses(str(current_user.id))
+    chunks = export_chunks(str(current_user.id), export_format, batch_size, include_image, include_regions)
+    filename = f"skin-analysis-history-{datetime.utcnow():%Y%m%d}.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        chunks = gzip_chunks(chunks, settings.EXPORT_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[export_format], headers=headers)
+
+def _issue_count(field: str, count_key: str) -> Dict:
+    """Issue count from detected_issues, falling back to the region array length"""
+    # Packed (columnar) regions aren't arrays, so $size would fail on them; they carry n
+    return {"$ifNull": [
+        f"$detected_issues.{count_key}",
+        {"$cond": [
+            {"$isArray": f"${field}"},
+            {"$size": f"${field}"},
+            {"$ifNull": [f"${field}.n", 0]}
+        ]}
+    ]}
 
 @router.get("/progress")
 async def get_skin_progress(
     current_user: UserModel = Depends(get_current_user),
-    days: int = 30
+    days: int = 30,
+    granularity: Literal["scan", "day", "week", "month"] = "scan"
 ):
+    # Scans this user just took may still be queued for saving
+    await flush_user_analyses(str(current_user.id))
+    
     # Get analyses from the last N days
     from_date = datetime.utcnow() - timedelta(days=days)
+    if granularity != "scan":
+        return await _rollup_progress(str(current_user.id), from_date, granularity)
+    
+    # Per-scan series still reads the analyses; project only what the chart needs
+    pipeline = [
+        {"$match": {
+            "user_id": str(current_user.id),
+            "analysis_date": {"$gte": from_date}
+        }},
+        {"$sort": {"analysis_date": 1}},
+        {"$project": {
+            "_id": 0,
+            "date": "$analysis_date",
+            "score": "$skin_score",
+            "redness": _issue_count("redness_areas", "redness_count"),
+            "dark_spots": _issue_count("dark_spot_areas", "dark_spots_count")
+        }},
+        {"$facet": {
+            "series": [{"$match": {}}],
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "average_score": {"$avg": "$score"},
+                    "first_score": {"$first": "$score"},
+                    "last_score": {"$last": "$score"}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "average_score": 1,
+                    "improvement": {"$subtract": ["$last_score", "$first_score"]}
+                }}
+            ]
+        }}
+    ]
     
-    analyses = await db.database.skin_analyses.find({
-        "user_id": str(current_user.id),
-        "analysis_date": {"$gte": from_date}
-    }).sort("analysis_date", 1).to_list(None)
+    with stage("db_progress"):
+        facets = await db.database.skin_analyses.aggregate(pipeline).to_list(1)
+    series, summary = facets[0]["series"], facets[0]["summary"]
     
-    if not analyses:
+    if not series:
         return {"message": "No analysis data available for the specified period"}
     
     # Extract progress data
     progress_data = {
-        "dates": [analysis["analysis_date"].isoformat() for analysis in analyses],
-        "skin_scores": [analysis["skin_score"] for analysis in analyses],
-        "redness_counts": [len(analysis["redness_areas"]) for analysis in analyses],
-        "dark_spot_counts": [len(analysis["dark_spot_areas"]) for analysis in analyses],
-        "average_score": sum(analysis["skin_score"] for analysis in analyses) / len(analyses),
-        "improvement": analyses[-1]["skin_score"] - analyses[0]["skin_score"] if len(analyses) > 1 else 0
+        "dates": [point["date"].isoformat() for point in series],
+        "skin_scores": [point["score"] for point in series],
+        "redness_counts": [point["redness"] for point in series],
+        "dark_spot_counts": [point["dark_spots"] for point in series],
+        "average_score": summary[0]["average_score"],
+        "improvement": summary[0]["improvement"]
+    }
+    
+    return progress_data
+
+async def _rollup_progress(user_id: str, from_date: datetime, unit: str) -> Dict:
+    """Progress per day, week or month from the skin_progress rollups (no scan of analyses)"""
+    # The window is widened to whole buckets, so the first one may include older scans
+    buckets = await progress_buckets(user_id, unit, from_date)
+    if not buckets:
+        return {"message": "No analysis data available for the specified period"}
+    
+    scans = sum(bucket["scans"] for bucket in buckets)
+    totals = await progress_totals(user_id)
+    return {
+        "dates": [bucket["start"].isoformat() for bucket in buckets],
+        "skin_scores": [bucket["score_sum"] / bucket["scans"] for bucket in buckets],
+        "redness_counts": [bucket["redness_sum"] / bucket["scans"] for bucket in buckets],
+        "dark_spot_counts": [bucket["dark_spots_sum"] / bucket["scans"] for bucket in buckets],
+        "scan_counts": [bucket["scans"] for bucket in buckets],
+        "average_score": sum(bucket["score_sum"] for bucket in buckets) / scans,
+        "improvement": buckets[-1]["last"]["score"] - buckets[0]["first"]["score"],
+        "total_scans": totals.get("scans", scans)
     }
+
+def _parse_range(range_header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into inclusive (start, end)"""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else length - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(length - int(end_text), 0)
+            end = length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, min(end, length - 1)
+
+@router.get("/image/{image_id}")
+async def get_analysis_image(
+    image_id: str,
+    request: Request,
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Stream a stored analysis image, with ETag and Range support"""
+    if not is_valid_key(image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Only serve images referenced by one of the user's analyses (saved or still queued)
+    image_url = image_url_for(image_id)
+    user_id = str(current_user.id)
+    owned = get_write_buffer().find(
+        lambda analysis: analysis["user_id"] == user_id
+        and image_url in (analysis["image_url"], analysis["source_image_url"])
+    ) or await db.database.skin_analyses.find_one(
+        {"user_id": user_id, "$or": [{"image_url": image_url}, {"source_image_url": image_url}]},
+        {"_id": 1}
+    )
+    if not owned:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    store = get_image_store()
+    stored = await store.stat(image_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Keys are content hashes, so the key itself is a strong validator
+    etag = f'"{image_id}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable"
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = _parse_range(request.headers.get("range"), stored.length)
+    if byte_range and request.headers.get("if-range", etag) != etag:
+        byte_range = None
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stored.length}"
+    else:
+        start, end = 0, stored.length - 1
+        status_code = 200
+    headers["Content-Length"] = str(end - start + 1)
+    
+    return StreamingResponse(
+        store.stream(image_id, start, end),
+        status_code=status_code,
+        media_type=stored.content_type,
+        headers=headers
+    )
+
+@router.get("/annotated/{analysis_id}")
+async def get_annotated_image(
+    analysis_id: str,
+    render: Literal["thumbnail", "full"] = "full",
+    image_format: Literal["jpeg", "webp"] = Query("jpeg", alias="format"),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    max_dim: Optional[int] = Query(None, ge=16, le=8192),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Render an analysis's annotated image on demand from its stored photo and regions"""
+    if not ObjectId.is_valid(analysis_id):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    # An analysis just returned to the client may still be queued for saving
+    query = {"_id": ObjectId(analysis_id), "user_id": str(current_user.id)}
+    analysis = get_write_buffer().find(
+        lambda analysis: all(analysis[field] == value for field, value in query.items())
+    ) or await db.database.skin_analyses.find_one(
+        query,
+        {"_id": 0, "source_image_url": 1, "face_location": 1, "image_size": 1, "skin_score": 1,
+         "redness_areas": 1, "dark_spot_areas": 1}
+    )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis = expand_regions(analysis)
+    
+    # Analyses saved before source photos were kept can't be re-rendered
+    source_image_url = analysis.get("source_image_url") or ""
+    image_bytes = None
+    if source_image_url.startswith(IMAGE_URL_PREFIX) and analysis.get("face_location"):
+        image_bytes = await get_image_store().read(source_image_url[len(IMAGE_URL_PREFIX):])
+    if image_bytes is None:
+        raise HTTPException(status_code=404, detail="No source image stored for this analysis")
+    
+    options = RenderOptions(render, image_format, quality, max_dim)
+    try:
+        content = await skin_service.render_annotation(image_bytes, analysis, options)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     
-    return progress_data
\ No newline at end of file
+    # Same analysis and parameters always render the same image
+    return Response(
+        content=content,
+        media_type=options.content_type,
+        headers={"Cache-Control": "private, max-age=86400"}
+    )
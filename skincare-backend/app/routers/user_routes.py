@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from app.database.models import UserModel
 from app.auth.auth_bearer import get_current_user
+from app.auth.user_cache import user_cache
 from app.database.mongodb import db
 from bson import ObjectId
 
@@ -36,6 +37,11 @@ async def update_user_info(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # Drop the cached profile so the next request sees the update
+    user_cache.invalidate(current_user.username)
+    if "username" in update_data:
+        user_cache.invalidate(update_data["username"])
+    
     # Get and return updated user
     updated_user = await db.database.users.find_one({"_id": ObjectId(current_user.id)})
     return UserModel(**updated_user)
@@ -0,0 +1,196 @@
+"""Pre-forking server entry point.
+
+Imports the app and loads the face detector models once in the master, then
+forks uvicorn workers that share them copy-on-write and accept on one socket.
+Each worker gets a share of the CPUs (optionally pinned to it) and sizes its
+analysis pool and OpenCV threads to that share. Once the workers are up the
+master prints their startup time and memory (RSS and PSS, which splits shared
+pages between processes).
+
+Usage: python -m app.serve --workers 4 [--pin-cpus] [--no-preload] [--exit-after-report]
+"""
+import argparse
+import os
+import select
+import signal
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+import uvicorn
+from app.config import settings
+from app.services.worker_pool import available_cpus
+
+def cpu_slices(cpus: List[int], workers: int) -> List[List[int]]:
+    """Split the CPUs into one contiguous slice per worker (shared round-robin if too few)"""
+    if workers >= len(cpus):
+        return [[cpus[index % len(cpus)]] for index in range(workers)]
+    size, extra = divmod(len(cpus), workers)
+    slices, start = [], 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        slices.append(cpus[start:end])
+        start = end
+    return slices
+
+def _memory_kb(pid: int) -> Tuple[int, int]:
+    """(RSS, PSS) of a process in kB from /proc, zeros where unavailable"""
+    values = {}
+    for path in (f"/proc/{pid}/smaps_rollup", f"/proc/{pid}/status"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, rest = line.partition(":")
+                    if key in ("Rss", "Pss", "VmRSS"):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            continue
+    return values.get("Rss", values.get("VmRSS", 0)), values.get("Pss", 0)
+
+def _child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+class _ReportingServer(uvicorn.Server):
+    """uvicorn server that tells the master once it accepts connections"""
+    def __init__(self, config: uvicorn.Config, ready_fd: int, forked_at: float):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        startup_ms = (time.perf_counter() - self.forked_at) * 1000
+        os.write(self.ready_fd, f"{os.getpid()} {startup_ms:.1f}\n".encode())
+
+def _run_worker(config: uvicorn.Config, sock, cpus: List[int], pin: bool,
+                ready_fd: int, forked_at: float):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if pin and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    # Size this worker's analysis pool and OpenCV threads to its CPU share
+    settings.WORKER_CPU_BUDGET = len(cpus)
+    settings.ANALYSIS_POOL_WARM = True
+    import cv2
+    from app.services.worker_pool import opencv_threads
+    cv2.setNumThreads(opencv_threads(settings.ANALYSIS_POOL_SIZE or len(cpus)))
+
+    _ReportingServer(config, ready_fd, forked_at).run(sockets=[sock])
+
+def _print_report(workers: Dict[int, Tuple[int, List[int]]], ready: Dict[int, float],
+                  preload_ms: Optional[float]):
+    if preload_ms is None:
+        print("Models preloaded: no (each worker loads its own)")
+    else:
+        print(f"Models preloaded in master: {preload_ms:.0f} ms (shared copy-on-write)")
+    print(f"{'worker':>6} {'pid':>7} {'cpus':>8} {'ready_ms':>9} {'rss_mb':>7} {'pss_mb':>7} "
+          f"{'pool':>5} {'pool_pss_mb':>11}")
+    total_pss = 0
+    for pid, (index, cpus) in sorted(workers.items(), key=lambda item: item[1][0]):
+        rss, pss = _memory_kb(pid)
+        pool = _child_pids(pid)
+        pool_pss = sum(_memory_kb(child)[1] for child in pool)
+        total_pss += pss + pool_pss
+        cpu_list = ",".join(str(cpu) for cpu in cpus)
+        print(f"{index:>6} {pid:>7} {cpu_list:>8} {ready.get(pid, float('nan')):>9.0f} "
+              f"{rss / 1024:>7.1f} {pss / 1024:>7.1f} {len(pool):>5} {pool_pss / 1024:>11.1f}")
+    master_pss = _memory_kb(os.getpid())[1]
+    print(f"Total PSS incl. master: {(total_pss + master_pss) / 1024:.1f} MB")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS)
+    parser.add_argument("--pin-cpus", action="store_true", default=settings.SERVE_PIN_CPUS)
+    parser.add_argument("--no-preload", action="store_true",
+                        help="load the app and models in each worker (for comparison)")
+    parser.add_argument("--exit-after-report", action="store_true",
+                        help="shut down once the startup report is printed")
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    preload_ms = None
+    if not args.no_preload:
+        import app.main  # noqa: F401 -- app, cv2 and numpy imported once, before the fork
+        from app.services.skin_analysis import preload_models
+        preload_models()
+        preload_ms = (time.perf_counter() - started_at) * 1000
+
+    config = uvicorn.Config("app.main:app", host=args.host, port=args.port)
+    sock = config.bind_socket()
+    slices = cpu_slices(available_cpus(), args.workers)
+    ready_read, ready_write = os.pipe()
+
+    workers: Dict[int, Tuple[int, List[int]]] = {}
+
+    def spawn(index: int):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            try:
+                _run_worker(config, sock, slices[index], args.pin_cpus, ready_write, forked_at)
+            finally:
+                os._exit(0)
+        workers[pid] = (index, slices[index])
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(args.workers):
+        spawn(index)
+
+    # Collect "pid startup_ms" lines until every worker is serving
+    ready: Dict[int, float] = {}
+    buffer = b""
+    deadline = time.monotonic() + 120
+    while len(ready) < args.workers and not stopping and time.monotonic() < deadline:
+        readable, _, _ = select.select([ready_read], [], [], 1.0)
+        if readable:
+            buffer += os.read(ready_read, 4096)
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                pid, startup_ms = line.split()
+                ready[int(pid)] = float(startup_ms)
+    _print_report(workers, ready, preload_ms)
+    sys.stdout.flush()
+
+    if args.exit_after_report:
+        stop(signal.SIGTERM, None)
+
+    # Supervise: restart workers that die unless we are shutting down
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in workers:
+            continue
+        index, _ = workers.pop(pid)
+        if not stopping:
+            print(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(index)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
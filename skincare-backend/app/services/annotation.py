@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+from typing import Dict, Optional
+from app.config import settings
+from app.services.metrics import stage
+from app.utils.image_processing import PreparedImage
+
+RENDER_MODES = ("none", "thumbnail", "full")
+
+# format -> (file extension for imencode, content type, quality flag)
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+class RenderOptions:
+    """How (and whether) to render the annotated image for an analysis"""
+    def __init__(self, mode: str = "none", image_format: str = "jpeg",
+                 quality: Optional[int] = None, max_dim: Optional[int] = None):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {mode}")
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {image_format}")
+        self.mode = mode
+        self.image_format = image_format
+        self.quality = quality or settings.ANNOTATION_QUALITY
+        # Thumbnails are capped even without an explicit max_dim
+        if mode == "thumbnail":
+            max_dim = min(max_dim or settings.ANNOTATION_THUMBNAIL_MAX_DIM, settings.ANNOTATION_THUMBNAIL_MAX_DIM)
+        self.max_dim = max_dim or 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    @property
+    def content_type(self) -> str:
+        return IMAGE_FORMATS[self.image_format][1]
+
+def draw_annotations(image: np.ndarray, scale: float, result: Dict) -> np.ndarray:
+    """Draw the face box, regions and score onto image (in place)"""
+    # Stored coordinates are in original-photo pixels, regions relative to the face
+    face = result["face_location"]
+    x, y = face["x"] * scale, face["y"] * scale
+    w, h = face["width"] * scale, face["height"] * scale
+    px = lambda value: int(round(value))
+    font_scale = min(1.0, image.shape[1] / 512)
+    label_scale = font_scale / 2
+
+    # Draw face rectangle
+    cv2.rectangle(image, (px(x), px(y)), (px(x + w), px(y + h)), (0, 255, 0), 2)
+
+    # Draw redness areas
+    for area in result["redness_areas"]:
+        rx = x + area["x"] * scale
+        ry = y + area["y"] * scale
+        rw = area["width"] * scale
+        rh = area["height"] * scale
+        cv2.rectangle(image, (px(rx), px(ry)), (px(rx + rw), px(ry + rh)), (0, 0, 255), 2)
+        cv2.putText(image, "R", (px(rx), px(ry) - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, label_scale, (0, 0, 255), 1)
+
+    # Draw dark spots
+    for spot in result["dark_spot_areas"]:
+        sx = x + spot["x"] * scale
+        sy = y + spot["y"] * scale
+        sw = spot["width"] * scale
+        sh = spot["height"] * scale
+        cv2.ellipse(image, (px(sx + sw / 2), px(sy + sh / 2)),
+                    (px(sw / 2), px(sh / 2)), 0, 0, 360, (255, 0, 255), 2)
+        cv2.putText(image, "D", (px(sx), px(sy) - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, label_scale, (255, 0, 255), 1)
+
+    # Add skin score
+    cv2.putText(image, f"Skin Score: {result['skin_score']:.1f}",
+                (10, px(30 * font_scale)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), 2)
+
+    return image
+
+def encode_image(image: np.ndarray, options: RenderOptions) -> bytes:
+    """Encode an image in the requested format and quality"""
+    extension, _, quality_flag = IMAGE_FORMATS[options.image_format]
+    with stage("encode"):
+        ok, buffer = cv2.imencode(extension, image, [quality_flag, options.quality])
+    if not ok:
+        raise ValueError(f"Could not encode {options.image_format} image")
+    return buffer.tobytes()
+
+def render_annotation(prepared: PreparedImage, result: Dict, options: RenderOptions) -> bytes:
+    """Render the annotated image for an analysis result from its decoded photo"""
+    # Shrink before drawing so thumbnails never touch a full-size canvas. The
+    # decoded image is not used afterwards, so it is drawn on without a copy.
+    with stage("annotate"):
+        image = prepared.image
+        scale = prepared.scale
+        height, width = image.shape[:2]
+        if options.max_dim and max(height, width) > options.max_dim:
+            resize = options.max_dim / max(height, width)
+            image = cv2.resize(
+                image,
+                (max(1, int(round(width * resize))), max(1, int(round(height * resize)))),
+                interpolation=cv2.INTER_AREA,
+            )
+            scale *= resize
+        draw_annotations(image, scale, result)
+    return encode_image(image, options)
@@ -1,22 +1,107 @@
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+from app.config import settings
+from app.services.face_detectors import FaceDetector, create_face_detector
+from app.services.metrics import stage
+from app.services.tiling import (
+    Tile, TileComponents, get_tile_executor, merge_tile_components, otsu_threshold, tile_grid,
+    tile_min_pixels, tile_workers
+)
+
+# Region area as a fraction of the face above which severity steps up
+SEVERITY_RATIOS = (0.001, 0.005)
+SEVERITY_NAMES = ("mild", "moderate", "severe")
+
+_CROSS_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+# (dx, dy) of the 8 neighbours in circular order, 4-neighbours at even indices
+_CONTOUR_DIRECTIONS = ((1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1))
+_SQRT2 = float(np.sqrt(2))
+
+def _fill_holes(mask: np.ndarray) -> np.ndarray:
+    """The mask with enclosed background filled in, i.e. what outer contours enclose"""
+    # Background 4-connected to the image edge stays background (findContours'
+    # notion of outside); everything else, including blobs inside holes, is blob
+    outside = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(outside, None, (0, 0), 255, flags=4)
+    return cv2.bitwise_or(mask, cv2.bitwise_not(outside[1:-1, 1:-1]))
+
+def _border_pixels(mask: np.ndarray) -> np.ndarray:
+    """Non-zero on blob pixels with a background 4-neighbour (what findContours traces)"""
+    return cv2.subtract(
+        mask, cv2.erode(mask, _CROSS_KERNEL, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+    )
+
+def _contour_sums(mask: np.ndarray, labels: np.ndarray, count: int, with_perimeter: bool,
+                  core: Tuple[slice, slice] = (slice(None), slice(None)),
+                  origin: Tuple[int, int] = (0, 0)) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Per-label doubled area and (axis, diagonal) step counts of the outer contours findContours traces
+
+    labels covers mask[core]; origin is the (y, x) of the mask in the image.
+    Sums from different tiles of one blob add up to the whole blob's.
+    """
+    # The traced contour leaves a border pixel once per run of background
+    # neighbours that includes a 4-neighbour (a lone background diagonal is cut
+    # across), stepping to the first blob pixel after the run. Spurs are walked
+    # out and back, as in the traced contour. Summing x*dy - y*dx over the
+    # steps is the shoelace formula contourArea applies to the same points.
+    foreground = np.pad(mask > 0, 1)
+    points = cv2.findNonZero(np.ascontiguousarray(_border_pixels(mask)[core]))
+    points = points.reshape(-1, 2).astype(np.int64) if points is not None else np.zeros((0, 2), np.int64)
+    xs, ys = points[:, 0], points[:, 1]
+    border_labels = labels[ys, xs]
+    ys = ys + (core[0].start or 0)
+    xs = xs + (core[1].start or 0)
+    neighbours = [foreground[ys + 1 + dy, xs + 1 + dx] for dx, dy in _CONTOUR_DIRECTIONS]
+    
+    ys = ys + origin[0]
+    xs = xs + origin[1]
+    doubled = np.zeros(len(ys), np.int64)
+    steps = np.zeros((2, len(ys)), np.int64)
+    for k, (dx, dy) in enumerate(_CONTOUR_DIRECTIONS):
+        if k % 2 == 0:
+            step = neighbours[k] & ~neighbours[k - 1] & ~neighbours[k - 2]
+        else:
+            step = neighbours[k] & ~neighbours[k - 1]
+        steps[k % 2] += step
+        doubled += step * (xs * dy - ys * dx)
+    
+    # Integer sums, so tiles add up to exactly the single pass's numbers
+    doubled_areas = np.bincount(border_labels, weights=doubled, minlength=count)
+    step_counts = None
+    if with_perimeter:
+        step_counts = np.stack([np.bincount(border_labels, weights=row, minlength=count) for row in steps], axis=1)
+    return doubled_areas, step_counts
+
+def _blob_shapes(stats: np.ndarray, doubled_areas: np.ndarray,
+                 step_counts: Optional[np.ndarray]) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """Areas and perimeters from the per-label sums; drops the background row"""
+    areas = np.abs(doubled_areas) / 2
+    perimeters = None
+    if step_counts is not None:
+        perimeters = step_counts[:, 0] + _SQRT2 * step_counts[:, 1]
+        perimeters = perimeters[1:]
+    # Row 0 is the background
+    return areas[1:], perimeters, stats[1:]
 
 class FaceAnalyzer:
-    def __init__(self):
-        # Load Haar Cascade for face detection
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
+    def __init__(self, detector: Optional[FaceDetector] = None):
+        # Face detection backend (Haar cascade or YuNet, see FACE_DETECTOR_BACKEND)
+        self.detector = detector or create_face_detector()
     
-    def detect_face(self, image: np.ndarray) -> Tuple[bool, List[Tuple[int, int, int, int]]]:
-        """Detect faces in the image"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-        return len(faces) > 0, faces.tolist() if len(faces) > 0 else []
+    def detect_face(self, image: np.ndarray, min_size: Optional[int] = None,
+                    max_size: Optional[int] = None) -> Tuple[bool, List[Tuple[int, int, int, int]]]:
+        """Detect faces in the image, optionally only between min_size and max_size pixels"""
+        # Without an explicit hint, bound the search by the configured fractions of the frame
+        shorter_edge = min(image.shape[:2])
+        if min_size is None:
+            min_size = int(shorter_edge * settings.FACE_MIN_SIZE_FRACTION)
+        if max_size is None:
+            max_size = int(shorter_edge * settings.FACE_MAX_SIZE_FRACTION)
+        with stage("detect_face"):
+            faces = self.detector.detect(image, min_size, max_size)
+        return len(faces) > 0, faces
     
     def extract_face_roi(self, image: np.ndarray, face_rect: Tuple[int, int, int, int]) -> np.ndarray:
         """Extract face region of interest"""
@@ -25,16 +110,59 @@ class FaceAnalyzer:
     
     def detect_skin_issues(self, face_roi: np.ndarray) -> Dict:
         """Detect redness and dark spots in face ROI"""
+        if self._should_tile(face_roi):
+            return self._tiled_skin_issues(face_roi)
+        
         # Convert to different color spaces for analysis
-        hsv = cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV)
-        lab = cv2.cvtColor(face_roi, cv2.COLOR_BGR2LAB)
+        with stage("color"):
+            hsv = cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV)
+            lab = cv2.cvtColor(face_roi, cv2.COLOR_BGR2LAB)
+            red_mask = self._redness_mask(hsv)
+        
+        return self._skin_issues(face_roi, red_mask, lab)
+    
+    def detect_skin_issues_batch(self, face_rois: List[np.ndarray]) -> List[Dict]:
+        """Detect skin issues for several face ROIs in one pass"""
+        # Same-shape ROIs are stacked so the per-pixel stages (color conversion,
+        # red thresholding) run once per group. Morphology, Otsu and contours
+        # still run per ROI, so results match detect_skin_issues exactly.
+        results: List[Dict] = [None] * len(face_rois)
+        groups: Dict[Tuple, List[int]] = {}
+        for index, face_roi in enumerate(face_rois):
+            if self._should_tile(face_roi):
+                # Large ROIs are split into tiles instead
+                results[index] = self.detect_skin_issues(face_roi)
+            else:
+                groups.setdefault(face_roi.shape, []).append(index)
+        
+        for shape, indices in groups.items():
+            height = shape[0]
+            with stage("color"):
+                stacked = np.concatenate([face_rois[i] for i in indices], axis=0)
+                hsv = cv2.cvtColor(stacked, cv2.COLOR_BGR2HSV)
+                lab = cv2.cvtColor(stacked, cv2.COLOR_BGR2LAB)
+                red_mask = self._redness_mask(hsv)
+            
+            for offset, index in enumerate(indices):
+                rows = slice(offset * height, (offset + 1) * height)
+                results[index] = self._skin_issues(
+                    face_rois[index], red_mask[rows], lab[rows]
+                )
         
+        return results
+    
+    def _skin_issues(self, face_roi: np.ndarray, red_mask: np.ndarray, lab: np.ndarray) -> Dict:
         # Detect redness
-        redness_areas = self._detect_redness(face_roi, hsv)
+        with stage("redness"):
+            redness_areas = self._redness_regions(red_mask, face_roi.shape)
         
         # Detect dark spots
-        dark_spots = self._detect_dark_spots(face_roi, lab)
+        with stage("dark_spots"):
+            dark_spots = self._detect_dark_spots(face_roi, lab)
         
+        return self._issues(face_roi, redness_areas, dark_spots)
+    
+    def _issues(self, face_roi: np.ndarray, redness_areas: List[Dict], dark_spots: List[Dict]) -> Dict:
         # Calculate skin score
         skin_score = self._calculate_skin_score(redness_areas, dark_spots, face_roi.shape)
         
@@ -46,6 +174,10 @@ class FaceAnalyzer:
     
     def _detect_redness(self, image: np.ndarray, hsv: np.ndarray) -> List[Dict]:
         """Detect red/inflamed areas"""
+        return self._redness_regions(self._redness_mask(hsv), image.shape)
+    
+    def _redness_mask(self, hsv: np.ndarray) -> np.ndarray:
+        """Threshold red hues (per-pixel, so safe on stacked ROIs)"""
         # Define range for red colors in HSV
         lower_red1 = np.array([0, 50, 50])
         upper_red1 = np.array([10, 255, 255])
@@ -55,31 +187,23 @@ class FaceAnalyzer:
         # Create masks for red regions
         mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
         mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        red_mask = mask1 + mask2
-        
+        return mask1 + mask2
+    
+    def _redness_regions(self, red_mask: np.ndarray, image_shape: Tuple) -> List[Dict]:
+        """Clean up the red mask and extract redness regions"""
+        red_mask = self._clean_redness_mask(red_mask)
+        areas, _, stats = self._component_shapes(red_mask, with_perimeter=False)
+        return self._redness_from_shapes(areas, stats, image_shape)
+    
+    def _clean_redness_mask(self, red_mask: np.ndarray) -> np.ndarray:
         # Apply morphological operations
         kernel = np.ones((5, 5), np.uint8)
         red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_CLOSE, kernel)
-        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
-        
-        # Find contours
-        contours, _ = cv2.findContours(red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        redness_areas = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area > 100:  # Filter small areas
-                x, y, w, h = cv2.boundingRect(contour)
-                redness_areas.append({
-                    "x": int(x),
-                    "y": int(y),
-                    "width": int(w),
-                    "height": int(h),
-                    "area": float(area),
-                    "severity": self._calculate_severity(area, image.shape)
-                })
-        
-        return redness_areas
+        return cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
+    
+    def _redness_from_shapes(self, areas: np.ndarray, stats: np.ndarray, image_shape: Tuple) -> List[Dict]:
+        keep = np.flatnonzero(areas > 100)  # Filter small areas
+        return self._regions(stats[keep], areas[keep], image_shape)
     
     def _detect_dark_spots(self, image: np.ndarray, lab: np.ndarray) -> List[Dict]:
         """Detect dark spots/pigmentation"""
@@ -92,44 +216,140 @@ class FaceAnalyzer:
         # Invert to get dark regions
         dark_regions = cv2.bitwise_not(thresh)
         
+        dark_regions = self._clean_dark_mask(dark_regions)
+        areas, perimeters, stats = self._component_shapes(dark_regions, with_perimeter=True)
+        return self._dark_spots_from_shapes(areas, perimeters, stats, image.shape)
+    
+    def _clean_dark_mask(self, dark_regions: np.ndarray) -> np.ndarray:
         # Apply morphological operations
         kernel = np.ones((3, 3), np.uint8)
-        dark_regions = cv2.morphologyEx(dark_regions, cv2.MORPH_CLOSE, kernel)
-        
-        # Find contours
-        contours, _ = cv2.findContours(dark_regions, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        dark_spots = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if 50 < area < 5000:  # Filter by size
-                x, y, w, h = cv2.boundingRect(contour)
-                # Additional check for circular dark spots
-                circularity = 4 * np.pi * area / (cv2.arcLength(contour, True) ** 2)
-                if circularity > 0.4:
-                    dark_spots.append({
-                        "x": int(x),
-                        "y": int(y),
-                        "width": int(w),
-                        "height": int(h),
-                        "area": float(area),
-                        "circularity": float(circularity),
-                        "severity": self._calculate_severity(area, image.shape)
-                    })
-        
-        return dark_spots
-    
-    def _calculate_severity(self, area: float, image_shape: Tuple) -> str:
-        """Calculate severity based on area relative to face size"""
-        total_area = image_shape[0] * image_shape[1]
-        ratio = area / total_area
-        
-        if ratio < 0.001:
-            return "mild"
-        elif ratio < 0.005:
-            return "moderate"
-        else:
-            return "severe"
+        return cv2.morphologyEx(dark_regions, cv2.MORPH_CLOSE, kernel)
+    
+    def _dark_spots_from_shapes(self, areas: np.ndarray, perimeters: np.ndarray, stats: np.ndarray,
+                                image_shape: Tuple) -> List[Dict]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            circularity = np.where(perimeters > 0, 4 * np.pi * areas / perimeters ** 2, 0.0)
+        # Filter by size, then keep the roughly circular spots
+        keep = np.flatnonzero((areas > 50) & (areas < 5000) & (circularity > 0.4))
+        return self._regions(stats[keep], areas[keep], image_shape, circularity[keep])
+    
+    def _component_shapes(self, mask: np.ndarray, with_perimeter: bool) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+        """Per-blob area, perimeter and stats row for the 8-connected blobs of a mask"""
+        # One labelling pass replaces findContours(RETR_EXTERNAL) plus a
+        # per-contour loop, with the same areas and perimeters. Holes are
+        # filled first, so blobs inside other blobs merge into them and areas
+        # include hole pixels, as with outer contours.
+        mask = _fill_holes(mask)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        return _blob_shapes(stats, *_contour_sums(mask, labels, count, with_perimeter))
+    
+    def _should_tile(self, face_roi: np.ndarray) -> bool:
+        height, width = face_roi.shape[:2]
+        return (
+            height * width >= tile_min_pixels()
+            and max(height, width) > settings.ANALYSIS_TILE_SIZE
+            and tile_workers() > 1
+        )
+    
+    def _tiled_skin_issues(self, face_roi: np.ndarray) -> Dict:
+        """detect_skin_issues on overlapping tiles in parallel threads, with identical output"""
+        height, width = face_roi.shape[:2]
+        grid = tile_grid(height, width, settings.ANALYSIS_TILE_SIZE)
+        tiles = [tile for tile_row in grid for tile in tile_row]
+        executor = get_tile_executor()
+        red_mask = np.empty((height, width), np.uint8)
+        l_channel = np.empty((height, width), np.uint8)
+        
+        # Per-pixel stages on the tile cores; their L histograms add up to the whole ROI's
+        with stage("color"):
+            hists = list(executor.map(
+                lambda tile: self._tile_color(face_roi, red_mask, l_channel, tile), tiles
+            ))
+            threshold = otsu_threshold(np.sum(hists, axis=0))
+        
+        # Mask cleanup per tile, reading the halo around it
+        red_clean = np.empty((height, width), np.uint8)
+        dark_clean = np.empty((height, width), np.uint8)
+        with stage("tiles"):
+            list(executor.map(
+                lambda tile: self._tile_masks(red_mask, l_channel, threshold, red_clean, dark_clean, tile), tiles
+            ))
+            # A hole can span tiles, so it is filled over the whole ROI
+            red_clean, dark_clean = executor.map(_fill_holes, (red_clean, dark_clean))
+            # Border maps and labelling per tile
+            parts = list(executor.map(
+                lambda tile: (
+                    self._tile_shapes(red_clean[tile.window], tile, with_perimeter=False),
+                    self._tile_shapes(dark_clean[tile.window], tile, with_perimeter=True),
+                ), tiles
+            ))
+        columns = len(grid[0])
+        red_parts = [[red for red, _ in parts[row:row + columns]] for row in range(0, len(parts), columns)]
+        dark_parts = [[dark for _, dark in parts[row:row + columns]] for row in range(0, len(parts), columns)]
+        
+        # Join blobs cut by tile seams, then filter as the single pass does
+        with stage("redness"):
+            stats, doubled_areas, _ = merge_tile_components(grid, red_parts, with_perimeter=False)
+            areas, _, stats = _blob_shapes(stats, doubled_areas, None)
+            redness_areas = self._redness_from_shapes(areas, stats, face_roi.shape)
+        with stage("dark_spots"):
+            stats, doubled_areas, step_counts = merge_tile_components(grid, dark_parts, with_perimeter=True)
+            areas, perimeters, stats = _blob_shapes(stats, doubled_areas, step_counts)
+            dark_spots = self._dark_spots_from_shapes(areas, perimeters, stats, face_roi.shape)
+        
+        return self._issues(face_roi, redness_areas, dark_spots)
+    
+    def _tile_color(self, face_roi: np.ndarray, red_mask: np.ndarray, l_channel: np.ndarray,
+                    tile: Tile) -> np.ndarray:
+        """Fill a tile core of the red mask and L channel; returns its L histogram"""
+        core = tile.core
+        roi = face_roi[core]
+        red_mask[core] = self._redness_mask(cv2.cvtColor(roi, cv2.COLOR_BGR2HSV))
+        lightness = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)[:, :, 0]
+        l_channel[core] = lightness
+        return np.bincount(lightness.ravel(), minlength=256)
+    
+    def _tile_masks(self, red_mask: np.ndarray, l_channel: np.ndarray, threshold: int,
+                    red_clean: np.ndarray, dark_clean: np.ndarray, tile: Tile):
+        """Fill a tile core of the cleaned red and dark masks"""
+        window, core = tile.window, tile.core_in_window
+        red_clean[tile.core] = self._clean_redness_mask(red_mask[window])[core]
+        # THRESH_BINARY_INV is the single pass's Otsu threshold followed by bitwise_not
+        _, dark = cv2.threshold(l_channel[window], threshold, 255, cv2.THRESH_BINARY_INV)
+        dark_clean[tile.core] = self._clean_dark_mask(dark)[core]
+    
+    def _tile_shapes(self, mask: np.ndarray, tile: Tile, with_perimeter: bool) -> TileComponents:
+        # Contour steps need the halo; labels cover only the core
+        core = tile.core_in_window
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(
+            np.ascontiguousarray(mask[core]), connectivity=8
+        )
+        sums = _contour_sums(mask, labels, count, with_perimeter, core, (tile.wy0, tile.wx0))
+        return TileComponents(labels, stats, *sums)
+    
+    def _regions(self, stats: np.ndarray, areas: np.ndarray, image_shape: Tuple,
+                 circularity: Optional[np.ndarray] = None) -> List[Dict]:
+        """Build region dicts for the blobs that survived filtering"""
+        severities = self._severities(areas, image_shape)
+        regions = []
+        for index, (x, y, w, h) in enumerate(stats[:, :4].tolist()):
+            region = {
+                "x": x,
+                "y": y,
+                "width": w,
+                "height": h,
+                "area": float(areas[index]),
+            }
+            if circularity is not None:
+                region["circularity"] = float(circularity[index])
+            region["severity"] = SEVERITY_NAMES[severities[index]]
+            regions.append(region)
+        return regions
+    
+    def _severities(self, areas: np.ndarray, image_shape: Tuple) -> np.ndarray:
+        """Severity index (into SEVERITY_NAMES) for each region area"""
+        ratio = areas / (image_shape[0] * image_shape[1])
+        return np.searchsorted(SEVERITY_RATIOS, ratio, side="right")
     
     def _calculate_skin_score(self, redness_areas: List[Dict], dark_spots: List[Dict], 
                              face_shape: Tuple) -> float:
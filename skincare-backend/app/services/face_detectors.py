@@ -0,0 +1,114 @@
+import os
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+from app.config import settings
+
+FACE_DETECTOR_BACKENDS = ("auto", "haar", "yunet")
+
+class FaceDetector:
+    """Face detector backend: returns (x, y, w, h) boxes, best candidate first"""
+    name = "base"
+
+    def detect(self, image: np.ndarray, min_size: int = 0, max_size: int = 0) -> List[Tuple[int, int, int, int]]:
+        """Detect faces between min_size and max_size pixels wide (0 = unbounded)"""
+        raise NotImplementedError
+
+class HaarFaceDetector(FaceDetector):
+    """Viola-Jones cascade (the original detector)"""
+    name = "haar"
+
+    def __init__(self, scale_factor: float = 1.3, min_neighbors: int = 5):
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+
+    def detect(self, image: np.ndarray, min_size: int = 0, max_size: int = 0) -> List[Tuple[int, int, int, int]]:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # The size hint limits the image pyramid to the scales that can hold such a face
+        faces = self.face_cascade.detectMultiScale(
+            gray, self.scale_factor, self.min_neighbors,
+            minSize=(min_size, min_size), maxSize=(max_size, max_size)
+        )
+        return faces.tolist() if len(faces) > 0 else []
+
+class YuNetFaceDetector(FaceDetector):
+    """OpenCV's YuNet CNN detector (cv2.FaceDetectorYN) loaded from an ONNX model"""
+    name = "yunet"
+
+    # Face width YuNet still finds reliably; inputs are shrunk so the size hint lands here
+    MIN_FACE_PIXELS = 48
+
+    def __init__(self, model_path: str, score_threshold: float = 0.8,
+                 nms_threshold: float = 0.3, top_k: int = 50):
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path}")
+        self.detector = cv2.FaceDetectorYN.create(
+            model_path, "", (320, 320), score_threshold, nms_threshold, top_k
+        )
+
+    def detect(self, image: np.ndarray, min_size: int = 0, max_size: int = 0) -> List[Tuple[int, int, int, int]]:
+        height, width = image.shape[:2]
+
+        # YuNet is single-pass, so a large minimum face size is turned into a
+        # smaller input instead of a narrower pyramid
+        scale = 1.0
+        if min_size > self.MIN_FACE_PIXELS:
+            scale = self.MIN_FACE_PIXELS / min_size
+            image = cv2.resize(
+                image,
+                (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        self.detector.setInputSize((image.shape[1], image.shape[0]))
+        _, detections = self.detector.detect(image)
+        if detections is None:
+            return []
+
+        # Rows are [x, y, w, h, landmarks..., score], highest score first
+        faces = []
+        for x, y, w, h in (detections[:, :4] / scale).tolist():
+            # Boxes can extend past the frame; clip so they slice cleanly
+            left, top = max(0, int(round(x))), max(0, int(round(y)))
+            right, bottom = min(width, int(round(x + w))), min(height, int(round(y + h)))
+            if right <= left or bottom <= top:
+                continue
+            if max_size and max(right - left, bottom - top) > max_size:
+                continue
+            faces.append((left, top, right - left, bottom - top))
+        return faces
+
+def face_detector_backend(backend: Optional[str] = None) -> str:
+    """Resolve the configured backend name ("auto" picks YuNet when its model is present)"""
+    backend = backend or settings.FACE_DETECTOR_BACKEND
+    if backend not in FACE_DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown face detector backend: {backend}")
+    if backend == "auto":
+        return "yunet" if os.path.isfile(settings.FACE_DETECTOR_MODEL_PATH) else "haar"
+    return backend
+
+def check_face_detector() -> str:
+    """Resolve the configured backend at startup; fails if YuNet is configured without its model"""
+    backend = face_detector_backend()
+    model_path = settings.FACE_DETECTOR_MODEL_PATH
+    if backend == "yunet" and not os.path.isfile(model_path):
+        raise RuntimeError(
+            f"FACE_DETECTOR_BACKEND=yunet but the YuNet model is missing: {model_path} (see models/README.md)"
+        )
+    if settings.FACE_DETECTOR_BACKEND == "auto" and backend == "haar":
+        print(f"Warning: YuNet model not found at {model_path}, face detection falls back to "
+              f"the Haar cascade (see models/README.md)")
+    return backend
+
+def create_face_detector(backend: Optional[str] = None) -> FaceDetector:
+    """Build the configured face detector backend"""
+    backend = face_detector_backend(backend)
+    if backend == "yunet":
+        return YuNetFaceDetector(
+            settings.FACE_DETECTOR_MODEL_PATH,
+            score_threshold=settings.FACE_DETECTOR_SCORE_THRESHOLD,
+        )
+    return HaarFaceDetector()
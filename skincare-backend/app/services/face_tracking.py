@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# Faces are matched at this width, so tracking costs the same for any face size
+TEMPLATE_WIDTH = 48
+
+# How far the face may move between frames, as a fraction of its size
+SEARCH_MARGIN = 0.5
+
+# Tracking state is a plain dict so it can travel to and from process-pool workers:
+#   rect         (x, y, w, h) face box in working-image pixels
+#   frame_shape  (height, width) of the frames it belongs to
+#   scale        template pixels per image pixel
+#   template     grayscale face patch from the last keyframe
+#   frames       frames tracked since that keyframe
+#   score        last normalized match score (1.0 on a keyframe)
+
+def _gray_resized(image: np.ndarray, scale: float) -> np.ndarray:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    return cv2.resize(
+        gray,
+        (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+        interpolation=cv2.INTER_AREA,
+    )
+
+def start_track(image: np.ndarray, face_rect: Tuple[int, int, int, int]) -> Dict:
+    """Tracking state for a face found by full detection"""
+    x, y, w, h = face_rect
+    scale = TEMPLATE_WIDTH / w
+    return {
+        "rect": (x, y, w, h),
+        "frame_shape": image.shape[:2],
+        "scale": scale,
+        "template": _gray_resized(image[y:y + h, x:x + w], scale),
+        "frames": 0,
+        "score": 1.0,
+    }
+
+def update_track(image: np.ndarray, track: Dict) -> Optional[Dict]:
+    """Follow the face into the next frame by template matching; None if it can't be searched"""
+    if image.shape[:2] != track["frame_shape"]:
+        return None
+
+    # Only search a window around the previous box
+    x, y, w, h = track["rect"]
+    height, width = image.shape[:2]
+    margin_x, margin_y = int(w * SEARCH_MARGIN), int(h * SEARCH_MARGIN)
+    left, top = max(0, x - margin_x), max(0, y - margin_y)
+    right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+
+    scale = track["scale"]
+    window = _gray_resized(image[top:bottom, left:right], scale)
+    template = track["template"]
+    if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+        return None
+
+    scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (match_x, match_y) = cv2.minMaxLoc(scores)
+
+    # The box keeps its keyframe size; scale changes are picked up at the next keyframe
+    new_x = min(max(0, left + int(round(match_x / scale))), width - w)
+    new_y = min(max(0, top + int(round(match_y / scale))), height - h)
+    return {
+        **track,
+        "rect": (new_x, new_y, w, h),
+        "frames": track["frames"] + 1,
+        "score": float(score),
+    }
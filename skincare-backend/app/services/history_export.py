@@ -0,0 +1,135 @@
+"""Streaming export of a user's full analysis history.
+
+GET /skin-analysis/export reads the user's analyses oldest first from one
+Motor cursor and writes them out batch by batch, so memory stays at about
+one batch whatever the length of the history. Rows are NDJSON (the
+stored document, packed regions decoded) or CSV (one flat row per
+analysis, region lists as JSON cells). Bodies are gzip-compressed on the
+fly when the client accepts it.
+
+Like /history, analyses still queued in the write-behind buffer aren't
+included until they are flushed.
+"""
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Dict, List
+import orjson
+from app.database.mongodb import db
+from app.database.region_codec import REGION_FIELDS, expand_regions, region_count
+from app.utils.responses import dumps_mongo
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+_CSV_COLUMNS = [
+    "id", "analysis_date", "skin_score", "redness_count", "dark_spots_count",
+    "face_x", "face_y", "face_width", "face_height", "recommendations", "source_image_url",
+]
+
+def csv_columns(include_image: bool, include_regions: bool) -> List[str]:
+    columns = list(_CSV_COLUMNS)
+    if include_image:
+        columns.append("image_url")
+    if include_regions:
+        columns.extend(REGION_FIELDS)
+    return columns
+
+def _quality(params: str) -> float:
+    """The q weight of an Accept-Encoding entry (1 if absent, 0 if malformed)"""
+    for param in params.split(";"):
+        key, _, value = param.partition("=")
+        if key.strip() == "q":
+            try:
+                return float(value.strip())
+            except ValueError:
+                # Not a valid weight; fall back to the uncompressed response
+                return 0
+    return 1
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (q=0 refuses it)"""
+    for coding in accept_encoding.lower().split(","):
+        name, _, params = coding.partition(";")
+        if name.strip() in ("gzip", "*"):
+            return _quality(params) > 0
+    return False
+
+def _csv_row(analysis: Dict, columns: List[str]) -> List:
+    issues = analysis.get("detected_issues") or {}
+    face = analysis.get("face_location") or {}
+    date = analysis.get("analysis_date")
+    row = {
+        "id": str(analysis["_id"]),
+        "analysis_date": date.isoformat() if date else "",
+        "skin_score": analysis.get("skin_score"),
+        "redness_count": issues.get("redness_count", region_count(analysis.get("redness_areas"))),
+        "dark_spots_count": issues.get("dark_spots_count", region_count(analysis.get("dark_spot_areas"))),
+        "face_x": face.get("x"),
+        "face_y": face.get("y"),
+        "face_width": face.get("width"),
+        "face_height": face.get("height"),
+        "recommendations": "; ".join(analysis.get("recommendations") or []),
+        "source_image_url": analysis.get("source_image_url"),
+        "image_url": analysis.get("image_url"),
+    }
+    for field in REGION_FIELDS:
+        if field in columns:
+            row[field] = dumps_mongo(analysis.get(field) or []).decode()
+    return [row[column] for column in columns]
+
+class _CSVChunks:
+    """Renders CSV rows into bytes one chunk at a time"""
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def render(self, rows: List[List]) -> bytes:
+        self._writer.writerows(rows)
+        chunk = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+async def export_chunks(user_id: str, export_format: str, batch_size: int,
+                        include_image: bool, include_regions: bool) -> AsyncIterator[bytes]:
+    """The user's analyses as NDJSON or CSV, one chunk of bytes per batch_size documents"""
+    projection = {}
+    if not include_image:
+        projection["image_url"] = 0
+    if not include_regions:
+        projection.update({field: 0 for field in REGION_FIELDS})
+    cursor = db.database.skin_analyses.find({"user_id": user_id}, projection or None).sort(
+        [("analysis_date", 1), ("_id", 1)]
+    ).batch_size(batch_size)
+    
+    columns = csv_columns(include_image, include_regions)
+    csv_chunks = _CSVChunks()
+    if export_format == "csv":
+        yield csv_chunks.render([columns])
+    
+    def render(batch: List[Dict]) -> bytes:
+        if export_format == "csv":
+            return csv_chunks.render([_csv_row(analysis, columns) for analysis in batch])
+        return b"".join(dumps_mongo(analysis, orjson.OPT_APPEND_NEWLINE) for analysis in batch)
+    
+    batch = []
+    try:
+        async for analysis in cursor:
+            batch.append(expand_regions(analysis) if include_regions else analysis)
+            if len(batch) >= batch_size:
+                yield render(batch)
+                batch = []
+        if batch:
+            yield render(batch)
+    finally:
+        # Frees the server-side cursor when the client disconnects mid-export
+        await cursor.close()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int) -> AsyncIterator[bytes]:
+    """gzip a stream of chunks as they come, flushing after each so the client sees progress"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
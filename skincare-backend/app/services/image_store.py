@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import threading
+from typing import AsyncIterator, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+from app.database.mongodb import db
+
+IMAGE_URL_PREFIX = "/skin-analysis/image/"
+CHUNK_SIZE = 64 * 1024
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def image_key(data: bytes) -> str:
+    """Content-addressed key for an image"""
+    return hashlib.sha256(data).hexdigest()
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+def image_url_for(key: str) -> str:
+    return f"{IMAGE_URL_PREFIX}{key}"
+
+def to_data_url(data: bytes, content_type: str = "image/jpeg") -> str:
+    return f"data:{content_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+def from_data_url(data_url: str) -> Tuple[bytes, str]:
+    """Split a base64 data URL into (bytes, content type)"""
+    header, _, payload = data_url.partition(",")
+    content_type = header[len("data:"):].split(";")[0] or "application/octet-stream"
+    return base64.b64decode(payload), content_type
+
+def sniff_content_type(head: bytes) -> str:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+class StoredImage:
+    def __init__(self, key: str, length: int, content_type: str):
+        self.key = key
+        self.length = length
+        self.content_type = content_type
+
+class ImageStore:
+    """Content-addressed blob store for analysis images"""
+    async def put(self, data: bytes, content_type: str) -> str:
+        raise NotImplementedError
+
+    async def stat(self, key: str) -> Optional[StoredImage]:
+        raise NotImplementedError
+
+    def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) of a stored image"""
+        raise NotImplementedError
+
+    async def read(self, key: str) -> Optional[bytes]:
+        """Return a whole stored image, or None if it is missing"""
+        stored = await self.stat(key)
+        if not stored:
+            return None
+        return b"".join([chunk async for chunk in self.stream(key, 0, stored.length - 1)])
+
+class FileSystemImageStore(ImageStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per thread too: concurrent puts of the same image must not share a temp file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        key = image_key(data)
+        await asyncio.to_thread(self._write, key, data)
+        return key
+
+    def _stat(self, key: str) -> Optional[StoredImage]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                head = f.read(12)
+                length = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+        return StoredImage(key, length, sniff_content_type(head))
+
+    async def stat(self, key: str) -> Optional[StoredImage]:
+        return await asyncio.to_thread(self._stat, key)
+
+    async def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+class GridFSImageStore(ImageStore):
+    def __init__(self, bucket_name: str = "images"):
+        self.bucket_name = bucket_name
+
+    def _bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(db.database, bucket_name=self.bucket_name)
+
+    def _files(self):
+        return db.database[f"{self.bucket_name}.files"]
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        key = image_key(data)
+        if await self._files().find_one({"_id": key}, {"_id": 1}):
+            return key
+        try:
+            await self._bucket().upload_from_stream_with_id(
+                key, key, data, metadata={"contentType": content_type}
+            )
+        except DuplicateKeyError:
+            # Another request stored the same image first
+            if not await self._files().find_one({"_id": key}, {"_id": 1}):
+                # Leftover chunks from an interrupted upload, clear them and retry
+                await db.database[f"{self.bucket_name}.chunks"].delete_many({"files_id": key})
+                await self._bucket().upload_from_stream_with_id(
+                    key, key, data, metadata={"contentType": content_type}
+                )
+        return key
+
+    async def stat(self, key: str) -> Optional[StoredImage]:
+        doc = await self._files().find_one({"_id": key})
+        if not doc:
+            return None
+        content_type = (doc.get("metadata") or {}).get("contentType", "application/octet-stream")
+        return StoredImage(key, doc["length"], content_type)
+
+    async def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        grid_out = await self._bucket().open_download_stream(key)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+_image_store: Optional[ImageStore] = None
+
+def get_image_store() -> ImageStore:
+    """Return the configured image store backend"""
+    global _image_store
+    if _image_store is None:
+        if settings.IMAGE_STORE_BACKEND == "gridfs":
+            _image_store = GridFSImageStore()
+        elif settings.IMAGE_STORE_BACKEND == "filesystem":
+            _image_store = FileSystemImageStore(settings.IMAGE_STORE_PATH)
+        else:
+            raise ValueError(f"Unknown image store backend: {settings.IMAGE_STORE_BACKEND}")
+    return _image_store
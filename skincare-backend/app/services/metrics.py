@@ -0,0 +1,246 @@
+import bisect
+import cProfile
+import inspect
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from app.config import settings
+
+# Histograms are per process: each app.serve worker exposes its own /metrics
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels"""
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labels = labels
+        # label values -> (per-bucket counts incl. +Inf, sum)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in sorted(self._series.items())]
+        for label_values, counts, total in series:
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", _LATENCY_BUCKETS,
+    ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "skin_analysis_stage_seconds", "Time spent in each skin analysis stage (db_* are Mongo calls)",
+    _LATENCY_BUCKETS, ("stage",)
+)
+IMAGE_MEGAPIXELS = Histogram(
+    "skin_analysis_image_megapixels", "Uploaded photo size", (0.1, 0.3, 1, 2, 5, 8, 12, 20, 50)
+)
+FACE_FRACTION = Histogram(
+    "skin_analysis_face_fraction", "Detected face width as a fraction of the photo width",
+    (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1)
+)
+REGION_COUNT = Histogram(
+    "skin_analysis_regions", "Regions found per analysis", (0, 1, 2, 5, 10, 20, 50, 100, 200),
+    ("kind",)
+)
+JOB_WAIT_SECONDS = Histogram(
+    "skin_analysis_job_wait_seconds", "Time scan jobs spend queued before a worker claims them",
+    (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+
+_METRICS = (REQUEST_SECONDS, STAGE_SECONDS, IMAGE_MEGAPIXELS, FACE_FRACTION, REGION_COUNT, JOB_WAIT_SECONDS)
+
+StatsSource = Callable[[], Union[Dict, Awaitable[Dict]]]
+
+class StatsMetrics:
+    """Gauges and counters read from a component's stats() dict at scrape time"""
+    def __init__(self, prefix: str, help_text: str, source: StatsSource, counters: Tuple[str, ...]):
+        self.prefix = prefix
+        self.help_text = help_text
+        self.source = source
+        self.counters = counters
+
+    async def read(self) -> Dict:
+        # Sources that need the database (e.g. the scan job queue) are coroutines
+        stats = self.source()
+        return await stats if inspect.isawaitable(stats) else stats
+
+    def render(self, stats: Dict) -> List[str]:
+        lines = []
+        for key, value in stats.items():
+            # Numbers only (e.g. the pool's mode string is left out)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            counter = key in self.counters
+            name = f"{self.prefix}_{key}_total" if counter else f"{self.prefix}_{key}"
+            lines.append(f"# HELP {name} {self.help_text}: {key.replace('_', ' ')}")
+            lines.append(f"# TYPE {name} {'counter' if counter else 'gauge'}")
+            lines.append(f"{name} {value}")
+        return lines
+
+_STATS: List[StatsMetrics] = []
+
+def register_stats(prefix: str, help_text: str, source: StatsSource, counters: Tuple[str, ...] = ()):
+    """Export the numbers of source() (a dict, or a coroutine returning one) on /metrics;
+    keys in counters are counters, the rest gauges"""
+    _STATS.append(StatsMetrics(prefix, help_text, source, counters))
+
+async def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = [line for metric in _METRICS for line in metric.render()]
+    for metric in _STATS:
+        lines.extend(metric.render(await metric.read()))
+    return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """Stage durations of one request, or of one pool call to be shipped back to the app"""
+    def __init__(self, observe: bool = True):
+        # Pool workers don't observe: their registry is not the one /metrics serves
+        self.observe = observe
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.observe:
+            STAGE_SECONDS.observe(seconds, name)
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        stages = [*self.stages.items(), ("total", total_seconds)]
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+def record_stage(name: str, seconds: float):
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+    else:
+        STAGE_SECONDS.observe(seconds, name)
+
+def record_stages(stages: Dict[str, float]):
+    """Record stage timings returned by a pool worker"""
+    for name, seconds in stages.items():
+        record_stage(name, seconds)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a named stage (works around awaits too)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+@contextmanager
+def collect_stages(observe: bool = True) -> Iterator[StageTimer]:
+    timer = StageTimer(observe)
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+def observe_result(result: Dict):
+    """Record the photo size, face size and region counts of a fresh analysis"""
+    image_size = result["image_size"]
+    IMAGE_MEGAPIXELS.observe(image_size["width"] * image_size["height"] / 1e6)
+    if image_size["width"]:
+        FACE_FRACTION.observe(result["face_location"]["width"] / image_size["width"])
+    REGION_COUNT.observe(len(result["redness_areas"]), "redness")
+    REGION_COUNT.observe(len(result["dark_spot_areas"]), "dark_spot")
+
+def run_instrumented(label: str, fn: Callable, *args) -> Tuple[object, Dict[str, float]]:
+    """Run fn on a pool worker collecting its stage timings; returns (value, stages)
+
+    With PROFILE_SAMPLE_RATE set, a sample of calls run under cProfile and the
+    ones slower than PROFILE_SLOW_MS are dumped to PROFILE_DIR for pstats/snakeviz.
+    """
+    profiler = None
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+    with collect_stages(observe=False) as timer:
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            value = fn(*args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    if profiler is not None and elapsed_ms >= settings.PROFILE_SLOW_MS:
+        _dump_profile(profiler, label, elapsed_ms)
+    return value, timer.stages
+
+def _dump_profile(profiler: cProfile.Profile, label: str, elapsed_ms: float):
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            settings.PROFILE_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{elapsed_ms:.0f}ms.prof"
+        )
+        profiler.dump_stats(path)
+        print(f"Slow {label} ({elapsed_ms:.0f} ms) profiled to {path}")
+    except OSError as e:
+        print(f"Could not write profile: {e}")
+
+class MetricsMiddleware:
+    """Times every HTTP request and adds its stage timings as a Server-Timing header"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Streaming responses only report the stages finished before their first byte
+                header = timer.server_timing(time.perf_counter() - started)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        with collect_stages() as timer:
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                # Label by route template so /image/{image_id} stays one series
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - started,
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    str(status),
+                )
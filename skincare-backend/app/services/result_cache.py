@@ -0,0 +1,90 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from app.config import settings
+from app.database.mongodb import db
+from app.services.metrics import register_stats
+
+def _result_size(result: Dict) -> int:
+    """Rough in-memory footprint of a cached result: about 200 bytes per region plus fixed overhead"""
+    regions = len(result.get("redness_areas", [])) + len(result.get("dark_spot_areas", []))
+    return 200 * regions + 1024
+
+class ResultCache:
+    """Analysis results keyed by image content hash and analyzer version"""
+    # Per-process LRU bounded by total bytes, optionally backed by a shared
+    # Mongo collection whose TTL index expires old entries
+    def __init__(self, max_bytes: int, shared: bool, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[int, Dict]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_bytes: bytes, analyzer_version: str) -> str:
+        return f"{analyzer_version}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+        if self.shared:
+            doc = await db.database.analysis_cache.find_one({"_id": key})
+            if doc:
+                self.shared_hits += 1
+                self._remember(key, doc["result"])
+                return dict(doc["result"])
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: Dict):
+        # Callers modify the dict they get back, so keep our own copy
+        result = dict(result)
+        self._remember(key, result)
+        if self.shared:
+            await db.database.analysis_cache.replace_one(
+                {"_id": key},
+                {"_id": key, "result": result, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+
+    def _remember(self, key: str, result: Dict):
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= previous[0]
+        self._entries[key] = (size, result)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, (evicted_size, _) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+result_cache = ResultCache(
+    max_bytes=settings.ANALYSIS_CACHE_MAX_BYTES,
+    shared=settings.ANALYSIS_CACHE_SHARED,
+    ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+)
+register_stats(
+    "analysis_result_cache", "Repeat-scan result cache", result_cache.stats,
+    counters=("hits", "shared_hits", "misses")
+)
@@ -0,0 +1,258 @@
+"""Asynchronous scan jobs, queued in the skin_jobs collection.
+
+POST /skin-analysis/jobs stores the photo and inserts a queued job; worker
+tasks in every server process claim jobs with an atomic find-and-update that
+marks them running under a lease. A worker renews its lease while the scan
+runs. If it dies, the lease runs out and another worker picks the job up
+again, so a job survives restarts; handlers must cope with running twice.
+Jobs are given up on after SCAN_JOB_MAX_ATTEMPTS claims. Finished jobs keep their result until the
+TTL index on finished_at removes them.
+"""
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app.config import settings
+from app.database.mongodb import db
+from app.services.metrics import JOB_WAIT_SECONDS, register_stats
+from app.services.worker_pool import AnalysisPoolSaturated
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+FINISHED = ("done", "failed")
+
+class ScanJobFailed(Exception):
+    """A scan that can't succeed on retry (e.g. no face in the photo)"""
+
+class ScanJobQueue:
+    """The skin_jobs collection as a leased work queue"""
+    def __init__(self, lease_seconds: int, max_attempts: int):
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wakes this process's idle workers and event streams
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float):
+        """Wait until a job changes in this process, or timeout (other processes are polled)"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def enqueue(self, user_id: str, image_key: str, render: Dict, durable: bool) -> Dict:
+        now = datetime.utcnow()
+        job = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "status": "queued",
+            "image_key": image_key,
+            "render": render,
+            "durable": durable,
+            "attempts": 0,
+            "created_at": now,
+            "available_at": now,
+        }
+        await db.database.skin_jobs.insert_one(job)
+        self._notify()
+        return job
+
+    async def get(self, job_id: ObjectId, user_id: str) -> Optional[Dict]:
+        return await db.database.skin_jobs.find_one({"_id": job_id, "user_id": user_id})
+
+    async def claim(self, worker: str) -> Optional[Dict]:
+        """Take the oldest runnable job: an expired lease first, else the next queued one"""
+        now = datetime.utcnow()
+        update = {
+            "$set": {"status": "running", "worker": worker, "started_at": now, "lease_expires": now + self.lease},
+            "$inc": {"attempts": 1},
+        }
+        for query, sort in (
+            ({"status": "running", "lease_expires": {"$lt": now}}, [("lease_expires", 1)]),
+            ({"status": "queued", "available_at": {"$lte": now}}, [("available_at", 1)]),
+        ):
+            job = await db.database.skin_jobs.find_one_and_update(
+                query, update, sort=sort, return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                continue
+            if job["attempts"] > self.max_attempts:
+                await self.finish(job, error=f"Gave up after {self.max_attempts} attempts")
+                return await self.claim(worker)
+            JOB_WAIT_SECONDS.observe((now - job["created_at"]).total_seconds())
+            self._notify()
+            return job
+        return None
+
+    async def renew(self, job: Dict) -> bool:
+        """Extend a running job's lease; False if another worker has taken it over"""
+        result = await db.database.skin_jobs.update_one(
+            {"_id": job["_id"], "status": "running", "worker": job["worker"]},
+            {"$set": {"lease_expires": datetime.utcnow() + self.lease}}
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job: Dict, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Mark a job done (with its result) or failed (with an error)"""
+        fields = {"status": "failed" if error else "done", "finished_at": datetime.utcnow()}
+        if error:
+            fields["error"] = error
+        else:
+            fields["result"] = result
+        await db.database.skin_jobs.update_one(
+            {"_id": job["_id"], "worker": job.get("worker")},
+            {"$set": fields, "$unset": {"lease_expires": ""}}
+        )
+        self._notify()
+
+    async def release(self, job: Dict, delay_seconds: float, count_attempt: bool = True):
+        """Put a claimed job back in the queue, runnable again after delay_seconds"""
+        update = {
+            "$set": {"status": "queued", "available_at": datetime.utcnow() + timedelta(seconds=delay_seconds)},
+            "$unset": {"lease_expires": "", "worker": ""},
+        }
+        if not count_attempt:
+            update["$inc"] = {"attempts": -1}
+        await db.database.skin_jobs.update_one(
+            {"_id": job["_id"], "status": "running", "worker": job["worker"]}, update
+        )
+        self._notify()
+
+    async def stats(self, user_id: str) -> Dict:
+        """A user's jobs per status and the age of their oldest job still waiting"""
+        counts = {status: 0 for status in JOB_STATUSES}
+        async for row in db.database.skin_jobs.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]):
+            counts[row["_id"]] = row["count"]
+        oldest = await db.database.skin_jobs.find_one(
+            {"user_id": user_id, "status": "queued"}, {"created_at": 1}, sort=[("created_at", 1)]
+        )
+        return {
+            **counts,
+            "oldest_queued_seconds": (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0,
+        }
+
+    async def queue_stats(self) -> Dict:
+        """Queue-wide depth: queued and running jobs of all users and the oldest queued job's age"""
+        queued = await db.database.skin_jobs.count_documents({"status": "queued"})
+        running = await db.database.skin_jobs.count_documents({"status": "running"})
+        oldest = await db.database.skin_jobs.find_one(
+            {"status": "queued"}, {"created_at": 1}, sort=[("created_at", 1)]
+        )
+        return {
+            "queued": queued,
+            "running": running,
+            "oldest_queued_seconds": (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0,
+        }
+
+class ScanJobWorkers:
+    """Tasks in this process that claim and run scan jobs"""
+    def __init__(self, queue: ScanJobQueue, handler: Callable[[Dict], Awaitable[Dict]],
+                 count: int, poll_interval: float):
+        self.queue = queue
+        self.handler = handler
+        self.count = count
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = [asyncio.create_task(self._work(f"{prefix}:{n}")) for n in range(self.count)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, worker: str):
+        while True:
+            try:
+                job = await self.queue.claim(worker)
+            except Exception as e:
+                print(f"Scan job worker {worker} could not claim a job: {e}")
+                job = None
+            if job is None:
+                await self.queue.wait_for_change(self.poll_interval)
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Couldn't record the outcome; the lease runs out and the job is retried
+                print(f"Scan job {job['_id']} could not be finished: {e}")
+
+    async def _keep_lease(self, job: Dict):
+        while True:
+            await asyncio.sleep(self.queue.lease.total_seconds() / 3)
+            if not await self.queue.renew(job):
+                return
+
+    async def _run(self, job: Dict):
+        lease = asyncio.create_task(self._keep_lease(job))
+        try:
+            result = await self.handler(job)
+            await self.queue.finish(job, result=result)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job straight back rather than wait out the lease
+            await asyncio.shield(self.queue.release(job, 0, count_attempt=False))
+            raise
+        except AnalysisPoolSaturated as e:
+            await self.queue.release(job, e.retry_after, count_attempt=False)
+        except ScanJobFailed as e:
+            await self.queue.finish(job, error=str(e))
+        except Exception as e:
+            if job["attempts"] >= self.queue.max_attempts:
+                await self.queue.finish(job, error=str(e))
+            else:
+                print(f"Scan job {job['_id']} failed (attempt {job['attempts']}), retrying: {e}")
+                await self.queue.release(job, 2 ** job["attempts"])
+        finally:
+            lease.cancel()
+
+_scan_job_queue: Optional[ScanJobQueue] = None
+_scan_job_workers: Optional[ScanJobWorkers] = None
+
+def get_scan_job_queue() -> ScanJobQueue:
+    """Return the process-wide scan job queue, creating it on first use"""
+    global _scan_job_queue
+    if _scan_job_queue is None:
+        _scan_job_queue = ScanJobQueue(settings.SCAN_JOB_LEASE_SECONDS, settings.SCAN_JOB_MAX_ATTEMPTS)
+    return _scan_job_queue
+
+def start_scan_job_workers(handler: Callable[[Dict], Awaitable[Dict]]):
+    """Start SCAN_JOB_WORKERS tasks running handler on claimed jobs"""
+    global _scan_job_workers
+    if settings.SCAN_JOB_WORKERS > 0 and _scan_job_workers is None:
+        _scan_job_workers = ScanJobWorkers(
+            get_scan_job_queue(), handler, settings.SCAN_JOB_WORKERS, settings.SCAN_JOB_POLL_MS / 1000
+        )
+        _scan_job_workers.start()
+
+async def stop_scan_job_workers():
+    global _scan_job_workers
+    if _scan_job_workers is not None:
+        await _scan_job_workers.stop()
+        _scan_job_workers = None
+
+async def _queue_stats() -> Dict:
+    try:
+        return await get_scan_job_queue().queue_stats()
+    except PyMongoError as e:
+        # Leave the series out of this scrape rather than fail /metrics
+        print(f"Could not read scan job queue stats: {e}")
+        return {}
+
+# Every process reports the same queue-wide numbers, read from Mongo at scrape time
+register_stats("scan_jobs", "Scan job queue, all users and processes", _queue_stats)
+
+def scan_job_workers() -> int:
+    """Job tasks running in this process"""
+    return _scan_job_workers.count if _scan_job_workers else 0
@@ -1,42 +1,313 @@
 import cv2
-import numpy as np
+import asyncio
 import base64
-from typing import Dict, List, Tuple
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.annotation import RenderOptions, encode_image, render_annotation
 from app.services.face_detection import FaceAnalyzer
+from app.services.face_detectors import face_detector_backend
+from app.services.face_tracking import start_track, update_track
+from app.services.metrics import observe_result, record_stages, run_instrumented, stage
+from app.services.result_cache import result_cache
+from app.services.worker_pool import AnalysisPoolSaturated, get_analysis_pool
+from app.utils.image_processing import PreparedImage, decode_image
+
+# Bump whenever analysis output changes; it is part of the result cache key
+ANALYZER_VERSION = "3"
+
+# Settings that change analysis output; results cached under other values are not reused
+RESULT_SETTINGS = (
+    "IMAGE_MAX_EDGE",
+    "FACE_DETECTOR_MODEL_PATH",
+    "FACE_DETECTOR_SCORE_THRESHOLD",
+    "FACE_MIN_SIZE_FRACTION",
+    "FACE_MAX_SIZE_FRACTION",
+    "ANALYSIS_TILE_SIZE",
+    "ANALYSIS_TILE_MIN_FRACTION",
+    "ANALYSIS_TILE_MIN_PIXELS",
+)
+
+def result_version() -> str:
+    """Cache version of a result: analyzer code, face detector backend and a hash of the result settings"""
+    values = repr([(name, getattr(settings, name)) for name in RESULT_SETTINGS])
+    settings_hash = hashlib.sha256(values.encode()).hexdigest()[:12]
+    return f"{ANALYZER_VERSION}-{face_detector_backend()}-{settings_hash}"
+
+# Uploads larger than the working resolution are stored downscaled, as JPEG
+SOURCE_IMAGE_OPTIONS = RenderOptions("full", "jpeg", settings.SOURCE_IMAGE_QUALITY)
+
+# Each pool worker (process or thread) keeps its own service and FaceAnalyzer
+_worker_state = threading.local()
+
+# Models loaded by preload_models() before app.serve forks its workers
+_preloaded_service: Optional["SkinAnalysisService"] = None
+
+def preload_models():
+    """Load the detector models in this process so forked children share them copy-on-write"""
+    global _preloaded_service
+    _preloaded_service = SkinAnalysisService()
+    _preloaded_service.face_analyzer
+
+def warm_worker(opencv_threads: int = 0, use_preloaded: bool = False):
+    """Pool initializer: size OpenCV's thread pool and load the detector models once per worker"""
+    if opencv_threads:
+        cv2.setNumThreads(opencv_threads)
+    if use_preloaded and _preloaded_service is not None:
+        # A forked process worker already holds the preloaded models
+        _worker_state.service = _preloaded_service
+    else:
+        _worker_state.service = SkinAnalysisService()
+        _worker_state.service.face_analyzer
+
+def _worker_service() -> "SkinAnalysisService":
+    if getattr(_worker_state, "service", None) is None:
+        warm_worker()
+    return _worker_state.service
+
+# Worker entry points return (value, stage timings) for Server-Timing and /metrics
+
+def _analyze_in_worker(image_bytes: bytes, render: Optional[RenderOptions] = None) -> Tuple[Dict, Dict]:
+    return run_instrumented("analyze", _worker_service().analyze_image_bytes, image_bytes, render)
+
+def _analyze_batch_in_worker(images: List[bytes], render: Optional[RenderOptions] = None) -> Tuple[List[Dict], Dict]:
+    return run_instrumented("analyze_batch", _worker_service().analyze_image_batch, images, render)
+
+def _render_in_worker(image_bytes: bytes, result: Dict, options: RenderOptions) -> Tuple[bytes, Dict]:
+    return run_instrumented("render", _worker_service().render_image_bytes, image_bytes, result, options)
+
+def _source_image_in_worker(image_bytes: bytes) -> Tuple[Optional[bytes], Dict]:
+    return run_instrumented("source_image", _worker_service().source_image_bytes, image_bytes)
+
+def _analyze_live_frame_in_worker(image_bytes: bytes, track: Optional[Dict]) -> Tuple[Tuple[Dict, Optional[Dict]], Dict]:
+    # Workers are shared across connections, so the track travels with each call
+    return run_instrumented("live_frame", _worker_service().analyze_live_frame_bytes, image_bytes, track)
+
+async def _run_on_pool(fn, *args):
+    """Run a worker entry point and record the stage timings it sends back"""
+    with stage("pool"):
+        value, stages = await get_analysis_pool().run(fn, *args)
+    record_stages(stages)
+    return value
 
 class SkinAnalysisService:
     def __init__(self):
-        self.face_analyzer = FaceAnalyzer()
+        self._face_analyzer: Optional[FaceAnalyzer] = None
     
-    async def analyze_skin(self, image_data: str) -> Dict:
-        """Analyze skin from base64 encoded image"""
+    @property
+    def face_analyzer(self) -> FaceAnalyzer:
+        # Loaded on first use: the request-side service only hands work to the pool
+        if self._face_analyzer is None:
+            self._face_analyzer = FaceAnalyzer()
+        return self._face_analyzer
+    
+    async def analyze_skin(self, image_data: str, render: Optional[RenderOptions] = None) -> Dict:
+        """Analyze skin from base64 encoded image on the analysis pool"""
         try:
-            # Decode base64 image
-            image = self._decode_base64_image(image_data)
-            
-            # Detect face
-            has_face, faces = self.face_analyzer.detect_face(image)
-            
-            if not has_face:
-                return {
-                    "success": False,
-                    "error": "No face detected in the image"
-                }
+            image_bytes = self._decode_base64(image_data)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        return await self.analyze_image(image_bytes, render)
+    
+    async def analyze_image(self, image_bytes: bytes, render: Optional[RenderOptions] = None) -> Dict:
+        """Analyze skin from encoded image bytes (JPEG/PNG) on the analysis pool"""
+        try:
+            # Repeat submissions of the same photo skip the whole pipeline
+            with stage("cache"):
+                cache_key = await self._cache_key(image_bytes)
+                cached = await result_cache.get(cache_key)
+            if cached:
+                return await self._complete_cached(image_bytes, cached, render)
             
-            # Use the first detected face
-            face_rect = faces[0]
-            face_roi = self.face_analyzer.extract_face_roi(image, face_rect)
+            result = await _run_on_pool(_analyze_in_worker, image_bytes, render)
+            if result["success"]:
+                observe_result(result)
+                await self._cache_result(cache_key, result)
+            result["cached"] = False
+            return result
+        except AnalysisPoolSaturated:
+            raise
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def render_annotation(self, image_bytes: bytes, result: Dict, options: RenderOptions) -> bytes:
+        """Render the annotated image for a stored or cached result on the analysis pool"""
+        return await _run_on_pool(_render_in_worker, image_bytes, result, options)
+    
+    async def _cache_result(self, cache_key: str, result: Dict):
+        # Cache the render-independent analysis without image bytes; each caller
+        # renders what it asked for
+        images = {key: result.pop(key) for key in ("annotated_image", "source_image") if key in result}
+        await result_cache.set(cache_key, result)
+        result.update(images)
+    
+    async def _complete_cached(self, image_bytes: bytes, cached: Dict, render: Optional[RenderOptions]) -> Dict:
+        """Add the images a cached result was stored without: the render and the downscaled source"""
+        if render and render.enabled:
+            cached["annotated_image"] = await self.render_annotation(image_bytes, cached, render)
+        if cached.get("analysis_scale", 1) < 1:
+            cached["source_image"] = await _run_on_pool(_source_image_in_worker, image_bytes)
+        cached["cached"] = True
+        return cached
+    
+    async def _cache_key(self, image_bytes: bytes) -> str:
+        # hashlib releases the GIL, so hash multi-megabyte photos off the loop
+        return await asyncio.to_thread(result_cache.key, image_bytes, result_version())
+    
+    async def analyze_batch(self, images: List[bytes], render: Optional[RenderOptions] = None) -> List[Dict]:
+        """Analyze several encoded images, fanned out across the analysis pool"""
+        results: List[Dict] = [None] * len(images)
+        decoded = []
+        cache_keys = {}
+        for index, image_bytes in enumerate(images):
+            with stage("cache"):
+                cache_keys[index] = await self._cache_key(image_bytes)
+                cached = await result_cache.get(cache_keys[index])
+            if cached:
+                results[index] = await self._complete_cached(image_bytes, cached, render)
+            else:
+                decoded.append((index, image_bytes))
+        
+        if decoded:
+            # One contiguous chunk per worker keeps same-shape faces together
+            pool = get_analysis_pool()
+            chunk_count = min(pool.size, len(decoded))
+            chunk_size = -(-len(decoded) // chunk_count)
+            chunks = [decoded[i:i + chunk_size] for i in range(0, len(decoded), chunk_size)]
+            with stage("pool"):
+                chunk_results = await pool.map(
+                    _analyze_batch_in_worker,
+                    [([image_bytes for _, image_bytes in chunk], render) for chunk in chunks]
+                )
+            for chunk, (chunk_result, stages) in zip(chunks, chunk_results):
+                record_stages(stages)
+                for (index, _), result in zip(chunk, chunk_result):
+                    if result["success"]:
+                        observe_result(result)
+                        await self._cache_result(cache_keys[index], result)
+                    result["cached"] = False
+                    results[index] = result
+        
+        return results
+    
+    async def analyze_live_frame(self, image_bytes: bytes, track: Optional[Dict]) -> Tuple[Dict, Optional[Dict]]:
+        """Score one live-scan frame on the analysis pool; returns (result, new track)"""
+        return await _run_on_pool(_analyze_live_frame_in_worker, image_bytes, track)
+    
+    def analyze_image_bytes(self, image_bytes: bytes, render: Optional[RenderOptions] = None) -> Dict:
+        """Analyze skin from encoded image bytes (runs on a pool worker)"""
+        try:
+            prepared, face_rect = self._locate_face(image_bytes)
+            face_roi = self.face_analyzer.extract_face_roi(prepared.image, face_rect)
             
             # Analyze skin issues
             analysis_result = self.face_analyzer.detect_skin_issues(face_roi)
             
-            # Generate recommendations
-            recommendations = self._generate_recommendations(analysis_result)
+            return self._build_result(prepared, face_rect, analysis_result, render)
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def analyze_image_batch(self, images: List[bytes], render: Optional[RenderOptions] = None) -> List[Dict]:
+        """Analyze several encoded images, batching the skin issue stages"""
+        results: List[Dict] = [None] * len(images)
+        located = []
+        for index, image_bytes in enumerate(images):
+            try:
+                prepared, face_rect = self._locate_face(image_bytes)
+                located.append((index, prepared, face_rect))
+            except Exception as e:
+                results[index] = {"success": False, "error": str(e)}
+        
+        face_rois = [
+            self.face_analyzer.extract_face_roi(prepared.image, face_rect)
+            for _, prepared, face_rect in located
+        ]
+        try:
+            analysis_results = self.face_analyzer.detect_skin_issues_batch(face_rois)
+        except Exception:
+            # Fall back to per-image analysis so one bad ROI only fails itself
+            analysis_results = [None] * len(face_rois)
+        
+        for (index, prepared, face_rect), face_roi, analysis_result in zip(
+            located, face_rois, analysis_results
+        ):
+            try:
+                if analysis_result is None:
+                    analysis_result = self.face_analyzer.detect_skin_issues(face_roi)
+                results[index] = self._build_result(prepared, face_rect, analysis_result, render)
+            except Exception as e:
+                results[index] = {"success": False, "error": str(e)}
+        
+        return results
+    
+    def render_image_bytes(self, image_bytes: bytes, result: Dict, options: RenderOptions) -> bytes:
+        """Render an annotated image from a photo and its analysis result (runs on a pool worker)"""
+        # Decode straight to the output size (reduced JPEG decode for thumbnails)
+        with stage("decode"):
+            prepared = decode_image(image_bytes, options.max_dim or settings.IMAGE_MAX_EDGE)
+        if prepared is None:
+            raise ValueError("Could not decode image")
+        image_size = result.get("image_size")
+        if image_size:
+            # The stored source may be smaller than the upload the regions were reported in
+            prepared.scale = prepared.image.shape[1] / image_size["width"]
+        return render_annotation(prepared, result, options)
+    
+    def source_image_bytes(self, image_bytes: bytes) -> Optional[bytes]:
+        """Downscaled source photo for an upload over the working resolution (runs on a pool worker)"""
+        with stage("decode"):
+            prepared = decode_image(image_bytes, settings.IMAGE_MAX_EDGE)
+        if prepared is None:
+            raise ValueError("Could not decode image")
+        return self._source_image(prepared)
+    
+    def _source_image(self, prepared: PreparedImage) -> Optional[bytes]:
+        # The working image is what was analyzed; storing it instead of a
+        # full-size upload keeps later renders possible at a fraction of the size
+        if prepared.scale >= 1:
+            return None
+        return encode_image(prepared.image, SOURCE_IMAGE_OPTIONS)
+    
+    def analyze_live_frame_bytes(self, image_bytes: bytes, track: Optional[Dict]) -> Tuple[Dict, Optional[Dict]]:
+        """Score a live frame, tracking the face between keyframes (runs on a pool worker)"""
+        try:
+            with stage("decode"):
+                prepared = decode_image(image_bytes, settings.LIVE_MAX_EDGE)
+            if prepared is None:
+                raise ValueError("Could not decode image")
+            
+            # Follow the previous face box with the cheap tracker until the next
+            # keyframe is due or the match gets weak
+            if track and track["frames"] < settings.LIVE_KEYFRAME_INTERVAL:
+                with stage("track_face"):
+                    track = update_track(prepared.image, track)
+                if track and track["score"] < settings.LIVE_TRACK_MIN_SCORE:
+                    track = None
+            else:
+                track = None
             
-            # Create annotated image
-            annotated_image = self._create_annotated_image(
-                image, face_rect, analysis_result
-            )
+            keyframe = track is None
+            if keyframe:
+                has_face, faces = self.face_analyzer.detect_face(prepared.image)
+                if not has_face:
+                    raise ValueError("No face detected in the image")
+                track = start_track(prepared.image, faces[0])
+            
+            face_rect = track["rect"]
+            face_roi = self.face_analyzer.extract_face_roi(prepared.image, face_rect)
+            analysis_result = self.face_analyzer.detect_skin_issues(face_roi)
+            face_x, face_y, face_width, face_height = prepared.to_original_rect(face_rect)
             
             return {
                 "success": True,
@@ -45,78 +316,88 @@ class SkinAnalysisService:
                     "redness_count": len(analysis_result["redness_areas"]),
                     "dark_spots_count": len(analysis_result["dark_spots"])
                 },
-                "redness_areas": analysis_result["redness_areas"],
-                "dark_spot_areas": analysis_result["dark_spots"],
-                "recommendations": recommendations,
-                "annotated_image": self._encode_image_base64(annotated_image),
                 "face_location": {
-                    "x": face_rect[0],
-                    "y": face_rect[1],
-                    "width": face_rect[2],
-                    "height": face_rect[3]
-                }
-            }
+                    "x": face_x,
+                    "y": face_y,
+                    "width": face_width,
+                    "height": face_height
+                },
+                "keyframe": keyframe,
+                "track_score": round(track["score"], 3)
+            }, track
             
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
-            }
+            }, None
+    
+    def _locate_face(self, image_bytes: bytes) -> Tuple[PreparedImage, Tuple[int, int, int, int]]:
+        """Decode the image at working resolution and return it with the first detected face"""
+        # Decode image (reduced-resolution decode, EXIF orientation, max edge)
+        with stage("decode"):
+            prepared = decode_image(image_bytes, settings.IMAGE_MAX_EDGE)
+        if prepared is None:
+            raise ValueError("Could not decode image")
+        
+        # Detect face
+        has_face, faces = self.face_analyzer.detect_face(prepared.image)
+        
+        if not has_face:
+            raise ValueError("No face detected in the image")
+        
+        # Use the first detected face
+        return prepared, faces[0]
+    
+    def _build_result(self, prepared: PreparedImage, face_rect: Tuple, analysis_result: Dict,
+                      render: Optional[RenderOptions] = None) -> Dict:
+        """Assemble the API result for one analyzed face"""
+        # Generate recommendations
+        recommendations = self._generate_recommendations(analysis_result)
+        
+        # Report coordinates in the uploaded photo's (upright) pixel space
+        face_x, face_y, face_width, face_height = prepared.to_original_rect(face_rect)
+        
+        result = {
+            "success": True,
+            "skin_score": analysis_result["skin_score"],
+            "detected_issues": {
+                "redness_count": len(analysis_result["redness_areas"]),
+                "dark_spots_count": len(analysis_result["dark_spots"])
+            },
+            "redness_areas": [prepared.to_original_region(area) for area in analysis_result["redness_areas"]],
+            "dark_spot_areas": [prepared.to_original_region(spot) for spot in analysis_result["dark_spots"]],
+            "recommendations": recommendations,
+            "face_location": {
+                "x": face_x,
+                "y": face_y,
+                "width": face_width,
+                "height": face_height
+            },
+            "image_size": {
+                "width": prepared.original_width,
+                "height": prepared.original_height
+            },
+            "analysis_scale": prepared.scale
+        }
+        
+        # Encoded before annotating, which draws on the working image
+        source_image = self._source_image(prepared)
+        if source_image is not None:
+            result["source_image"] = source_image
+        
+        # Annotation is opt-in; the working image is free to draw on by now
+        if render and render.enabled:
+            result["annotated_image"] = render_annotation(prepared, result, render)
+        return result
     
-    def _decode_base64_image(self, image_data: str) -> np.ndarray:
-        """Decode base64 image to numpy array"""
+    def _decode_base64(self, image_data: str) -> bytes:
+        """Decode base64 image data, with or without a data URL prefix"""
         # Remove data:image/jpeg;base64, prefix if present
         if ',' in image_data:
             image_data = image_data.split(',')[1]
         
-        # Decode base64
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        return image
-    
-    def _encode_image_base64(self, image: np.ndarray) -> str:
-        """Encode numpy array image to base64"""
-        _, buffer = cv2.imencode('.jpg', image)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-        return f"data:image/jpeg;base64,{image_base64}"
-    
-    def _create_annotated_image(self, image: np.ndarray, face_rect: Tuple, 
-                                analysis_result: Dict) -> np.ndarray:
-        """Create annotated image with detected issues marked"""
-        annotated = image.copy()
-        x, y, w, h = face_rect
-        
-        # Draw face rectangle
-        cv2.rectangle(annotated, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        
-        # Draw redness areas
-        for area in analysis_result["redness_areas"]:
-            rx = x + area["x"]
-            ry = y + area["y"]
-            rw = area["width"]
-            rh = area["height"]
-            cv2.rectangle(annotated, (rx, ry), (rx + rw, ry + rh), (0, 0, 255), 2)
-            cv2.putText(annotated, "R", (rx, ry - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-        
-        # Draw dark spots
-        for spot in analysis_result["dark_spots"]:
-            sx = x + spot["x"]
-            sy = y + spot["y"]
-            sw = spot["width"]
-            sh = spot["height"]
-            cv2.ellipse(annotated, (sx + sw//2, sy + sh//2), 
-                       (sw//2, sh//2), 0, 0, 360, (255, 0, 255), 2)
-            cv2.putText(annotated, "D", (sx, sy - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 1)
-        
-        # Add skin score
-        cv2.putText(annotated, f"Skin Score: {analysis_result['skin_score']:.1f}", 
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        return annotated
+        return base64.b64decode(image_data)
     
     def _generate_recommendations(self, analysis_result: Dict) -> List[str]:
         """Generate skincare recommendations based on analysis"""
@@ -0,0 +1,240 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+from app.config import settings
+
+# Tiles read this many extra pixels on each side. The skin stages look at most
+# 10 px away (close + open with 5x5 kernels, the border erode and the
+# contour step lookup), so tile cores come out exactly as in a single pass.
+TILE_HALO = 16
+
+_FLT_EPSILON = float(np.finfo(np.float32).eps)
+
+class Tile:
+    """One tile of a grid: its core (the pixels it owns) and the halo window around it"""
+    def __init__(self, row: int, col: int, y0: int, y1: int, x0: int, x1: int, height: int, width: int):
+        self.row = row
+        self.col = col
+        self.y0, self.y1, self.x0, self.x1 = y0, y1, x0, x1
+        self.wy0, self.wy1 = max(0, y0 - TILE_HALO), min(height, y1 + TILE_HALO)
+        self.wx0, self.wx1 = max(0, x0 - TILE_HALO), min(width, x1 + TILE_HALO)
+
+    @property
+    def core(self) -> Tuple[slice, slice]:
+        return slice(self.y0, self.y1), slice(self.x0, self.x1)
+
+    @property
+    def window(self) -> Tuple[slice, slice]:
+        return slice(self.wy0, self.wy1), slice(self.wx0, self.wx1)
+
+    @property
+    def core_in_window(self) -> Tuple[slice, slice]:
+        return (slice(self.y0 - self.wy0, self.y1 - self.wy0),
+                slice(self.x0 - self.wx0, self.x1 - self.wx0))
+
+def tile_grid(height: int, width: int, tile_size: int) -> List[List[Tile]]:
+    """Rows of tiles covering the image; the size is kept even (see merge_tile_components)"""
+    tile_size = max(2, tile_size - tile_size % 2)
+    return [
+        [
+            Tile(row, col, y0, min(height, y0 + tile_size), x0, min(width, x0 + tile_size), height, width)
+            for col, x0 in enumerate(range(0, width, tile_size))
+        ]
+        for row, y0 in enumerate(range(0, height, tile_size))
+    ]
+
+# Tiling threshold when photos are analyzed at full size (IMAGE_MAX_EDGE = 0)
+FULL_SIZE_TILE_MIN_PIXELS = 1_000_000
+
+def tile_min_pixels() -> int:
+    """Face ROI area from which analysis is tiled, scaled to the working resolution"""
+    if settings.ANALYSIS_TILE_MIN_PIXELS is not None:
+        return settings.ANALYSIS_TILE_MIN_PIXELS
+    if settings.IMAGE_MAX_EDGE:
+        return int(settings.ANALYSIS_TILE_MIN_FRACTION * settings.IMAGE_MAX_EDGE ** 2)
+    return FULL_SIZE_TILE_MIN_PIXELS
+
+def tile_workers() -> int:
+    """Tile threads per analysis worker (defaults to its OpenCV thread count)"""
+    return settings.ANALYSIS_TILE_WORKERS or cv2.getNumThreads()
+
+_tile_executor: Optional[ThreadPoolExecutor] = None
+_tile_executor_size = 0
+_tile_executor_lock = threading.Lock()
+
+def get_tile_executor() -> ThreadPoolExecutor:
+    """Process-wide tile thread pool (OpenCV releases the GIL, so tiles run concurrently)"""
+    global _tile_executor, _tile_executor_size
+    size = tile_workers()
+    with _tile_executor_lock:
+        if _tile_executor is None or _tile_executor_size != size:
+            if _tile_executor is not None:
+                _tile_executor.shutdown(wait=False)
+            _tile_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="tile")
+            _tile_executor_size = size
+        return _tile_executor
+
+def otsu_threshold(hist: np.ndarray) -> int:
+    """Otsu threshold of a 256-bin histogram, computed step for step as cv2.threshold does"""
+    # Lets tiles share one threshold from summed histograms without rescanning the image
+    counts = hist.tolist()
+    scale = 1.0 / sum(counts)
+    mu = 0.0
+    for i, count in enumerate(counts):
+        mu += i * float(count)
+    mu *= scale
+
+    mu1 = q1 = 0.0
+    max_sigma = 0.0
+    max_val = 0
+    for i, count in enumerate(counts):
+        p_i = count * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < _FLT_EPSILON or max(q1, q2) > 1.0 - _FLT_EPSILON:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_val = i
+    return max_val
+
+class TileComponents:
+    """Connected components of one tile core with their per-blob contour sums"""
+    def __init__(self, labels: np.ndarray, stats: np.ndarray, doubled_areas: np.ndarray,
+                 step_counts: Optional[np.ndarray]):
+        self.labels = labels  # core-sized, 0 is background
+        self.stats = stats  # cv2 stats rows, row 0 is the background
+        self.doubled_areas = doubled_areas
+        self.step_counts = step_counts  # (axis, diagonal) contour steps per row
+
+def _seam_pairs(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs of foreground pixels 8-adjacent across a seam (a and b are the facing edges)"""
+    firsts, seconds = [], []
+    for shift in (-1, 0, 1):
+        if shift < 0:
+            left, right = a[-shift:], b[:shift]
+        elif shift > 0:
+            left, right = a[:-shift], b[shift:]
+        else:
+            left, right = a, b
+        touching = (left > 0) & (right > 0)
+        firsts.append(left[touching])
+        seconds.append(right[touching])
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+def merge_tile_components(grid: List[List[Tile]], parts: List[List[TileComponents]],
+                          with_perimeter: bool) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Join blobs cut by tile seams into one set of (stats, doubled areas, step counts)
+
+    Rows come out in the order cv2.connectedComponentsWithStats numbers blobs
+    on the whole mask: by the first 2x2 block holding a blob pixel, in raster
+    order. Within a tile the labels already follow that order, and with even
+    tile sizes block rows line up across tiles, so a blob's position is its
+    earliest (block row, tile column, tile label) over its pieces.
+    Row 0 is a zero background row, as in cv2's stats.
+    """
+    flat = [(tile, part) for tile_row, part_row in zip(grid, parts) for tile, part in zip(tile_row, part_row)]
+    offsets = {}
+    total = 0
+    for tile, part in flat:
+        offsets[tile.row, tile.col] = total
+        total += len(part.stats) - 1
+
+    stats = np.zeros((total + 1, 5), np.int64)
+    doubled_areas = np.zeros(total + 1, np.float64)
+    step_counts = np.zeros((total + 1, 2), np.float64) if with_perimeter else None
+    if total == 0:
+        return stats, doubled_areas, step_counts
+
+    # Pieces in global coordinates, indexed from 0 (piece i is global label i + 1 before merging)
+    left = np.concatenate([part.stats[1:, cv2.CC_STAT_LEFT] + tile.x0 for tile, part in flat])
+    top = np.concatenate([part.stats[1:, cv2.CC_STAT_TOP] + tile.y0 for tile, part in flat])
+    right = left + np.concatenate([part.stats[1:, cv2.CC_STAT_WIDTH] for _, part in flat])
+    bottom = top + np.concatenate([part.stats[1:, cv2.CC_STAT_HEIGHT] for _, part in flat])
+    pixels = np.concatenate([part.stats[1:, cv2.CC_STAT_AREA] for _, part in flat])
+    piece_areas = np.concatenate([part.doubled_areas[1:] for _, part in flat])
+    piece_steps = np.concatenate([part.step_counts[1:] for _, part in flat]) if with_perimeter else None
+    max_labels = max(len(part.stats) for _, part in flat)
+    columns = len(grid[0])
+    order_key = np.concatenate([
+        ((part.stats[1:, cv2.CC_STAT_TOP] + tile.y0) // 2 * columns + tile.col) * max_labels
+        + np.arange(1, len(part.stats))
+        for tile, part in flat
+    ]).astype(np.int64)
+
+    # Pairs of pieces touching across a seam (including tile corners)
+    firsts, seconds = [], []
+    def connect(tile_a: Tile, edge_a: np.ndarray, tile_b: Tile, edge_b: np.ndarray, diagonal: bool = False):
+        if diagonal:
+            if edge_a > 0 and edge_b > 0:
+                firsts.append(np.array([edge_a]) + offsets[tile_a.row, tile_a.col] - 1)
+                seconds.append(np.array([edge_b]) + offsets[tile_b.row, tile_b.col] - 1)
+            return
+        a, b = _seam_pairs(edge_a, edge_b)
+        firsts.append(a.astype(np.int64) + offsets[tile_a.row, tile_a.col] - 1)
+        seconds.append(b.astype(np.int64) + offsets[tile_b.row, tile_b.col] - 1)
+
+    rows = len(grid)
+    for row in range(rows):
+        for col in range(columns):
+            tile, labels = grid[row][col], parts[row][col].labels
+            if col + 1 < columns:
+                connect(tile, labels[:, -1], grid[row][col + 1], parts[row][col + 1].labels[:, 0])
+            if row + 1 < rows:
+                connect(tile, labels[-1, :], grid[row + 1][col], parts[row + 1][col].labels[0, :])
+                if col + 1 < columns:
+                    connect(tile, labels[-1, -1], grid[row + 1][col + 1],
+                            parts[row + 1][col + 1].labels[0, 0], diagonal=True)
+                if col > 0:
+                    connect(tile, labels[-1, 0], grid[row + 1][col - 1],
+                            parts[row + 1][col - 1].labels[0, -1], diagonal=True)
+
+    # Union-find by repeated min-label propagation with pointer jumping
+    root = np.arange(total)
+    if firsts:
+        a, b = np.concatenate(firsts), np.concatenate(seconds)
+        while True:
+            lowest = np.minimum(root[a], root[b])
+            previous = root.copy()
+            np.minimum.at(root, a, lowest)
+            np.minimum.at(root, b, lowest)
+            root = root[root]
+            if np.array_equal(root, previous):
+                break
+    _, blob = np.unique(root, return_inverse=True)
+    count = blob.max() + 1
+
+    first_key = np.full(count, np.iinfo(np.int64).max)
+    np.minimum.at(first_key, blob, order_key)
+    rank = np.empty(count, np.int64)
+    rank[np.argsort(first_key)] = np.arange(count)
+    blob = rank[blob] + 1
+
+    blob_left = np.full(total + 1, np.iinfo(np.int64).max)
+    blob_top = np.full(total + 1, np.iinfo(np.int64).max)
+    blob_right = np.zeros(total + 1, np.int64)
+    blob_bottom = np.zeros(total + 1, np.int64)
+    np.minimum.at(blob_left, blob, left)
+    np.minimum.at(blob_top, blob, top)
+    np.maximum.at(blob_right, blob, right)
+    np.maximum.at(blob_bottom, blob, bottom)
+
+    size = count + 1
+    stats = np.zeros((size, 5), np.int64)
+    stats[1:, cv2.CC_STAT_LEFT] = blob_left[1:size]
+    stats[1:, cv2.CC_STAT_TOP] = blob_top[1:size]
+    stats[1:, cv2.CC_STAT_WIDTH] = blob_right[1:size] - blob_left[1:size]
+    stats[1:, cv2.CC_STAT_HEIGHT] = blob_bottom[1:size] - blob_top[1:size]
+    stats[:, cv2.CC_STAT_AREA] = np.bincount(blob, weights=pixels, minlength=size).astype(np.int64)
+    doubled_areas = np.bincount(blob, weights=piece_areas, minlength=size)
+    if with_perimeter:
+        step_counts = np.stack(
+            [np.bincount(blob, weights=piece_steps[:, column], minlength=size) for column in range(2)], axis=1
+        )
+    return stats, doubled_areas, step_counts
@@ -0,0 +1,160 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.metrics import register_stats
+
+class AnalysisPoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+    def __init__(self, retry_after: int):
+        super().__init__("Skin analysis is busy, please retry shortly")
+        self.retry_after = retry_after
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on (its affinity mask when the OS exposes one)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def cpu_budget() -> int:
+    """CPUs this server process should keep busy (a share of the box under app.serve)"""
+    return settings.WORKER_CPU_BUDGET or len(available_cpus())
+
+def opencv_threads(pool_size: int) -> int:
+    """OpenCV threads per analysis worker so the pool as a whole fits the CPU budget"""
+    return settings.OPENCV_THREADS or max(1, cpu_budget() // pool_size)
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+class AnalysisPool:
+    """Bounded CPU worker pool that keeps OpenCV work off the event loop"""
+    def __init__(self, mode: str, size: int, queue_depth: int,
+                 initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown analysis pool mode: {mode}")
+        self.mode = mode
+        self.size = size
+        self.queue_depth = queue_depth
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.size + self.queue_depth
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size, initializer=self.initializer, initargs=self.initargs
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size,
+                    thread_name_prefix="skin-analysis",
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+        return self._executor
+
+    def _reserve(self, slots: int):
+        if self.pending + slots > self.capacity:
+            self.rejected += 1
+            raise AnalysisPoolSaturated(settings.ANALYSIS_RETRY_AFTER_SECONDS)
+        self.pending += slots
+
+    def _release(self, _future=None):
+        self.pending -= 1
+
+    def _submit(self, loop: asyncio.AbstractEventLoop, fn: Callable, args: Tuple) -> asyncio.Future:
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._executor = None
+            raise
+        except Exception:
+            self._release()
+            raise
+        # Release the slot when the worker finishes, even if the caller went away
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on a worker, raising AnalysisPoolSaturated when full"""
+        return (await self.map(fn, [args]))[0]
+
+    async def map(self, fn: Callable, arg_list: List[Tuple]) -> List:
+        """Run fn over several argument tuples, reserving all slots up front"""
+        self._reserve(len(arg_list))
+        loop = asyncio.get_running_loop()
+        futures = []
+        try:
+            for index, args in enumerate(arg_list):
+                futures.append(self._submit(loop, fn, args))
+        except Exception:
+            # Give back the slots reserved for tasks that were never submitted
+            self.pending -= len(arg_list) - index - 1
+            raise
+        try:
+            return await asyncio.gather(*futures)
+        except BrokenProcessPool:
+            # A crashed worker poisons the executor, start a fresh one next time
+            self._executor = None
+            raise
+
+    async def warm(self) -> List[int]:
+        """Start every worker now instead of on the first scan; returns worker pids"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        futures = [loop.run_in_executor(executor, _worker_ready) for _ in range(self.size)]
+        return sorted(set(await asyncio.gather(*futures)))
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "size": self.size,
+            "queue_depth": self.queue_depth,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_analysis_pool: Optional[AnalysisPool] = None
+
+def get_analysis_pool() -> AnalysisPool:
+    """Return the process-wide analysis pool, creating it on first use"""
+    global _analysis_pool
+    if _analysis_pool is None:
+        from app.services.skin_analysis import warm_worker
+        size = settings.ANALYSIS_POOL_SIZE or cpu_budget()
+        _analysis_pool = AnalysisPool(
+            mode=settings.ANALYSIS_POOL_MODE,
+            size=size,
+            queue_depth=settings.ANALYSIS_QUEUE_DEPTH,
+            initializer=warm_worker,
+            # Forked process workers reuse models preloaded by app.serve
+            initargs=(opencv_threads(size), settings.ANALYSIS_POOL_MODE == "process"),
+        )
+    return _analysis_pool
+
+def shutdown_analysis_pool():
+    global _analysis_pool
+    if _analysis_pool is not None:
+        _analysis_pool.shutdown()
+        _analysis_pool = None
+
+def _analysis_pool_stats() -> Dict:
+    return _analysis_pool.stats() if _analysis_pool is not None else {}
+
+register_stats("analysis_pool", "Skin analysis worker pool", _analysis_pool_stats, counters=("rejected",))
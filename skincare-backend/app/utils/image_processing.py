@@ -0,0 +1,164 @@
+import struct
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+
+# Largest libjpeg DCT scaling first; each keeps at least max_edge pixels
+_REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+# Start-of-frame markers that carry the image dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_EXIF_ORIENTATION_TAG = 0x0112
+
+class PreparedImage:
+    """Decoded working image plus the mapping back to the uploaded photo"""
+    def __init__(self, image: np.ndarray, scale: float, original_width: int, original_height: int):
+        self.image = image
+        self.scale = scale  # working pixels per original pixel (<= 1)
+        self.original_width = original_width
+        self.original_height = original_height
+
+    def to_original_rect(self, rect: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """Map an (x, y, w, h) rectangle from working to original coordinates"""
+        return tuple(int(round(value / self.scale)) for value in rect)
+
+    def to_original_region(self, region: Dict) -> Dict:
+        """Map a detected region's box and area to original coordinates"""
+        x, y, width, height = self.to_original_rect(
+            (region["x"], region["y"], region["width"], region["height"])
+        )
+        return {
+            **region,
+            "x": x,
+            "y": y,
+            "width": width,
+            "height": height,
+            "area": float(region["area"] / (self.scale * self.scale)),
+        }
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG's SOF header without decoding it"""
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+        if marker in _SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        if marker == 0xDA:
+            # Start of scan: no frame header before the entropy-coded data
+            return None
+        offset += 2 + length
+    return None
+
+def exif_orientation(data: bytes) -> int:
+    """Return the EXIF orientation (1-8) of a JPEG, 1 when absent"""
+    offset = 2
+    while offset + 4 <= len(data) and data[offset] == 0xFF:
+        marker = data[offset + 1]
+        (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+        if marker == 0xDA:
+            break
+        segment = data[offset + 4:offset + 2 + length]
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            return _tiff_orientation(segment[6:])
+        offset += 2 + length
+    return 1
+
+def _tiff_orientation(tiff: bytes) -> int:
+    try:
+        endian = "<" if tiff[:2] == b"II" else ">"
+        (ifd_offset,) = struct.unpack(endian + "I", tiff[4:8])
+        (entries,) = struct.unpack(endian + "H", tiff[ifd_offset:ifd_offset + 2])
+        for index in range(entries):
+            entry = ifd_offset + 2 + index * 12
+            tag, _, _ = struct.unpack(endian + "HHI", tiff[entry:entry + 8])
+            if tag == _EXIF_ORIENTATION_TAG:
+                (value,) = struct.unpack(endian + "H", tiff[entry + 8:entry + 10])
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        pass
+    return 1
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Rotate/flip a decoded image so it is upright for the given EXIF orientation"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+def reduced_decode_flag(width: int, height: int, max_edge: int) -> int:
+    """Pick the IMREAD_REDUCED_* flag that still leaves at least max_edge pixels"""
+    longest = max(width, height)
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if longest // factor >= max_edge:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def decode_image(data: bytes, max_edge: int = 0) -> Optional[PreparedImage]:
+    """Decode an upload to an upright BGR image no larger than max_edge"""
+    if not data:
+        return None
+
+    # Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg itself,
+    # which skips most of the IDCT work and the full-size buffer
+    flag = cv2.IMREAD_COLOR
+    dimensions = jpeg_dimensions(data)
+    if max_edge and dimensions:
+        flag = reduced_decode_flag(dimensions[0], dimensions[1], max_edge)
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+
+    orientation = exif_orientation(data) if dimensions else 1
+    image = apply_orientation(image, orientation)
+
+    if dimensions:
+        original_width, original_height = dimensions
+        if orientation >= 5:
+            # Orientations 5-8 swap the stored width and height
+            original_width, original_height = original_height, original_width
+    else:
+        original_height, original_width = image.shape[:2]
+
+    height, width = image.shape[:2]
+    if max_edge and max(height, width) > max_edge:
+        resize = max_edge / max(height, width)
+        image = cv2.resize(
+            image,
+            (max(1, int(round(width * resize))), max(1, int(round(height * resize)))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    scale = image.shape[1] / original_width
+    return PreparedImage(image, scale, original_width, original_height)
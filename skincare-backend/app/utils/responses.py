@@ -0,0 +1,22 @@
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+def _default(value: Any) -> Any:
+    """orjson fallback for the BSON types Motor hands back"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_mongo(content: Any, option: int = 0) -> bytes:
+    """Mongo documents as JSON bytes, extra orjson options OR-ed in"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | option)
+
+class MongoJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, taking Mongo documents as they come from Motor"""
+    # Routes that return one of these directly skip FastAPI's response_model
+    # validation and jsonable_encoder pass; naive datetimes come out in the
+    # same ISO format Pydantic uses, ObjectIds as hex strings
+    def render(self, content: Any) -> bytes:
+        return dumps_mongo(content)
@@ -0,0 +1,198 @@
+"""Per-stage latency of FaceAnalyzer and SkinAnalysisService on the synthetic corpus.
+
+Generates the seeded synthetic face photos (benchmarks.synthetic), then times
+each stage on its own for every case: decode, face detection with the
+configured backend, color conversion, redness, dark spots, scoring, the whole
+skin issue pass, the end-to-end service call and annotation rendering. The
+service calls use the ground-truth face box so a drawn face the detector
+misses still runs the full pipeline. Results (p50/p99 per stage and case)
+are written as JSON.
+
+With --baseline, the run is compared against an earlier results file and
+stages whose p50 grew by more than --threshold are reported as regressions
+(exit status 1). --input compares an existing results file without running.
+
+Usage:
+  python -m benchmarks.cv_stages --output results.json
+  python -m benchmarks.cv_stages --baseline baseline.json --output results.json
+  python -m benchmarks.cv_stages --input results.json --baseline baseline.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+import cv2
+import numpy as np
+from app.config import settings
+from app.services.annotation import RenderOptions
+from app.services.face_detection import FaceAnalyzer
+from app.services.face_detectors import FaceDetector, face_detector_backend
+from app.services.skin_analysis import SkinAnalysisService
+from app.utils.image_processing import decode_image
+from benchmarks.login_contention import percentiles
+from benchmarks.synthetic import (
+    DEFAULT_SEED, DENSITIES, FACE_FRACTIONS, RESOLUTIONS, SyntheticFace, corpus_digest, generate_corpus
+)
+
+# Differences below this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.05
+
+class GroundTruthDetector(FaceDetector):
+    """Returns the synthetic face box, scaled to whatever working size it is given"""
+    name = "ground_truth"
+
+    def __init__(self):
+        self.face: SyntheticFace = None
+
+    def detect(self, image: np.ndarray, min_size: int = 0, max_size: int = 0) -> List[Tuple[int, int, int, int]]:
+        scale = image.shape[1] / self.face.params["width"]
+        return [tuple(int(round(value * scale)) for value in self.face.face_rect)]
+
+def time_stage(fn: Callable, repeat: int) -> Dict[str, float]:
+    fn()  # warm-up (first-call allocations, OpenCV thread pool start)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+def run_case(face: SyntheticFace, analyzer: FaceAnalyzer, service: SkinAnalysisService,
+             ground_truth: GroundTruthDetector, repeat: int) -> Dict:
+    ground_truth.face = face
+    image_bytes = face.jpeg
+    prepared = decode_image(image_bytes, settings.IMAGE_MAX_EDGE)
+    x, y, w, h = ground_truth.detect(prepared.image)[0]
+    face_roi = np.ascontiguousarray(prepared.image[y:y + h, x:x + w])
+
+    hsv = cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV)
+    lab = cv2.cvtColor(face_roi, cv2.COLOR_BGR2LAB)
+    red_mask = analyzer._redness_mask(hsv)
+    issues = analyzer.detect_skin_issues(face_roi)
+    result = service.analyze_image_bytes(image_bytes)
+    if not result["success"]:
+        raise RuntimeError(f"{face.name}: {result['error']}")
+
+    def color():
+        analyzer._redness_mask(cv2.cvtColor(face_roi, cv2.COLOR_BGR2HSV))
+        cv2.cvtColor(face_roi, cv2.COLOR_BGR2LAB)
+
+    full, thumbnail = RenderOptions("full"), RenderOptions("thumbnail")
+    stages = {
+        "decode": lambda: decode_image(image_bytes, settings.IMAGE_MAX_EDGE),
+        "detect_face": lambda: analyzer.detect_face(prepared.image),
+        "color": color,
+        "redness": lambda: analyzer._redness_regions(red_mask, face_roi.shape),
+        "dark_spots": lambda: analyzer._detect_dark_spots(face_roi, lab),
+        "skin_score": lambda: analyzer._calculate_skin_score(
+            issues["redness_areas"], issues["dark_spots"], face_roi.shape
+        ),
+        "detect_skin_issues": lambda: analyzer.detect_skin_issues(face_roi),
+        "analyze_image_bytes": lambda: service.analyze_image_bytes(image_bytes),
+        "render_full": lambda: service.render_image_bytes(image_bytes, result, full),
+        "render_thumbnail": lambda: service.render_image_bytes(image_bytes, result, thumbnail),
+    }
+    return {
+        "params": face.params,
+        "digest": corpus_digest([face]),
+        "face_found": analyzer.detect_face(prepared.image)[0],
+        "working_size": list(prepared.image.shape[1::-1]),
+        "regions": {"redness": len(issues["redness_areas"]), "dark_spots": len(issues["dark_spots"])},
+        "stages": {name: time_stage(fn, repeat) for name, fn in stages.items()},
+    }
+
+def run(seed: int, resolutions: List[str], face_fractions: List[float],
+        densities: List[str], repeat: int) -> Dict:
+    corpus = generate_corpus(seed, resolutions, face_fractions, densities)
+
+    analyzer = FaceAnalyzer()
+    ground_truth = GroundTruthDetector()
+    service = SkinAnalysisService()
+    service._face_analyzer = FaceAnalyzer(ground_truth)
+
+    report = {
+        "meta": {
+            "seed": seed,
+            "corpus_digest": corpus_digest(corpus),
+            "repeat": repeat,
+            "face_detector": face_detector_backend(),
+            "image_max_edge": settings.IMAGE_MAX_EDGE,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "opencv_threads": cv2.getNumThreads(),
+        },
+        "cases": {},
+    }
+    for face in corpus:
+        report["cases"][face.name] = run_case(face, analyzer, service, ground_truth, repeat)
+        print(f"{face.name}: done", file=sys.stderr)
+    return report
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """Stages whose p50 grew by more than threshold (a fraction) over the baseline"""
+    regressions = []
+    for case, result in current["cases"].items():
+        baseline_case = baseline["cases"].get(case)
+        if baseline_case is None:
+            continue
+        if result["digest"] != baseline_case["digest"]:
+            print(f"Warning: {case} image differs from the baseline (seed or generator changed)", file=sys.stderr)
+        for stage, timing in result["stages"].items():
+            before = baseline_case["stages"].get(stage)
+            if before is None:
+                continue
+            after_ms, before_ms = timing["p50_ms"], before["p50_ms"]
+            if after_ms - before_ms > MIN_REGRESSION_MS and after_ms > before_ms * (1 + threshold):
+                regressions.append({
+                    "case": case,
+                    "stage": stage,
+                    "baseline_p50_ms": before_ms,
+                    "p50_ms": after_ms,
+                    "change": f"{(after_ms / before_ms - 1) * 100:+.0f}%" if before_ms else "new",
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help="comma-separated")
+    parser.add_argument("--face-fractions", default=",".join(str(f) for f in FACE_FRACTIONS), help="comma-separated")
+    parser.add_argument("--densities", default=",".join(DENSITIES), help="comma-separated")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage and case")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--input", help="compare this results file instead of running")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 growth (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            report = json.load(f)
+    else:
+        report = run(
+            args.seed,
+            args.resolutions.split(","),
+            [float(fraction) for fraction in args.face_fractions.split(",")],
+            args.densities.split(","),
+            args.repeat,
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        elif not args.baseline:
+            print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(json.dumps({"threshold": args.threshold, "regressions": regressions}, indent=2))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
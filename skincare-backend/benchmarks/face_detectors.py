@@ -0,0 +1,92 @@
+"""Latency and detection rate of each face detector backend.
+
+Decodes every image the way the analysis service does (IMAGE_MAX_EDGE working
+resolution, EXIF orientation), then runs each backend over the set with and
+without the face-size hint and reports the share of images with a face plus
+p50/p99 detection latency. Backends whose model file is missing are reported
+as unavailable.
+
+Usage: python -m benchmarks.face_detectors photos/ [more photos or dirs] --repeat 5
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+import numpy as np
+from app.config import settings
+from app.services.face_detection import FaceAnalyzer
+from app.services.face_detectors import create_face_detector
+from app.utils.image_processing import decode_image
+from benchmarks.login_contention import percentiles
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def load_images(paths: List[str]) -> List[np.ndarray]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+
+    images = []
+    for file in files:
+        with open(file, "rb") as f:
+            prepared = decode_image(f.read(), settings.IMAGE_MAX_EDGE)
+        if prepared is not None:
+            images.append(prepared.image)
+    return images
+
+def run_backend(analyzer: FaceAnalyzer, images: List[np.ndarray], repeat: int, hinted: bool) -> Dict:
+    samples = []
+    detected = 0
+    for image in images:
+        # No hint means searching every scale, as the original detector did
+        hint = {} if hinted else {"min_size": 0, "max_size": 0}
+        for _ in range(repeat):
+            start = time.perf_counter()
+            has_face, _ = analyzer.detect_face(image, **hint)
+            samples.append(time.perf_counter() - start)
+        detected += has_face
+    return {
+        "detection_rate": round(detected / len(images), 3),
+        "latency": percentiles(samples),
+    }
+
+def run(paths: List[str], backends: List[str], repeat: int) -> Dict:
+    images = load_images(paths)
+    if not images:
+        raise SystemExit("No decodable images found")
+
+    report = {
+        "images": len(images),
+        "max_edge": settings.IMAGE_MAX_EDGE,
+        "min_size_fraction": settings.FACE_MIN_SIZE_FRACTION,
+        "max_size_fraction": settings.FACE_MAX_SIZE_FRACTION,
+    }
+    for backend in backends:
+        try:
+            analyzer = FaceAnalyzer(create_face_detector(backend))
+        except FileNotFoundError as e:
+            report[backend] = {"unavailable": str(e)}
+            continue
+        report[backend] = {
+            "full_search": run_backend(analyzer, images, repeat, hinted=False),
+            "size_hint": run_backend(analyzer, images, repeat, hinted=True),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="image files or directories of face photos")
+    parser.add_argument("--backends", default="haar,yunet", help="comma-separated backends")
+    parser.add_argument("--repeat", type=int, default=3, help="detections per image")
+    args = parser.parse_args()
+    print(json.dumps(run(args.paths, args.backends.split(","), args.repeat), indent=2))
+
+if __name__ == "__main__":
+    main()
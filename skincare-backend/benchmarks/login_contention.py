@@ -0,0 +1,88 @@
+"""Latency of /skin-analysis/history while a login storm runs on the same server.
+
+Registers (or reuses) a benchmark user, samples /skin-analysis/history on its
+own, then samples it again while LOGINS concurrent clients log in back to
+back, and prints p50/p99 for both phases. Run it against a single uvicorn
+worker to see how much bcrypt work leaks onto the event loop.
+
+Usage: python -m benchmarks.login_contention --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+import httpx
+
+USERNAME = "bench_login_user"
+PASSWORD = "bench-password"
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    response = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+    if response.status_code == 401:
+        response = await client.post("/auth/register", json={
+            "username": USERNAME, "email": f"{USERNAME}@example.com", "password": PASSWORD
+        })
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def sample_history(client: httpx.AsyncClient, token: str, duration: float) -> List[float]:
+    samples = []
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get("/skin-analysis/history?limit=10", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    return samples
+
+async def login_storm(client: httpx.AsyncClient, stop: asyncio.Event) -> int:
+    logins = 0
+    while not stop.is_set():
+        response = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+        response.raise_for_status()
+        logins += 1
+    return logins
+
+async def run(url: str, logins: int, duration: float) -> Dict:
+    limits = httpx.Limits(max_connections=logins + 4)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        token = await get_token(client)
+        idle = await sample_history(client, token, duration)
+
+        stop = asyncio.Event()
+        storm = [asyncio.create_task(login_storm(client, stop)) for _ in range(logins)]
+        loaded = await sample_history(client, token, duration)
+        stop.set()
+        completed_logins = sum(await asyncio.gather(*storm))
+
+    return {
+        "concurrent_logins": logins,
+        "logins_per_second": round(completed_logins / duration, 1),
+        "history_idle": percentiles(idle),
+        "history_under_logins": percentiles(loaded),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=16, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.logins, args.duration)), indent=2))
+
+if __name__ == "__main__":
+    main()
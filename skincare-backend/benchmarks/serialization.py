@@ -0,0 +1,124 @@
+"""Serialization cost of /skin-analysis/history pages, per 100 documents.
+
+Builds analysis documents shaped like stored ones (regions included) and
+times the two ways the route has turned them into a response body:
+
+  before: SkinAnalysisModel(**doc) per row, then FastAPI's response_model
+          validation and jsonable_encoder, then the stdlib JSONResponse
+  after:  the documents as Motor returns them, rendered by MongoJSONResponse
+
+Both bodies are checked to decode to the same JSON. Prints p50/p99 per page
+of --page-size documents and the speedup as JSON.
+
+Usage: python -m benchmarks.serialization --page-size 100 --regions 40
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Union
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.database.models import AnalysisHistoryPage, SkinAnalysisModel
+from app.utils.responses import MongoJSONResponse
+from benchmarks.login_contention import percentiles
+
+SEVERITIES = ("mild", "moderate", "severe")
+
+def _region(rng: random.Random, with_circularity: bool) -> Dict:
+    region = {
+        "x": rng.randint(0, 3000),
+        "y": rng.randint(0, 3000),
+        "width": rng.randint(4, 200),
+        "height": rng.randint(4, 200),
+        "area": rng.uniform(10, 20000),
+        "severity": rng.choice(SEVERITIES),
+    }
+    if with_circularity:
+        region["circularity"] = rng.uniform(0.2, 1.0)
+    return region
+
+def analysis_documents(count: int, regions: int, seed: int = 1234) -> List[Dict]:
+    """History documents as stored by the analyze routes (image_url projected out)"""
+    rng = random.Random(seed)
+    user_id = str(ObjectId())
+    start = datetime(2024, 1, 1)
+    documents = []
+    for index in range(count):
+        redness = [_region(rng, False) for _ in range(regions // 2)]
+        dark_spots = [_region(rng, True) for _ in range(regions - regions // 2)]
+        documents.append({
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "source_image_url": f"/skin-analysis/image/{rng.getrandbits(256):064x}",
+            "face_location": {"x": 400, "y": 300, "width": 900, "height": 900},
+            "skin_score": round(rng.uniform(40, 100), 1),
+            "detected_issues": {"redness_count": len(redness), "dark_spots_count": len(dark_spots)},
+            "redness_areas": redness,
+            "dark_spot_areas": dark_spots,
+            "recommendations": ["Use a gentle cleanser", "Apply sunscreen daily"],
+            # Mongo keeps milliseconds
+            "analysis_date": start + timedelta(hours=index, milliseconds=rng.randint(0, 999)),
+        })
+    return documents
+
+_HISTORY_FIELD = create_response_field(
+    "Response_get_analysis_history", Union[List[SkinAnalysisModel], AnalysisHistoryPage]
+)
+
+async def before(documents: List[Dict]) -> bytes:
+    items = [SkinAnalysisModel(**document) for document in documents]
+    content = await serialize_response(field=_HISTORY_FIELD, response_content=items, is_coroutine=True)
+    return JSONResponse(content).body
+
+async def after(documents: List[Dict]) -> bytes:
+    return MongoJSONResponse(documents).body
+
+async def time_path(fn: Callable[[List[Dict]], Awaitable[bytes]], documents: List[Dict],
+                    repeat: int) -> Dict[str, float]:
+    await fn(documents)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(documents)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+def _with_image_url(body: bytes) -> List[Dict]:
+    # The model fills in image_url (projected out of history queries) as null
+    return [{"image_url": None, **item} for item in json.loads(body)]
+
+async def run(page_size: int, regions: int, repeat: int) -> Dict:
+    documents = analysis_documents(page_size, regions)
+    old_body, new_body = await before(documents), await after(documents)
+    if _with_image_url(old_body) != _with_image_url(new_body):
+        raise SystemExit("The two paths produce different JSON")
+
+    timings = {
+        "before": await time_path(before, documents, repeat),
+        "after": await time_path(after, documents, repeat),
+    }
+    scale = 100 / page_size
+    return {
+        "page_size": page_size,
+        "regions_per_document": regions,
+        "body_bytes": {"before": len(old_body), "after": len(new_body)},
+        "ms_per_100_documents": {path: round(timing["p50_ms"] * scale, 3) for path, timing in timings.items()},
+        "timings": timings,
+        "speedup": round(timings["before"]["p50_ms"] / timings["after"]["p50_ms"], 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100, help="documents per response")
+    parser.add_argument("--regions", type=int, default=40, help="regions per document (redness + dark spots)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.page_size, args.regions, args.repeat)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Deterministic synthetic face photos for the CV benchmarks.
+
+Every image is drawn from a fixed seed with OpenCV primitives (no network, no
+photo files): a background gradient, a skin-toned face ellipse with eyes and a
+mouth, red patches and small dark spots, plus sensor-like noise. The face box
+is known exactly, so benchmarks can time the skin stages on the right region
+even where a real detector would miss a drawn face.
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+DEFAULT_SEED = 1234
+
+# name -> (width, height)
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "1080p": (1920, 1080),
+    "12mp": (4032, 3024),
+}
+
+# Face width as a fraction of the shorter image edge
+FACE_FRACTIONS = (0.25, 0.45, 0.7)
+
+# name -> (red patches, dark spots)
+DENSITIES = {
+    "clear": (0, 0),
+    "mild": (3, 6),
+    "heavy": (12, 40),
+}
+
+# BGR skin tones, all hue > 10 so plain skin stays out of the redness mask
+SKIN_TONES = ((150, 180, 225), (110, 150, 200), (80, 115, 165), (60, 85, 125))
+
+class SyntheticFace:
+    """One generated photo with its ground-truth face box"""
+    def __init__(self, name: str, image: np.ndarray, face_rect: Tuple[int, int, int, int], params: Dict):
+        self.name = name
+        self.image = image
+        self.face_rect = face_rect  # (x, y, w, h) in image pixels
+        self.params = params
+        self._jpeg: Optional[bytes] = None
+
+    @property
+    def jpeg(self) -> bytes:
+        """The photo as an upload would arrive (encoded once, on first use)"""
+        if self._jpeg is None:
+            self._jpeg = cv2.imencode(".jpg", self.image, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+        return self._jpeg
+
+def _random_point_in_ellipse(rng: np.random.Generator, center: Tuple[int, int],
+                             axes: Tuple[int, int], inset: float) -> Tuple[int, int]:
+    angle = rng.uniform(0, 2 * np.pi)
+    radius = np.sqrt(rng.uniform(0, 1)) * inset
+    return (int(center[0] + np.cos(angle) * axes[0] * radius),
+            int(center[1] + np.sin(angle) * axes[1] * radius))
+
+def synthetic_face(width: int, height: int, face_fraction: float, red_patches: int,
+                   dark_spots: int, seed: int) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+    """Draw one face photo; returns (BGR image, face box)"""
+    rng = np.random.default_rng(seed)
+
+    # Background: vertical grey-blue gradient
+    ramp = np.linspace(50, 150, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = np.stack([ramp + 30, ramp + 15, ramp], axis=-1).astype(np.uint8)
+
+    # Face ellipse somewhere fully inside the frame
+    face_w = int(min(width, height) * face_fraction)
+    face_h = min(int(face_w * 1.3), height - 2)
+    cx = int(rng.integers(face_w // 2, width - face_w // 2 + 1))
+    cy = int(rng.integers(face_h // 2, height - face_h // 2 + 1))
+    axes = (face_w // 2, face_h // 2)
+    skin = SKIN_TONES[int(rng.integers(len(SKIN_TONES)))]
+    cv2.ellipse(image, (cx, cy), axes, 0, 0, 360, skin, -1)
+
+    # Eyes and mouth give the face the usual dark features
+    eye_axes = (max(2, face_w // 12), max(1, face_h // 30))
+    for side in (-1, 1):
+        cv2.ellipse(image, (cx + side * face_w // 5, cy - face_h // 8), eye_axes, 0, 0, 360, (40, 30, 30), -1)
+    cv2.ellipse(image, (cx, cy + face_h // 4), (face_w // 6, max(1, face_h // 40)), 0, 0, 360,
+                (70, 70, 150), -1)
+
+    # Red patches: irregular clusters of overlapping blobs in the red hue band
+    for _ in range(red_patches):
+        center = _random_point_in_ellipse(rng, (cx, cy), axes, 0.75)
+        for _ in range(3):
+            offset = rng.normal(0, face_w * 0.015, 2).astype(int)
+            radius = max(2, int(face_w * rng.uniform(0.02, 0.05)))
+            blob = (int(center[0] + offset[0]), int(center[1] + offset[1]))
+            cv2.circle(image, blob, radius, (70, 60, int(rng.integers(170, 215))), -1)
+
+    # Dark spots: small round pigmentation
+    for _ in range(dark_spots):
+        center = _random_point_in_ellipse(rng, (cx, cy), axes, 0.8)
+        radius = max(2, int(face_w * rng.uniform(0.012, 0.03)))
+        cv2.circle(image, center, radius, (45, 60, 85), -1)
+
+    # Sensor-like noise, then a light blur so edges aren't perfectly sharp
+    noise = rng.normal(0, 4, image.shape).astype(np.int16)
+    image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (3, 3), 0)
+
+    return image, (cx - axes[0], cy - axes[1], axes[0] * 2, axes[1] * 2)
+
+def generate_corpus(seed: int = DEFAULT_SEED, resolutions: Optional[List[str]] = None,
+                    face_fractions: Optional[List[float]] = None,
+                    densities: Optional[List[str]] = None) -> List[SyntheticFace]:
+    """Every resolution x face size x density combination, each with its own derived seed"""
+    corpus = []
+    for resolution in resolutions or list(RESOLUTIONS):
+        width, height = RESOLUTIONS[resolution]
+        for face_fraction in face_fractions or FACE_FRACTIONS:
+            for density in densities or list(DENSITIES):
+                red_patches, dark_spots = DENSITIES[density]
+                name = f"{resolution}-face{int(face_fraction * 100)}-{density}"
+                # Derived from the name, so a case doesn't change when others are filtered out
+                case_seed = int.from_bytes(hashlib.sha256(f"{seed}:{name}".encode()).digest()[:4], "big")
+                image, face_rect = synthetic_face(width, height, face_fraction, red_patches, dark_spots, case_seed)
+                corpus.append(SyntheticFace(name, image, face_rect, {
+                    "width": width,
+                    "height": height,
+                    "face_fraction": face_fraction,
+                    "red_patches": red_patches,
+                    "dark_spots": dark_spots,
+                }))
+    return corpus
+
+def corpus_digest(corpus: List[SyntheticFace]) -> str:
+    """Hash of the generated pixels, to check two runs timed the same images"""
+    digest = hashlib.sha256()
+    for face in corpus:
+        digest.update(face.name.encode())
+        digest.update(face.image.tobytes())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,86 @@
+"""Scaling of tile-parallel detect_skin_issues with the number of tile threads.
+
+Takes the face ROI of a synthetic full-resolution photo (benchmarks.synthetic),
+times the single-pass detect_skin_issues, then the tiled version with 1..N
+threads for each tile size, and checks every tiled result is identical to the
+single pass. OpenCV's own threading is set to 1 so only the tiles run in
+parallel. Prints p50/p99 and the speedup over the single pass as JSON.
+
+Usage: python -m benchmarks.tile_scaling --max-workers 8 --tile-sizes 256,512,1024
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+import cv2
+import numpy as np
+from app.config import settings
+from app.services.face_detection import FaceAnalyzer
+from app.services.worker_pool import available_cpus
+from benchmarks.login_contention import percentiles
+from benchmarks.synthetic import DEFAULT_SEED, RESOLUTIONS, synthetic_face
+
+def time_analysis(analyze: Callable[[np.ndarray], Dict], face_roi: np.ndarray, repeat: int) -> Dict[str, float]:
+    analyze(face_roi)  # warm-up (thread pool start, allocations)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyze(face_roi)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+def run(resolution: str, face_fraction: float, tile_sizes: List[int], max_workers: int,
+        repeat: int, seed: int) -> Dict:
+    cv2.setNumThreads(1)
+    width, height = RESOLUTIONS[resolution]
+    image, (x, y, w, h) = synthetic_face(width, height, face_fraction, 12, 40, seed)
+    face_roi = np.ascontiguousarray(image[y:y + h, x:x + w])
+    analyzer = FaceAnalyzer()
+
+    settings.ANALYSIS_TILE_WORKERS = 1
+    expected = analyzer.detect_skin_issues(face_roi)
+    single = time_analysis(analyzer.detect_skin_issues, face_roi, repeat)
+
+    report = {
+        "face_roi": [w, h],
+        "cpus": len(available_cpus()),
+        "single_pass": single,
+        "tiled": {},
+    }
+    settings.ANALYSIS_TILE_MIN_PIXELS = 0
+    for tile_size in tile_sizes:
+        settings.ANALYSIS_TILE_SIZE = tile_size
+        rows = {}
+        for workers in range(1, max_workers + 1):
+            # Tile threads come from ANALYSIS_TILE_WORKERS, but one thread
+            # normally means "don't tile", so call the tiled path directly
+            settings.ANALYSIS_TILE_WORKERS = workers
+            if analyzer._tiled_skin_issues(face_roi) != expected:
+                raise SystemExit(f"Tiled result differs (tile size {tile_size}, {workers} workers)")
+            timing = time_analysis(analyzer._tiled_skin_issues, face_roi, repeat)
+            timing["speedup"] = round(single["p50_ms"] / timing["p50_ms"], 2)
+            rows[workers] = timing
+        report["tiled"][tile_size] = rows
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolution", default="12mp", choices=list(RESOLUTIONS))
+    parser.add_argument("--face-fraction", type=float, default=0.7)
+    parser.add_argument("--tile-sizes", default="256,512,1024", help="comma-separated")
+    parser.add_argument("--max-workers", type=int, default=len(available_cpus()))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    report = run(
+        args.resolution,
+        args.face_fraction,
+        [int(size) for size in args.tile_sizes.split(",")],
+        args.max_workers,
+        args.repeat,
+        args.seed,
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Parity of the component-statistics region extraction with findContours(RETR_EXTERNAL)."""
+import cv2
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.face_detection import FaceAnalyzer
+
+@pytest.fixture(scope="module")
+def analyzer() -> FaceAnalyzer:
+    return FaceAnalyzer()
+
+def external_contour_shapes(mask: np.ndarray):
+    """What the analyzer computed before: one row per outer contour"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return sorted(
+        (cv2.boundingRect(contour), cv2.contourArea(contour), cv2.arcLength(contour, True))
+        for contour in contours
+    )
+
+def component_shapes(analyzer: FaceAnalyzer, mask: np.ndarray):
+    areas, perimeters, stats = analyzer._component_shapes(mask, with_perimeter=True)
+    return sorted(
+        (tuple(int(value) for value in row[:4]), float(area), float(perimeter))
+        for row, area, perimeter in zip(stats, areas, perimeters)
+    )
+
+def assert_parity(analyzer: FaceAnalyzer, mask: np.ndarray):
+    expected = external_contour_shapes(mask)
+    actual = component_shapes(analyzer, mask)
+    assert [rect for rect, _, _ in actual] == [rect for rect, _, _ in expected]
+    for (_, area, perimeter), (_, expected_area, expected_perimeter) in zip(actual, expected):
+        assert area == expected_area
+        # arcLength sums in single precision
+        assert perimeter == pytest.approx(expected_perimeter, rel=1e-6)
+
+def test_ring_with_dot_inside_is_one_blob(analyzer):
+    mask = np.zeros((200, 200), np.uint8)
+    cv2.circle(mask, (100, 100), 40, 255, 6)
+    cv2.circle(mask, (100, 100), 8, 255, -1)
+    assert_parity(analyzer, mask)
+    assert len(component_shapes(analyzer, mask)) == 1
+
+def test_nested_blobs_and_holes(analyzer):
+    mask = np.zeros((120, 160), np.uint8)
+    cv2.rectangle(mask, (10, 10), (110, 100), 255, -1)
+    cv2.rectangle(mask, (25, 25), (95, 85), 0, -1)
+    cv2.rectangle(mask, (40, 40), (80, 70), 255, -1)
+    cv2.rectangle(mask, (50, 50), (60, 60), 0, -1)
+    cv2.circle(mask, (135, 30), 12, 255, 3)
+    assert_parity(analyzer, mask)
+
+def test_spurs_and_one_pixel_necks(analyzer):
+    mask = np.zeros((40, 40), np.uint8)
+    cv2.rectangle(mask, (5, 5), (15, 15), 255, -1)
+    cv2.rectangle(mask, (22, 5), (32, 15), 255, -1)
+    mask[10, 16:22] = 255  # neck
+    mask[0:5, 10] = 255  # spur to the image edge
+    mask[20, 20] = 255  # single pixel
+    mask[21, 21] = 255  # diagonal neighbour
+    assert_parity(analyzer, mask)
+
+def test_random_masks(analyzer):
+    rng = np.random.default_rng(7)
+    for _ in range(200):
+        height, width = rng.integers(3, 40, 2)
+        mask = ((rng.random((height, width)) < rng.uniform(0.2, 0.8)) * 255).astype(np.uint8)
+        assert_parity(analyzer, mask)
+
+def test_tiled_analysis_matches_single_pass(analyzer, monkeypatch):
+    rng = np.random.default_rng(3)
+    noise = rng.integers(0, 255, (300, 280, 3), dtype=np.uint8)
+    roi = cv2.GaussianBlur(noise, (0, 0), 3)
+    cv2.circle(roi, (140, 150), 60, (40, 40, 200), 8)
+    cv2.circle(roi, (140, 150), 10, (20, 20, 20), -1)
+    monkeypatch.setattr(settings, "ANALYSIS_TILE_MIN_PIXELS", 10 ** 12)
+    expected = analyzer.detect_skin_issues(roi)
+    monkeypatch.setattr(settings, "ANALYSIS_TILE_MIN_PIXELS", 0)
+    monkeypatch.setattr(settings, "ANALYSIS_TILE_WORKERS", 2)
+    for tile_size in (64, 97, 128):
+        monkeypatch.setattr(settings, "ANALYSIS_TILE_SIZE", tile_size)
+        assert analyzer.detect_skin_issues(roi) == expected
@@ -0,0 +1,21 @@
+"""Every hot query in HOT_QUERIES has an index once ensure_indexes has run."""
+import asyncio
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app.database.mongodb import db, ensure_indexes
+from app.database.query_plans import HOT_QUERIES, assert_indexed_queries, collscan_queries
+
+def test_hot_queries_use_an_index(monkeypatch):
+    monkeypatch.setattr(db, "database", mongomock_motor.AsyncMongoMockClient()["query_plans_test"])
+
+    async def scenario():
+        # Without indexes every query scans, so the check is not vacuous
+        before = await collscan_queries(db.database)
+        await ensure_indexes()
+        await assert_indexed_queries(db.database)
+        return before
+
+    before = asyncio.run(scenario())
+    assert set(before) == {name for name, *_ in HOT_QUERIES}
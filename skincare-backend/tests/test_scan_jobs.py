@@ -0,0 +1,69 @@
+"""Scan jobs that run more than once save a single analysis."""
+import asyncio
+from datetime import datetime
+import pytest
+from bson import ObjectId
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app.database import analyses
+from app.database.write_behind import shutdown_write_buffer
+from app.database.mongodb import db
+from app.routers import skin_analysis_routes as routes
+
+class MemoryImageStore:
+    def __init__(self):
+        self.images = {}
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        key = f"{len(data):064x}"
+        self.images[key] = data
+        return key
+
+    async def read(self, key: str):
+        return self.images.get(key)
+
+def analysis_result():
+    return {
+        "success": True,
+        "face_location": {"x": 0, "y": 0, "width": 100, "height": 100},
+        "skin_score": 90.0,
+        "detected_issues": {"redness_count": 1, "dark_spots_count": 0},
+        "redness_areas": [{"x": 1, "y": 2, "width": 3, "height": 4, "area": 9.0, "severity": "mild"}],
+        "dark_spot_areas": [],
+        "recommendations": ["Apply sunscreen daily"],
+        "annotated_image": None,
+    }
+
+@pytest.mark.parametrize("durable", [True, False])
+def test_job_run_twice_saves_one_analysis(monkeypatch, durable):
+    store = MemoryImageStore()
+    rollups = []
+
+    async def fake_analyze(image_bytes, render):
+        return analysis_result()
+
+    async def record_rollups(batch):
+        rollups.extend(batch)
+
+    monkeypatch.setattr(routes, "get_image_store", lambda: store)
+    monkeypatch.setattr(routes.skin_service, "analyze_image", fake_analyze)
+    monkeypatch.setattr(analyses, "update_progress", record_rollups)
+    monkeypatch.setattr(db, "database", mongomock_motor.AsyncMongoMockClient()["scan_jobs_test"])
+
+    async def scenario():
+        key = await store.put(b"photo", "image/jpeg")
+        job = {
+            "_id": ObjectId(), "user_id": "user", "image_key": key, "render": {"mode": "none"},
+            "durable": durable, "attempts": 1, "created_at": datetime.utcnow(),
+        }
+        # First run's worker stopped before finishing the job; another worker runs it again
+        first = await routes.run_scan_job(job)
+        second = await routes.run_scan_job(job)
+        await shutdown_write_buffer()
+        return first, second, await db.database.skin_analyses.count_documents({})
+
+    first, second, saved = asyncio.run(scenario())
+    assert saved == 1
+    assert len(rollups) == 1
+    assert first["analysis_id"] == second["analysis_id"]
@@ -0,0 +1,37 @@
+"""Reads flush the write-behind buffer when it holds the reader's analyses."""
+import asyncio
+from datetime import datetime
+import pytest
+from bson import ObjectId
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app.database import analyses
+from app.database.mongodb import db
+from app.database.write_behind import AnalysisWriteBuffer
+
+def analysis_document(user_id: str):
+    return {
+        "_id": ObjectId(), "user_id": user_id, "skin_score": 90.0, "analysis_date": datetime.utcnow(),
+        "detected_issues": {"redness_count": 0, "dark_spots_count": 0},
+    }
+
+def test_flush_user_saves_only_when_the_user_has_queued_analyses(monkeypatch, tmp_path):
+    async def skip_rollups(batch):
+        pass
+
+    monkeypatch.setattr(analyses, "update_progress", skip_rollups)
+    monkeypatch.setattr(db, "database", mongomock_motor.AsyncMongoMockClient()["write_behind_test"])
+    # A long flush interval keeps the background flusher out of the way
+    buffer = AnalysisWriteBuffer(batch_size=100, flush_interval=60, max_pending=1000, journal_dir=str(tmp_path))
+
+    async def scenario():
+        await buffer.add(analysis_document("alice"))
+        await buffer.flush_user("bob")
+        saved_for_bob = await db.database.skin_analyses.count_documents({})
+        await buffer.flush_user("alice")
+        saved_for_alice = await db.database.skin_analyses.count_documents({"user_id": "alice"})
+        await buffer.close()
+        return saved_for_bob, saved_for_alice
+
+    assert asyncio.run(scenario()) == (0, 1)
@@ -87,11 +87,23 @@ const userApi = {
 
 const skinAnalysisApi = {
   analyzeImage: (imageData: string) => 
-    api.post('/skin-analysis/analyze', { image_data: imageData }),
+    api.post('/skin-analysis/analyze?render=full', { image_data: imageData }),
+  createScanJob: (imageData: string) => 
+    api.post('/skin-analysis/jobs?render=full', { image_data: imageData }),
+  getScanJob: (jobId: string) => 
+    api.get(`/skin-analysis/jobs/${jobId}`),
   getHistory: (limit = 10, skip = 0) => 
     api.get(`/skin-analysis/history?limit=${limit}&skip=${skip}`),
+  exportHistory: (format: 'ndjson' | 'csv' = 'ndjson') => 
+    api.get(`/skin-analysis/export?format=${format}`, { responseType: 'blob' }),
   getProgress: (days = 30) => 
-    api.get(`/skin-analysis/progress?days=${days}`),
+    api.get(`/skin-analysis/progress?days=${days}&granularity=day`),
+  // Live scan: send JPEG frames as binary messages, then {type: 'capture'} to save one
+  openLiveScan: () => {
+    const url = new URL('/skin-analysis/live', API_URL.replace(/^http/, 'ws'));
+    url.searchParams.set('token', localStorage.getItem('accessToken') || '');
+    return new WebSocket(url.toString());
+  },
 };
 
 // Utility function to check authentication status